@@ -17,6 +17,9 @@ const CONFIG_KEYS = [
   { key: 'DATA_DIR', label: 'Data Directory', secret: false, desc: 'Where downloads and DB are stored' },
   { key: 'CACHE_TTL_HOURS', label: 'Cache TTL (hours)', secret: false, desc: 'How long to cache API responses' },
   { key: 'MAX_PARALLEL_DOWNLOADS', label: 'Max Parallel Downloads', secret: false, desc: 'Concurrent download threads' },
+  { key: 'MAX_PARALLEL_CCRE_DOWNLOADS', label: 'Max Parallel cCRE Downloads', secret: false, desc: 'Concurrent cCRE BED download threads' },
+  { key: 'DUCKDB_THREADS', label: 'DuckDB Threads', secret: false, desc: 'Query threads (default: all CPUs)' },
+  { key: 'DUCKDB_MEMORY_LIMIT', label: 'DuckDB Memory Limit', secret: false, desc: 'e.g. 4GB' },
 ];
 
 export default function Config({ onBack }: ConfigProps) {
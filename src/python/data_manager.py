@@ -10,18 +10,33 @@ and exposes a JSON IPC interface for the Ink CLI frontend.
 """
 
 import os
+import re
+import math
 import sys
 import json
+import atexit
 import time
 import gzip
+import zlib
 import hashlib
+import functools
+import threading
 import requests
+import numpy as np
 import pandas as pd
 import duckdb
+import orjson
 from pathlib import Path
+from collections import namedtuple
+from contextlib import contextmanager
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+from . import db
+
 # Load environment
 load_dotenv()
 
@@ -29,6 +44,24 @@ FOURDN_ACCESS_ID = os.getenv("FOURDN_ACCESS_ID", "")
 FOURDN_SECRET_KEY = os.getenv("FOURDN_SECRET_KEY", "")
 FOURDN_API = "https://data.4dnucleome.org"
 ENCODE_API = "https://www.encodeproject.org"
+# ExperimentSet properties read by _parse_4dn_experiment_set; the 4DN search is
+# projected to these (via field=...) so pages carry only what we parse
+_4DN_SEARCH_FIELDS = [
+    'accession', 'biosource_summary', 'condition', 'study', 'dataset_label',
+    'experiments_in_set.biosample.biosource_summary',
+    'experiments_in_set.biosample.treatments_summary',
+    'experiments_in_set.biosample.modifications_summary',
+    'experiments_in_set.biosample.biosample_type',
+    'experiments_in_set.biosample.biosource.organism.name',
+    'experiments_in_set.biosample.biosource.organism.scientific_name',
+    'experiments_in_set.biosample.biosource.tissue.term_name',
+    'processed_files.accession', 'processed_files.file_format.display_title',
+    'processed_files.href', 'processed_files.file_size',
+]
+# File properties requested from ENCODE searches (via field=...)
+_ENCODE_FILE_FIELDS = [
+    'accession', 'href', 'file_size', 'file_format', 'assembly', 'output_type', 'status',
+]
 
 DATA_DIR = Path(os.getenv("DATA_DIR", "./data"))
 MCOOL_DIR = DATA_DIR / "downloads" / "mcool"
@@ -37,18 +70,215 @@ CACHE_DIR = DATA_DIR / "cache"
 REPORT_DIR = DATA_DIR / "reports"
 RAW_DIR = DATA_DIR / "raw"
 MAX_PARALLEL = int(os.getenv("MAX_PARALLEL_DOWNLOADS", "3"))
+# Small cCRE BED downloads are latency bound and get their own, wider pool
+MAX_PARALLEL_CCRE = int(os.getenv("MAX_PARALLEL_CCRE_DOWNLOADS", str(min(32, MAX_PARALLEL * 4))))
 CACHE_TTL = float(os.getenv("CACHE_TTL_HOURS", "24"))
+# Concurrent ENCODE cCRE searches in fetch_all_ccre; 429s are retried by
+# the session adapter, honouring Retry-After
+_CCRE_QUERY_WORKERS = 10
+# Files at least this large are fetched as MAX_PARALLEL concurrent byte ranges
+_SEGMENT_MIN_SIZE = 256 * 1024 * 1024
+# Cap on download connections open at once to one API host, shared by
+# parallel files and their byte-range segments
+_HOST_CONNECTIONS = 8
+# A download whose connection drops mid-body is resumed from its .part file
+# up to this many times in total, backing off exponentially in between
+_DOWNLOAD_ATTEMPTS = 4
+_DOWNLOAD_BACKOFF_MAX = 30
+# Raw body reads raise urllib3's errors, not requests' wrappers
+_DOWNLOAD_RETRY_ERRORS = (requests.ConnectionError, requests.Timeout,
+                          requests.exceptions.ChunkedEncodingError,
+                          ProtocolError, ReadTimeoutError)
+# Threads used to stat and validate downloaded files (I/O bound)
+_FILE_CHECK_WORKERS = 32
+# Completed downloads are marked in DuckDB in batches of this many, or at
+# least this often
+_MARK_BATCH_SIZE = 64
+_MARK_BATCH_SECONDS = 0.5
+# Cell line name -> download file name prefix, in one str.translate pass
+_SLUG_TABLE = str.maketrans({' ': '_', '/': '_', ',': None})
+
+# All cell lines with their experiments, for validate_datasets. The species
+# filter is a bound parameter so the statement text never changes.
+_VALIDATE_QUERY = """
+    SELECT cl.cell_line_normalized as cell_line, cl.species, cl.genome_assembly,
+           cl.has_ccre, cl.has_mcool,
+           ce.accession as mcool_accession, ce.download_status as mcool_dl_status,
+           ce.local_path as mcool_path, ce.genome_assembly as exp_assembly,
+           ce.treatment, ce.modification, ce.condition,
+           ra.accession as ccre_accession, ra.download_status as ccre_dl_status,
+           ra.local_path as ccre_path, ra.assembly as ccre_assembly
+    FROM cell_lines cl
+    LEFT JOIN chromatin_experiments ce ON cl.cell_line_id = ce.cell_line_id
+    LEFT JOIN regulatory_annotations ra ON cl.cell_line_id = ra.cell_line_id
+    WHERE cl.has_mcool = TRUE
+      AND ($species IS NULL OR cl.species = $species)
+    ORDER BY cl.cell_line_normalized
+"""
+
+# One file scheduled by download_paired_parallel; type is 'mcool' or 'ccre'
+DownloadTask = namedtuple('DownloadTask', 'type cell_line accession url path size')
+
+# Columns of the 4DN mcool inventory, in output order
+_INVENTORY_COLUMNS = [
+    'source', 'accession', 'cell_line', 'cell_line_normalized', 'file_size', 'file_format',
+    'href', 'experiment_set', 'download_url', 'species', 'genome_assembly', 'treatment',
+    'modification', 'condition', 'biosample_type', 'study', 'dataset_label', 'tissue_from_api',
+]
+
+# Low-cardinality inventory columns, stored dictionary-encoded in Parquet
+_CATEGORICAL_COLUMNS = [
+    'source', 'file_format', 'species', 'genome_assembly', 'biosample_type',
+    'cell_line_normalized', 'tissue_from_api', 'condition', 'study',
+]
+
+
+def _open_cache(path, mode):
+    """Open a cache file in binary mode, gzip-compressed when it ends in .gz."""
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=1)
+    return open(path, mode)
+
+
+def _json_load_file(path):
+    """Read a (possibly gzipped) JSON file."""
+    with _open_cache(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def _json_dump_file(obj, path):
+    """Write obj to path as indented JSON, gzipped when path ends in .gz."""
+    with _open_cache(path, 'wb') as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+
+
+def _pooled_adapter():
+    """HTTPAdapter with a large keep-alive pool and retries on transient errors.
+
+    The per-host pool must hold every connection that can be in flight at
+    once (download slots plus metadata worker threads); a smaller pool would
+    discard connections and pay a fresh TLS handshake for the next request.
+    """
+    retry = Retry(total=6, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=['GET', 'HEAD'], respect_retry_after_header=True,
+                  raise_on_status=False)
+    return HTTPAdapter(pool_connections=16, pool_maxsize=max(64, _HOST_CONNECTIONS + 2 * MAX_PARALLEL),
+                       max_retries=retry)
+
+
+def _mount_pooled(session):
+    """Mount one shared pooled adapter on a session for both schemes."""
+    adapter = _pooled_adapter()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# Minimum seconds between download progress callbacks
+_PROGRESS_INTERVAL = 0.25
+# Read size for streaming download bodies
+_DOWNLOAD_CHUNK = 4 * 1024 * 1024
+
+
+def _iter_body(r):
+    """Iterate a streamed response body in _DOWNLOAD_CHUNK reads straight from urllib3.
+
+    Bypasses requests' iter_content generator, which re-slices the stream
+    into new bytes objects. Downloads ask for Accept-Encoding: identity, so
+    decode_content is a no-op unless a server encodes anyway; it must be
+    explicit because requests opens the raw stream with decoding off.
+    """
+    return iter(functools.partial(r.raw.read, _DOWNLOAD_CHUNK, decode_content=True), b'')
+
+
+# Downloaded bytes are dropped from the page cache once they trail the write
+# position by this much; by then writeback has usually made them clean
+_CACHE_DROP_WINDOW = 64 * 1024 * 1024
+
+
+def _drop_written_pages(fd, start, end):
+    """Advise the kernel that file bytes [start, end) won't be read again soon."""
+    if hasattr(os, 'posix_fadvise') and end > start:
+        os.posix_fadvise(fd, start, end - start, os.POSIX_FADV_DONTNEED)
+
+
+def _gzip_first_line(path, block_size=64 * 1024):
+    """Return the first line of a gzip file (bytes, without the newline).
+
+    Inflates block by block only until a newline appears, instead of
+    stacking GzipFile and TextIOWrapper on top of the file. Concatenated
+    members (bgzip) are followed like gzip.open would.
+    """
+    d = zlib.decompressobj(wbits=31)
+    fed = False
+    head = b''
+    data = b''
+    with open(path, 'rb') as f:
+        while b'\n' not in head:
+            if not data:
+                data = f.read(block_size)
+                if not data:
+                    if fed and not d.eof:
+                        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+                    break
+                if not fed and not data.startswith(b'\x1f\x8b'):
+                    raise gzip.BadGzipFile(f"Not a gzipped file ({data[:2]!r})")
+            head += d.decompress(data)
+            fed = True
+            data = b''
+            if d.eof:
+                data = d.unused_data
+                d = zlib.decompressobj(wbits=31)
+                fed = False
+    return head.split(b'\n', 1)[0]
+
+
+def _progress_reporter(callback, accession, total, done=0):
+    """Return add(n), which counts downloaded bytes and reports progress.
+
+    callback runs at most once per _PROGRESS_INTERVAL seconds;
+    add(0, final=True) forces a last report. Safe to share between threads.
+    """
+    lock = threading.Lock()
+    start = time.monotonic()
+    state = {'written': done, 'next': start + _PROGRESS_INTERVAL}
+
+    def add(n, final=False):
+        with lock:
+            state['written'] += n
+            written = state['written']
+            now = time.monotonic()
+            if now < state['next'] and not final:
+                return
+            state['next'] = now + _PROGRESS_INTERVAL
+        elapsed = now - start
+        speed = (written - done) / elapsed / (1024 * 1024) if elapsed > 0 else 0
+        pct = (written / total * 100) if total > 0 else 0
+        callback({
+            'accession': accession,
+            'bytes_written': written,
+            'bytes_total': total,
+            'percent': round(pct, 1),
+            'speed_mbps': round(speed, 1),
+        })
+
+    return add
+
+
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+
+
+def _sql_quote(text):
+    """Escape text for use inside a single-quoted SQL string literal."""
+    return str(text).replace("'", "''")
 
 
 def _sizeof_fmt(num_bytes):
     """Human-readable file size."""
     if num_bytes is None or num_bytes == 0:
         return "0 B"
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if abs(num_bytes) < 1024.0:
-            return f"{num_bytes:.1f} {unit}"
-        num_bytes /= 1024.0
-    return f"{num_bytes:.1f} PB"
+    idx = min(max(int(math.log2(abs(num_bytes)) // 10), 0), len(_SIZE_UNITS) - 1)
+    return f"{num_bytes / (1 << (10 * idx)):.1f} {_SIZE_UNITS[idx]}"
 
 
 # ---------------------------------------------------------------------------
@@ -80,6 +310,10 @@ _KNOWN_CELL_LINES = {
     "cc-2551": "IMR-90",
 }
 
+# Longest keys first so e.g. "es-e14tg2a" wins over "es-e14" in prefix matching
+_KNOWN_CELL_LINES_LONGEST_FIRST = tuple(sorted(_KNOWN_CELL_LINES.items(), key=lambda x: -len(x[0])))
+_KNOWN_CELL_LINE_KEYS = tuple(_KNOWN_CELL_LINES)
+
 _TISSUE_MAP = {
     "GM12878": "B-lymphocyte",
     "K562": "Leukemia (CML)",
@@ -131,6 +365,10 @@ _HUMAN_INDICATORS = [
     'cardiac muscle cell', 'heart left',
 ]
 
+# One alternation per species, so detection is a single regex scan each
+_HUMAN_RE = re.compile('|'.join(re.escape(ind) for ind in _HUMAN_INDICATORS))
+_MOUSE_RE = re.compile('|'.join(re.escape(ind) for ind in _MOUSE_INDICATORS))
+
 # Genome assembly mapping
 _ASSEMBLY_MAP = {
     'Homo sapiens': 'GRCh38',
@@ -140,6 +378,7 @@ _ASSEMBLY_MAP = {
 }
 
 
+@functools.lru_cache(maxsize=4096)
 def detect_species(cell_line_raw, organism_name=None):
     """Detect species from cell line name and/or 4DN organism metadata."""
     if organism_name:
@@ -149,9 +388,9 @@ def detect_species(cell_line_raw, organism_name=None):
                 return species
 
     cl_lower = (cell_line_raw or '').lower()
-    if any(ind in cl_lower for ind in _HUMAN_INDICATORS):
+    if _HUMAN_RE.search(cl_lower):
         return 'Homo sapiens'
-    if any(ind in cl_lower for ind in _MOUSE_INDICATORS):
+    if _MOUSE_RE.search(cl_lower):
         return 'Mus musculus'
     if 'zebrafish' in cl_lower:
         return 'Danio rerio'
@@ -166,6 +405,7 @@ def get_genome_assembly(species):
     return _ASSEMBLY_MAP.get(species, 'GRCh38')
 
 
+@functools.lru_cache(maxsize=4096)
 def normalize_cell_line(raw_name):
     """Normalize a verbose 4DN cell line name to a base name ENCODE recognizes."""
     if not raw_name or raw_name == 'Unknown':
@@ -179,11 +419,12 @@ def normalize_cell_line(raw_name):
 
     # Try prefix match: check if the name starts with a known cell line
     name_lower = name.lower()
-    for key, canonical in sorted(_KNOWN_CELL_LINES.items(), key=lambda x: -len(x[0])):
-        if name_lower.startswith(key):
-            rest = name_lower[len(key):]
-            if not rest or rest[0] in (' ', '(', ',', '-', '_', '.', '/'):
-                return canonical
+    if name_lower.startswith(_KNOWN_CELL_LINE_KEYS):
+        for key, canonical in _KNOWN_CELL_LINES_LONGEST_FIRST:
+            if name_lower.startswith(key):
+                rest = name_lower[len(key):]
+                if not rest or rest[0] in (' ', '(', ',', '-', '_', '.', '/'):
+                    return canonical
 
     # Try splitting on common delimiters
     for sep in [' with ', ' differentiated to ', ' - clone ', ' (']:
@@ -201,6 +442,15 @@ def get_tissue(cell_line_normalized):
     return _TISSUE_MAP.get(cell_line_normalized, "Unknown")
 
 
+def normalize_cell_lines(raw_names):
+    """Vectorized normalize_cell_line over a pandas Series of raw names.
+
+    Each distinct name is normalized once and mapped back onto the column.
+    """
+    lookup = {name: normalize_cell_line(name) for name in raw_names.dropna().unique()}
+    return raw_names.map(lookup)
+
+
 # ---------------------------------------------------------------------------
 # Data Manager Class
 # ---------------------------------------------------------------------------
@@ -209,28 +459,67 @@ class DataManager:
         self.verbose = verbose
         self.use_cache = use_cache
         self.session_4dn = self._setup_4dn_session()
-        self.session_encode = requests.Session()
+        self.session_encode = _mount_pooled(requests.Session())
         self.session_encode.headers.update({'Accept': 'application/json'})
         self._ccre_cache = {}
+        # Guards _ccre_cache, the cCRE disk cache and DuckDB writes when
+        # cell lines are fetched from worker threads.
+        self._ccre_lock = threading.Lock()
+        # Normalized mcool inventory, set by fetch_4dn_mcool_files
+        self._mcool_df = None
+        # Download connection slots per host (see _download_session)
+        self._slots_4dn = threading.BoundedSemaphore(_HOST_CONNECTIONS)
+        self._slots_encode = threading.BoundedSemaphore(_HOST_CONNECTIONS)
 
         # DuckDB connection
         if db_con:
             self.con = db_con
         else:
-            from . import db
             self.con = db.get_connection()
+        # Cursor with its own transaction context for read-only queries, so
+        # they never wait on (or see) a transaction open on self.con
+        self.ro_con = self.con.cursor()
 
         # Create directories
         for d in [MCOOL_DIR, CCRE_DIR, CACHE_DIR, REPORT_DIR, RAW_DIR]:
             d.mkdir(parents=True, exist_ok=True)
 
+        # cCRE disk cache: loaded once, written back once when dirty
+        self._ccre_cache_file = CACHE_DIR / "ccre_by_cell.json.gz"
+        self._ccre_disk_cache = self._load_ccre_disk_cache()
+        self._ccre_dirty = False
+        # Fetched cCRE results not yet written to DuckDB
+        self._ccre_pending = []
+        atexit.register(self._flush_ccre_cache)
+
     def _setup_4dn_session(self):
         """Setup 4DN session with authentication."""
-        session = requests.Session()
+        session = _mount_pooled(requests.Session())
         if FOURDN_ACCESS_ID and FOURDN_SECRET_KEY:
             session.auth = (FOURDN_ACCESS_ID, FOURDN_SECRET_KEY)
         return session
 
+    def _load_ccre_disk_cache(self):
+        """Read the persisted cCRE cache, or start empty if missing/corrupt."""
+        cache_file = self._ccre_cache_file
+        legacy_cache_file = CACHE_DIR / "ccre_by_cell.json"
+        if not cache_file.exists() and legacy_cache_file.exists():
+            cache_file = legacy_cache_file
+        if not cache_file.exists():
+            return {}
+        try:
+            return _json_load_file(cache_file)
+        except (ValueError, OSError, EOFError):
+            return {}
+
+    def _flush_ccre_cache(self):
+        """Write the cCRE disk cache back if new entries were added."""
+        with self._ccre_lock:
+            if not self._ccre_dirty:
+                return
+            _json_dump_file(self._ccre_disk_cache, self._ccre_cache_file)
+            self._ccre_dirty = False
+
     def _log(self, msg):
         if self.verbose:
             print(f"[INFO] {msg}", file=sys.stderr)
@@ -240,266 +529,379 @@ class DataManager:
     # ------------------------------------------------------------------
     def fetch_4dn_mcool_files(self, cell_line_filter=None, force_refresh=False):
         """Fetch all .mcool files from 4DN and store in DuckDB."""
-        cache_file = CACHE_DIR / "4dn_mcool_inventory.json"
+        cache_file = CACHE_DIR / "4dn_mcool_inventory.parquet"
+        etag_file = CACHE_DIR / "4dn_mcool_inventory.etags.json"
+        legacy_cache_file = CACHE_DIR / "4dn_mcool_inventory.json"
+        if not cache_file.exists() and legacy_cache_file.exists():
+            cache_file = legacy_cache_file
 
         # Check cache
         if self.use_cache and not force_refresh and cache_file.exists():
             age_hours = (time.time() - cache_file.stat().st_mtime) / 3600
             if age_hours < CACHE_TTL:
                 self._log(f"Using cached 4DN data (age: {age_hours:.1f}h)")
-                with open(cache_file) as f:
-                    all_files = json.load(f)
-                self._store_mcool_in_db(all_files)
-                if cell_line_filter:
-                    return [f for f in all_files if cell_line_filter.lower() in f.get('cell_line', '').lower()]
-                return all_files
+                df = self._read_mcool_cache(cache_file).drop(columns='page', errors='ignore')
+                self._store_mcool_in_db(df)
+                self._mcool_df = self._build_mcool_df(df)
+                return self._inventory_records(df, cell_line_filter)
 
         self._log("Fetching 4DN ExperimentSets (Hi-C)...")
 
-        all_files = []
-        from_pos = 0
         batch_size = 100
+        # Stale cache: revalidate each page with its ETag, reusing cached rows on 304
+        cached, validators = None, {}
+        if self.use_cache and not force_refresh:
+            cached, validators = self._read_4dn_validators(cache_file, etag_file, batch_size)
+        old_etags = validators.get('etags', {})
+
+        def load_page(pos):
+            data, etag = self._fetch_4dn_page(pos, batch_size, old_etags.get(str(pos)))
+            if data is None:
+                return cached[cached['page'] == pos], etag, None
+            cols = {c: [] for c in _INVENTORY_COLUMNS}
+            for exp in data.get('@graph', []):
+                self._parse_4dn_experiment_set(exp, cols)
+            return pd.DataFrame(cols).assign(page=pos), etag, data.get('total', 0)
+
+        pages = {}
+        etags = {}
+        total = 0
+        try:
+            pages[0], etags[0], total = load_page(0)
+            if total is None:
+                self._log("  4DN batch 0 not modified")
+                total = validators.get('total', 0)
+            else:
+                self._log(f"  4DN batch 0-{batch_size} / {total}")
+        except Exception as e:
+            self._log(f"4DN fetch failed at offset 0: {e}")
 
-        while True:
-            params = {
-                "type": "ExperimentSetReplicate",
-                "experiments_in_set.experiment_type.display_title": "in situ Hi-C",
-                "status": "released",
-                "format": "json",
-                "limit": batch_size,
-                "from": from_pos
-            }
+        # Remaining pages are independent, so fetch them concurrently
+        # over the shared keep-alive session.
+        offsets = range(batch_size, total, batch_size)
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as executor:
+            futures = {executor.submit(load_page, pos): pos for pos in offsets}
+            for future in as_completed(futures):
+                pos = futures[future]
+                try:
+                    pages[pos], etags[pos], page_total = future.result()
+                except Exception as e:
+                    self._log(f"4DN fetch failed at offset {pos}: {e}")
+                    continue
+                status = 'not modified' if page_total is None else f"/ {total}"
+                self._log(f"  4DN batch {pos}-{pos+batch_size} {status}")
 
-            try:
-                r = self.session_4dn.get(f"{FOURDN_API}/search/", params=params, timeout=60)
-                r.raise_for_status()
-                data = r.json()
+        if pages:
+            df = pd.concat([pages[pos] for pos in sorted(pages)], ignore_index=True)
+        else:
+            df = pd.DataFrame({c: [] for c in _INVENTORY_COLUMNS + ['page']})
+        df['file_size'] = df['file_size'].fillna(0).astype('int64')
+
+        # Cache to disk as Parquet (with page offsets and ETags for
+        # revalidation), and keep a raw copy for downstream use
+        encoded = df.astype({c: 'category' for c in _CATEGORICAL_COLUMNS})
+        encoded.to_parquet(str(CACHE_DIR / "4dn_mcool_inventory.parquet"), index=False,
+                           compression='zstd', use_dictionary=True)
+        _json_dump_file({
+            'total': total,
+            'batch_size': batch_size,
+            'etags': {str(pos): etag for pos, etag in etags.items() if etag},
+        }, etag_file)
+        df = df.drop(columns='page')
+        if not df.empty:
+            parquet_path = RAW_DIR / "4dn_experiments.parquet"
+            encoded.drop(columns='page').to_parquet(str(parquet_path), index=False,
+                                                    compression='zstd', use_dictionary=True)
 
-                exps = data.get('@graph', [])
-                if not exps:
-                    break
+        # Store in DuckDB
+        self._store_mcool_in_db(df)
+        self._mcool_df = self._build_mcool_df(df)
 
-                total = data.get('total', 0)
-                self._log(f"  4DN batch {from_pos}-{from_pos+len(exps)} / {total}")
-
-                for exp in exps:
-                    cell_line = exp.get('biosource_summary') or ''
-                    if not cell_line:
-                        eis = exp.get('experiments_in_set', [])
-                        if eis and isinstance(eis[0], dict):
-                            bs = eis[0].get('biosample', {})
-                            if isinstance(bs, dict):
-                                cell_line = bs.get('biosource_summary', '')
-                            elif isinstance(bs, list) and bs and isinstance(bs[0], dict):
-                                cell_line = bs[0].get('biosource_summary', '')
-                    if not cell_line:
-                        cell_line = 'Unknown'
-
-                    for pf in exp.get('processed_files', []):
-                        if not isinstance(pf, dict):
-                            continue
+        self._log(f"Found {len(df)} .mcool files from 4DN")
 
-                        fformat = pf.get('file_format', {})
-                        if isinstance(fformat, dict):
-                            fformat = fformat.get('display_title', '')
+        return self._inventory_records(df, cell_line_filter)
 
-                        is_mcool = (
-                            'mcool' in str(fformat).lower() or
-                            str(pf.get('href', '')).endswith('.mcool')
-                        )
+    def _read_4dn_validators(self, cache_file, etag_file, batch_size):
+        """Load the cached inventory and per-page ETags for conditional refetching.
 
-                        if is_mcool:
-                            # Extract rich metadata from experiment set
-                            organism_name = ''
-                            treatment_summary = ''
-                            modification_summary = ''
-                            biosample_type = ''
-                            tissue_from_api = ''
-
-                            eis = exp.get('experiments_in_set', [])
-                            if eis and isinstance(eis[0], dict):
-                                bs = eis[0].get('biosample', {})
-                                if isinstance(bs, dict):
-                                    treatment_summary = bs.get('treatments_summary', '') or ''
-                                    if treatment_summary.lower() in ('none', 'no treatment', ''):
-                                        treatment_summary = ''
-                                    modification_summary = bs.get('modifications_summary', '') or ''
-                                    if modification_summary.lower() in ('none', ''):
-                                        modification_summary = ''
-                                    biosample_type = bs.get('biosample_type', '') or ''
-                                    # Get organism from biosource
-                                    bsrc = bs.get('biosource', [])
-                                    if isinstance(bsrc, list) and bsrc:
-                                        src = bsrc[0] if isinstance(bsrc[0], dict) else {}
-                                        org = src.get('organism', {})
-                                        if isinstance(org, dict):
-                                            organism_name = org.get('name', '') or org.get('scientific_name', '')
-                                        tissue_obj = src.get('tissue', {})
-                                        if isinstance(tissue_obj, dict):
-                                            tissue_from_api = tissue_obj.get('term_name', '')
-                                    elif isinstance(bsrc, dict):
-                                        org = bsrc.get('organism', {})
-                                        if isinstance(org, dict):
-                                            organism_name = org.get('name', '') or org.get('scientific_name', '')
-
-                            species = detect_species(cell_line, organism_name)
-                            assembly = get_genome_assembly(species)
-                            condition = exp.get('condition', '') or ''
-                            study = exp.get('study', '') or ''
-                            dataset_label = exp.get('dataset_label', '') or ''
-
-                            all_files.append({
-                                'source': '4DN',
-                                'accession': pf.get('accession', ''),
-                                'cell_line': cell_line,
-                                'cell_line_normalized': normalize_cell_line(cell_line),
-                                'file_size': pf.get('file_size', 0),
-                                'file_format': 'mcool',
-                                'href': pf.get('href', ''),
-                                'experiment_set': exp.get('accession', ''),
-                                'download_url': f"{FOURDN_API}{pf.get('href', '')}",
-                                'species': species,
-                                'genome_assembly': assembly,
-                                'treatment': treatment_summary,
-                                'modification': modification_summary,
-                                'condition': condition,
-                                'biosample_type': biosample_type,
-                                'study': study,
-                                'dataset_label': dataset_label,
-                                'tissue_from_api': tissue_from_api,
-                            })
-
-                from_pos += len(exps)
-                if from_pos >= total:
-                    break
+        Returns (cached_df, validators), or (None, {}) when the cache cannot be
+        revalidated (missing, legacy JSON, or fetched with a different page size).
+        """
+        if cache_file.suffix != '.parquet' or not cache_file.exists() or not etag_file.exists():
+            return None, {}
+        try:
+            validators = _json_load_file(etag_file)
+            cached = self._read_mcool_cache(cache_file)
+        except Exception:
+            return None, {}
+        if 'page' not in cached or validators.get('batch_size') != batch_size:
+            return None, {}
+        return cached, validators
+
+    def _inventory_records(self, df, cell_line_filter=None):
+        """Convert the inventory to records, optionally filtered by cell line substring."""
+        if cell_line_filter and not df.empty:
+            cell_lower = df['cell_line'].fillna('').str.lower()
+            df = df[cell_lower.str.contains(cell_line_filter.lower(), regex=False)]
+        return df.to_dict(orient='records')
+
+    def _build_mcool_df(self, files):
+        """Build the normalized DataFrame view of the inventory used by the find_* methods."""
+        df = pd.DataFrame(files).copy(deep=False)
+        if df.empty:
+            return df
+        df['cell_line'] = df['cell_line'].fillna('')
+        df['cell_line_raw'] = df['cell_line']
+        norm = df['cell_line_normalized'].fillna('') if 'cell_line_normalized' in df else pd.Series('', index=df.index)
+        missing = norm == ''
+        norm = norm.mask(missing, normalize_cell_lines(df['cell_line'][missing]))
+        df['tissue'] = norm.map(_TISSUE_MAP).fillna('Unknown')
+        # Intern cell lines: the find_* methods join, group and count on the int codes
+        df['cell_line_normalized'] = pd.Categorical(norm)
+        df['cell_line_code'] = df['cell_line_normalized'].cat.codes
+        df['file_size'] = df['file_size'].fillna(0).astype('int64')
+        for col in ['accession', 'href', 'download_url', 'experiment_set']:
+            df[col] = df[col].fillna('') if col in df else ''
+        df['source'] = df['source'].fillna('4DN') if 'source' in df else '4DN'
+        return df
+
+    def _get_mcool_df(self, cell_line_filter=None):
+        """Return the known (non-'Unknown') mcool inventory, optionally filtered by cell line."""
+        if self._mcool_df is None:
+            self.fetch_4dn_mcool_files()
+        df = self._mcool_df
+        if df.empty:
+            return df
+        cell_lower = df['cell_line'].str.lower()
+        mask = cell_lower.str.strip() != 'unknown'
+        if cell_line_filter:
+            mask &= cell_lower.str.contains(cell_line_filter.lower(), regex=False)
+        return df[mask]
 
-                time.sleep(0.5)
+    def known_cell_lines(self):
+        """Sorted distinct normalized cell lines in the known mcool inventory."""
+        mcool = self._get_mcool_df()
+        if mcool.empty:
+            return []
+        cells = mcool['cell_line_normalized'].cat.categories
+        return [c for c in cells[np.unique(mcool['cell_line_code'])] if c]
 
-            except Exception as e:
-                self._log(f"4DN fetch failed at offset {from_pos}: {e}")
-                break
+    def _read_mcool_cache(self, cache_file):
+        """Load the cached 4DN inventory (Parquet, or the legacy JSON cache) as a DataFrame."""
+        if cache_file.suffix == '.json':
+            return pd.DataFrame(_json_load_file(cache_file))
+        df = pd.read_parquet(str(cache_file))
+        return df.astype({c: object for c in df.select_dtypes('category').columns})
 
-        # Cache to disk
-        with open(cache_file, 'w') as f:
-            json.dump(all_files, f, indent=2)
+    def _fetch_4dn_page(self, from_pos, batch_size, etag=None):
+        """Fetch one page of in situ Hi-C ExperimentSets from the 4DN search API.
 
-        # Also save as Parquet
-        if all_files:
-            df = pd.DataFrame(all_files)
-            parquet_path = RAW_DIR / "4dn_experiments.parquet"
-            df.to_parquet(str(parquet_path), index=False)
+        Returns (data, etag). When etag is given and the page is unchanged the
+        server answers 304 and data is None.
+        """
+        params = [
+            ("type", "ExperimentSetReplicate"),
+            ("experiments_in_set.experiment_type.display_title", "in situ Hi-C"),
+            ("status", "released"),
+            ("format", "json"),
+            ("limit", batch_size),
+            ("from", from_pos),
+        ] + [("field", f) for f in _4DN_SEARCH_FIELDS]
+        headers = {'If-None-Match': etag} if etag else {}
+        r = self.session_4dn.get(f"{FOURDN_API}/search/", params=params, headers=headers, timeout=60)
+        if r.status_code == 304:
+            return None, etag
+        r.raise_for_status()
+        return orjson.loads(r.content), r.headers.get('ETag')
+
+    def _parse_4dn_experiment_set(self, exp, cols):
+        """Append the .mcool files of a single 4DN ExperimentSet to the column lists in cols."""
+        cell_line = exp.get('biosource_summary') or ''
+        if not cell_line:
+            eis = exp.get('experiments_in_set', [])
+            if eis and isinstance(eis[0], dict):
+                bs = eis[0].get('biosample', {})
+                if isinstance(bs, dict):
+                    cell_line = bs.get('biosource_summary', '')
+                elif isinstance(bs, list) and bs and isinstance(bs[0], dict):
+                    cell_line = bs[0].get('biosource_summary', '')
+        if not cell_line:
+            cell_line = 'Unknown'
+
+        for pf in exp.get('processed_files', []):
+            if not isinstance(pf, dict):
+                continue
 
-        # Store in DuckDB
-        self._store_mcool_in_db(all_files)
+            fformat = pf.get('file_format', {})
+            if isinstance(fformat, dict):
+                fformat = fformat.get('display_title', '')
 
-        self._log(f"Found {len(all_files)} .mcool files from 4DN")
+            is_mcool = (
+                'mcool' in str(fformat).lower() or
+                str(pf.get('href', '')).endswith('.mcool')
+            )
 
-        if cell_line_filter:
-            return [f for f in all_files if cell_line_filter.lower() in f.get('cell_line', '').lower()]
-        return all_files
+            if is_mcool:
+                # Extract rich metadata from experiment set
+                organism_name = ''
+                treatment_summary = ''
+                modification_summary = ''
+                biosample_type = ''
+                tissue_from_api = ''
+
+                eis = exp.get('experiments_in_set', [])
+                if eis and isinstance(eis[0], dict):
+                    bs = eis[0].get('biosample', {})
+                    if isinstance(bs, dict):
+                        treatment_summary = bs.get('treatments_summary', '') or ''
+                        if treatment_summary.lower() in ('none', 'no treatment', ''):
+                            treatment_summary = ''
+                        modification_summary = bs.get('modifications_summary', '') or ''
+                        if modification_summary.lower() in ('none', ''):
+                            modification_summary = ''
+                        biosample_type = bs.get('biosample_type', '') or ''
+                        # Get organism from biosource
+                        bsrc = bs.get('biosource', [])
+                        if isinstance(bsrc, list) and bsrc:
+                            src = bsrc[0] if isinstance(bsrc[0], dict) else {}
+                            org = src.get('organism', {})
+                            if isinstance(org, dict):
+                                organism_name = org.get('name', '') or org.get('scientific_name', '')
+                            tissue_obj = src.get('tissue', {})
+                            if isinstance(tissue_obj, dict):
+                                tissue_from_api = tissue_obj.get('term_name', '')
+                        elif isinstance(bsrc, dict):
+                            org = bsrc.get('organism', {})
+                            if isinstance(org, dict):
+                                organism_name = org.get('name', '') or org.get('scientific_name', '')
+
+                species = detect_species(cell_line, organism_name)
+                assembly = get_genome_assembly(species)
+                condition = exp.get('condition', '') or ''
+                study = exp.get('study', '') or ''
+                dataset_label = exp.get('dataset_label', '') or ''
+
+                cols['source'].append('4DN')
+                cols['accession'].append(pf.get('accession', ''))
+                cols['cell_line'].append(cell_line)
+                cols['cell_line_normalized'].append(normalize_cell_line(cell_line))
+                cols['file_size'].append(pf.get('file_size', 0))
+                cols['file_format'].append('mcool')
+                cols['href'].append(pf.get('href', ''))
+                cols['experiment_set'].append(exp.get('accession', ''))
+                cols['download_url'].append(f"{FOURDN_API}{pf.get('href', '')}")
+                cols['species'].append(species)
+                cols['genome_assembly'].append(assembly)
+                cols['treatment'].append(treatment_summary)
+                cols['modification'].append(modification_summary)
+                cols['condition'].append(condition)
+                cols['biosample_type'].append(biosample_type)
+                cols['study'].append(study)
+                cols['dataset_label'].append(dataset_label)
+                cols['tissue_from_api'].append(tissue_from_api)
 
     def _store_mcool_in_db(self, files):
-        """Store fetched mcool files into DuckDB."""
-        from . import db
-        for f in files:
-            if not f.get('accession'):
-                continue
-            norm = f.get('cell_line_normalized') or normalize_cell_line(f.get('cell_line', 'Unknown'))
-            tissue = f.get('tissue_from_api') or get_tissue(norm)
-            species = f.get('species', 'Homo sapiens')
-            assembly = f.get('genome_assembly', get_genome_assembly(species))
-            biosample_type = f.get('biosample_type', '')
-
-            cl_id = db.upsert_cell_line(
-                self.con, f.get('cell_line', 'Unknown'), norm, tissue,
-                organism=species.split()[-1].lower() if species else 'human',
-                species=species, genome_assembly=assembly,
-                biosample_type=biosample_type,
-            )
-            db.upsert_chromatin_experiment(self.con, {
-                'accession': f['accession'],
-                'cell_line_id': cl_id,
+        """Store fetched mcool files (DataFrame or records) into DuckDB with one bulk upsert per table."""
+        df = pd.DataFrame(files)
+        exp_rows = None
+        if 'accession' not in df:
+            df = df.iloc[0:0]
+        else:
+            df = df[df['accession'].fillna('') != ''].reset_index(drop=True)
+        if not df.empty:
+            def col(name, default=''):
+                return df[name].fillna(default) if name in df else pd.Series(default, index=df.index)
+
+            raw = col('cell_line', 'Unknown')
+            norm = col('cell_line_normalized')
+            missing = norm == ''
+            norm = norm.mask(missing, normalize_cell_lines(raw[missing]))
+            tissue = col('tissue_from_api')
+            tissue = tissue.mask(tissue == '', norm.map(_TISSUE_MAP).fillna('Unknown'))
+            species = col('species', 'Homo sapiens')
+            assembly = col('genome_assembly', None).fillna(species.map(_ASSEMBLY_MAP).fillna('GRCh38'))
+            organism = species.str.split().str[-1].str.lower().where(species != '', 'human')
+            biosample_type = col('biosample_type')
+
+            cl_rows = pd.DataFrame({
+                'name': raw,
+                'normalized': norm,
+                'tissue': tissue,
+                'organism': organism,
+                'species': species,
+                'genome_assembly': assembly,
+                'biosample_type': biosample_type,
+            })
+            exp_rows = pd.DataFrame({
+                'accession': df['accession'],
                 'cell_line_name': norm,
-                'cell_line_raw': f.get('cell_line', ''),
-                'source': f.get('source', '4DN'),
-                'file_format': f.get('file_format', 'mcool'),
-                'file_size_bytes': f.get('file_size', 0),
-                'experiment_set': f.get('experiment_set', ''),
-                'href': f.get('href', ''),
-                'download_url': f.get('download_url', ''),
+                'cell_line_raw': col('cell_line'),
+                'source': col('source', '4DN'),
+                'file_format': col('file_format', 'mcool'),
+                'file_size_bytes': col('file_size', 0).astype('int64'),
+                'experiment_set': col('experiment_set'),
+                'href': col('href'),
+                'download_url': col('download_url'),
                 'species': species,
                 'genome_assembly': assembly,
-                'treatment': f.get('treatment', ''),
-                'treatment_duration': f.get('treatment_duration', ''),
-                'modification': f.get('modification', ''),
-                'condition': f.get('condition', ''),
+                'treatment': col('treatment'),
+                'treatment_duration': col('treatment_duration'),
+                'modification': col('modification'),
+                'condition': col('condition'),
                 'biosample_type': biosample_type,
-                'study': f.get('study', ''),
-                'dataset_label': f.get('dataset_label', ''),
+                'study': col('study'),
+                'dataset_label': col('dataset_label'),
             })
-        db.update_cell_line_flags(self.con)
+
+        with db.transaction(self.con):
+            if exp_rows is not None:
+                db.bulk_upsert_cell_lines(self.con, cl_rows)
+                db.bulk_upsert_chromatin_experiments(self.con, exp_rows)
+            db.update_cell_line_flags(self.con)
 
     # ------------------------------------------------------------------
     # ENCODE cCRE BED fetching
     # ------------------------------------------------------------------
-    def fetch_ccre_for_cell_line(self, cell_line):
-        """Fetch the actual cCRE BED file info from ENCODE for a specific cell line."""
+    def fetch_ccre_for_cell_line(self, cell_line, store=True):
+        """Fetch the actual cCRE BED file info from ENCODE for a specific cell line.
+
+        A newly fetched result is written to DuckDB before returning; with
+        store=False it is only queued for the next _store_pending_ccre().
+        """
         cell_norm = cell_line.lower().strip()
 
-        if cell_norm in self._ccre_cache:
-            return self._ccre_cache[cell_norm]
+        with self._ccre_lock:
+            if cell_norm in self._ccre_cache:
+                return self._ccre_cache[cell_norm]
 
-        # Check disk cache
-        cache_file = CACHE_DIR / "ccre_by_cell.json"
-        if self.use_cache and cache_file.exists():
-            with open(cache_file) as f:
-                disk_cache = json.load(f)
-            if cell_norm in disk_cache:
-                self._ccre_cache[cell_norm] = disk_cache[cell_norm]
-                return disk_cache[cell_norm]
+            # Check disk cache
+            if self.use_cache and cell_norm in self._ccre_disk_cache:
+                self._ccre_cache[cell_norm] = self._ccre_disk_cache[cell_norm]
+                return self._ccre_disk_cache[cell_norm]
 
         self._log(f"  Querying ENCODE cCRE for: {cell_line}")
         result = None
 
-        # Strategy 1: Search annotations
+        # Strategy 1: Search annotations, with their file documents embedded
+        # so no per-annotation / per-file follow-up requests are needed
         try:
-            params = {
-                "type": "Annotation",
-                "annotation_type": "candidate Cis-Regulatory Elements",
-                "biosample_ontology.term_name": cell_line,
-                "assembly": "GRCh38",
-                "status": "released",
-                "format": "json",
-                "limit": "5",
-            }
+            params = [
+                ("type", "Annotation"),
+                ("annotation_type", "candidate Cis-Regulatory Elements"),
+                ("biosample_ontology.term_name", cell_line),
+                ("assembly", "GRCh38"),
+                ("status", "released"),
+                ("format", "json"),
+                ("frame", "embedded"),
+                ("limit", "5"),
+            ] + [("field", f"files.{f}") for f in _ENCODE_FILE_FIELDS]
             r = self.session_encode.get(f"{ENCODE_API}/search/", params=params, timeout=60)
             if r.status_code == 200:
-                data = r.json()
+                data = orjson.loads(r.content)
                 for ann in data.get('@graph', []):
-                    ann_id = ann.get('@id', '')
-                    detail_r = self.session_encode.get(
-                        f"{ENCODE_API}{ann_id}",
-                        params={"format": "json"},
-                        timeout=60
-                    )
-                    if detail_r.status_code != 200:
-                        continue
-
-                    detail = detail_r.json()
-                    for file_ref in detail.get('files', []):
-                        file_id = file_ref if isinstance(file_ref, str) else file_ref.get('@id', '')
-                        if not file_id:
+                    for fdata in ann.get('files', []):
+                        if not isinstance(fdata, dict):
                             continue
-
-                        file_r = self.session_encode.get(
-                            f"{ENCODE_API}{file_id}",
-                            params={"format": "json"},
-                            timeout=60
-                        )
-                        if file_r.status_code != 200:
-                            continue
-
-                        fdata = file_r.json()
                         fformat = fdata.get('file_format', '')
                         output_type = fdata.get('output_type', '')
                         status = fdata.get('status', '')
@@ -524,19 +926,19 @@ class DataManager:
         # Strategy 2: Direct file search
         if result is None:
             try:
-                params2 = {
-                    "type": "File",
-                    "file_format": "bed",
-                    "output_type": "candidate Cis-Regulatory Elements",
-                    "biosample_ontology.term_name": cell_line,
-                    "assembly": "GRCh38",
-                    "status": "released",
-                    "format": "json",
-                    "limit": "3",
-                }
+                params2 = [
+                    ("type", "File"),
+                    ("file_format", "bed"),
+                    ("output_type", "candidate Cis-Regulatory Elements"),
+                    ("biosample_ontology.term_name", cell_line),
+                    ("assembly", "GRCh38"),
+                    ("status", "released"),
+                    ("format", "json"),
+                    ("limit", "3"),
+                ] + [("field", f) for f in _ENCODE_FILE_FIELDS]
                 r2 = self.session_encode.get(f"{ENCODE_API}/search/", params=params2, timeout=60)
                 if r2.status_code == 200:
-                    data2 = r2.json()
+                    data2 = orjson.loads(r2.content)
                     files2 = data2.get('@graph', [])
                     if files2:
                         fdata = files2[0]
@@ -553,52 +955,76 @@ class DataManager:
             except Exception as e:
                 self._log(f"  Fallback cCRE search failed for {cell_line}: {e}")
 
-        # Cache result
-        self._ccre_cache[cell_norm] = result
+        with self._ccre_lock:
+            # Cache result
+            self._ccre_cache[cell_norm] = result
 
-        # Persist to disk cache
-        disk_cache = {}
-        if cache_file.exists():
-            try:
-                with open(cache_file) as f:
-                    disk_cache = json.load(f)
-            except json.JSONDecodeError:
-                disk_cache = {}
-        disk_cache[cell_norm] = result
-        with open(cache_file, 'w') as f:
-            json.dump(disk_cache, f, indent=2)
+            # Persist to disk cache (flushed by _flush_ccre_cache)
+            self._ccre_disk_cache[cell_norm] = result
+            self._ccre_dirty = True
 
-        # Store in DuckDB
-        if result and result.get('accession'):
-            from . import db
-            norm = normalize_cell_line(cell_line)
-            tissue = get_tissue(norm)
-            cl_id = db.upsert_cell_line(self.con, cell_line, norm, tissue)
-            db.upsert_regulatory_annotation(self.con, {
-                'accession': result['accession'],
-                'cell_line_id': cl_id,
+            # Queue for DuckDB
+            if result and result.get('accession'):
+                self._ccre_pending.append(result)
+
+        if store:
+            self._store_pending_ccre()
+        return result
+
+    def _store_pending_ccre(self):
+        """Write queued cCRE results to DuckDB in one transaction."""
+        with self._ccre_lock:
+            pending, self._ccre_pending = self._ccre_pending, []
+            if not pending:
+                return
+            cells = [r['cell_line'] for r in pending]
+            norm = [normalize_cell_line(c) for c in cells]
+            cl_rows = pd.DataFrame({
+                'name': cells,
+                'normalized': norm,
+                'tissue': [get_tissue(n) for n in norm],
+            }).assign(organism='human', species='Homo sapiens', genome_assembly='', biosample_type='')
+            ann_rows = pd.DataFrame({
+                'accession': [r['accession'] for r in pending],
                 'cell_line_name': norm,
-                'file_format': result.get('file_format', 'bed.gz'),
-                'file_size_bytes': result.get('file_size', 0),
-                'assembly': result.get('assembly', 'GRCh38'),
-                'href': result.get('href', ''),
-                'download_url': result.get('download_url', ''),
-                'output_type': result.get('output_type', ''),
+                'file_format': [r.get('file_format', 'bed.gz') for r in pending],
+                'file_size_bytes': [r.get('file_size') or 0 for r in pending],
+                'assembly': [r.get('assembly', 'GRCh38') for r in pending],
+                'href': [r.get('href', '') for r in pending],
+                'download_url': [r.get('download_url', '') for r in pending],
+                'output_type': [r.get('output_type', '') for r in pending],
             })
-            db.update_cell_line_flags(self.con)
+            with db.transaction(self.con):
+                db.bulk_upsert_cell_lines(self.con, cl_rows)
+                db.bulk_upsert_regulatory_annotations(self.con, ann_rows)
+                db.update_cell_line_flags(self.con)
 
-        return result
+    def fetch_all_ccre(self, cell_lines, progress=None):
+        """Fetch cCRE info for a list of cell lines.
+
+        progress, if given, is called with a message as each cell line completes.
+        """
+        def report(msg):
+            self._log(f"  {msg}")
+            if progress:
+                progress(msg)
 
-    def fetch_all_ccre(self, cell_lines):
-        """Fetch cCRE info for a list of cell lines."""
         results = {}
         unique = sorted(set(cell_lines))
-        for i, cell in enumerate(unique, 1):
-            self._log(f"  [{i}/{len(unique)}] Fetching cCRE for: {cell}")
-            info = self.fetch_ccre_for_cell_line(cell)
-            if info:
-                results[cell] = info
-            time.sleep(0.3)
+        with ThreadPoolExecutor(max_workers=_CCRE_QUERY_WORKERS) as executor:
+            futures = {executor.submit(self.fetch_ccre_for_cell_line, c, store=False): c for c in unique}
+            for i, future in enumerate(as_completed(futures), 1):
+                cell = futures[future]
+                try:
+                    info = future.result()
+                except Exception as e:
+                    report(f"Error fetching cCRE for {cell}: {e}")
+                    continue
+                report(f"[{i}/{len(unique)}] Fetched cCRE for: {cell}")
+                if info:
+                    results[cell] = info
+        self._store_pending_ccre()
+        self._flush_ccre_cache()
         return results
 
     # ------------------------------------------------------------------
@@ -609,224 +1035,431 @@ class DataManager:
                              min_size_gb=None, max_size_gb=None,
                              tissues=None):
         """Find truly paired datasets: .mcool files with matching cCRE BED."""
-        mcool_files = self.fetch_4dn_mcool_files(cell_line_filter=cell_line_filter)
-        mcool_files = [f for f in mcool_files if f.get('cell_line', '').lower().strip() != 'unknown']
-
-        if not mcool_files:
-            return []
-
-        # Normalize
-        for mf in mcool_files:
-            mf['cell_line_raw'] = mf.get('cell_line', '')
-            mf['cell_line_normalized'] = mf.get('cell_line_normalized') or normalize_cell_line(mf['cell_line'])
-
-        unique_norm_cells = sorted(set(f['cell_line_normalized'] for f in mcool_files))
-        ccre_map = self.fetch_all_ccre(unique_norm_cells)
-
-        # Build paired list
-        paired = []
-        for mf in mcool_files:
-            norm_cell = mf['cell_line_normalized']
-            ccre = ccre_map.get(norm_cell)
-            if ccre is None:
-                continue
-
-            paired.append({
-                'cell_line': norm_cell,
-                'cell_line_raw': mf['cell_line_raw'],
-                'tissue': get_tissue(norm_cell),
-                'mcool_accession': mf.get('accession', ''),
-                'mcool_size': mf.get('file_size', 0),
-                'mcool_size_gb': mf.get('file_size', 0) / (1024**3),
-                'mcool_href': mf.get('href', ''),
-                'mcool_download_url': mf.get('download_url', ''),
-                'mcool_source': mf.get('source', '4DN'),
-                'experiment_set': mf.get('experiment_set', ''),
-                'ccre_accession': ccre.get('accession', ''),
-                'ccre_size': ccre.get('file_size', 0),
-                'ccre_size_mb': ccre.get('file_size', 0) / (1024**2),
-                'ccre_href': ccre.get('href', ''),
-                'ccre_download_url': ccre.get('download_url', ''),
-                'ccre_assembly': ccre.get('assembly', 'GRCh38'),
-                'total_size': mf.get('file_size', 0) + ccre.get('file_size', 0),
-                'total_size_gb': (mf.get('file_size', 0) + ccre.get('file_size', 0)) / (1024**3),
-            })
-
-        # Apply filters
-        if tissues:
-            tissue_lower = [t.lower() for t in tissues]
-            paired = [p for p in paired if p['tissue'].lower() in tissue_lower]
-
-        if min_size_gb is not None:
-            paired = [p for p in paired if p['mcool_size_gb'] >= min_size_gb]
-        if max_size_gb is not None:
-            paired = [p for p in paired if p['mcool_size_gb'] <= max_size_gb]
-
-        if one_per_cell:
-            best = {}
-            for p in paired:
-                cell = p['cell_line']
-                if cell not in best or p['mcool_size'] > best[cell]['mcool_size']:
-                    best[cell] = p
-            paired = list(best.values())
-
-        # Replicate filters (applied after one_per_cell grouping)
-        if min_replicates is not None or max_replicates is not None:
-            # Count replicates per cell line
-            from collections import Counter
-            cell_counts = Counter(p['cell_line'] for p in paired)
-            if min_replicates is not None:
-                paired = [p for p in paired if cell_counts[p['cell_line']] >= min_replicates]
-            if max_replicates is not None:
-                paired = [p for p in paired if cell_counts[p['cell_line']] <= max_replicates]
-
-        return paired
+        with self._paired_query(cell_line_filter, one_per_cell, min_replicates, max_replicates,
+                                min_size_gb, max_size_gb, tissues) as query:
+            if query is None:
+                return []
+            sql, params = query
+            paired = self.con.execute(sql, params).fetchdf()
+        return paired.to_dict(orient='records')
+
+    @contextmanager
+    def _paired_query(self, cell_line_filter=None, one_per_cell=False,
+                      min_replicates=None, max_replicates=None,
+                      min_size_gb=None, max_size_gb=None, tissues=None):
+        """Stage the mcool and cCRE inventories in DuckDB and yield the paired query.
+
+        Yields (sql, params) for the filtered paired rows while the stage_*
+        views are registered, or None when nothing can be paired.
+        """
+        mcool = self._get_mcool_df(cell_line_filter)
+        if mcool.empty:
+            yield None
+            return
+
+        cells = mcool['cell_line_normalized'].cat.categories
+        ccre_map = self.fetch_all_ccre(list(cells[np.unique(mcool['cell_line_code'])]))
+        if not ccre_map:
+            yield None
+            return
+        ccre = pd.DataFrame([{
+            'cell_line_code': cells.get_loc(cell),
+            'ccre_accession': c.get('accession', ''),
+            'ccre_size': c.get('file_size', 0) or 0,
+            'ccre_href': c.get('href', ''),
+            'ccre_download_url': c.get('download_url', ''),
+            'ccre_assembly': c.get('assembly', 'GRCh38'),
+        } for cell, c in ccre_map.items()])
+
+        # Join, filter, one_per_cell and replicate counts in one DuckDB query.
+        # _ord keeps mcool file order; one_per_cell groups come out in order of
+        # first appearance, each represented by its largest mcool file.
+        stage = mcool[['cell_line_code', 'cell_line_normalized', 'cell_line_raw', 'tissue',
+                       'accession', 'file_size', 'href', 'download_url', 'source',
+                       'experiment_set']].astype({'cell_line_normalized': object})
+        self.con.register('stage_mcool', stage.assign(_ord=range(len(stage))))
+        self.con.register('stage_ccre', ccre)
+        try:
+            yield """
+                WITH paired AS (
+                    SELECT m._ord, m.cell_line_code,
+                           m.cell_line_normalized AS cell_line,
+                           m.cell_line_raw, m.tissue,
+                           m.accession AS mcool_accession,
+                           m.file_size AS mcool_size,
+                           m.file_size / 1073741824 AS mcool_size_gb,
+                           m.href AS mcool_href,
+                           m.download_url AS mcool_download_url,
+                           m.source AS mcool_source,
+                           m.experiment_set,
+                           c.ccre_accession, c.ccre_size,
+                           c.ccre_size / 1048576 AS ccre_size_mb,
+                           c.ccre_href, c.ccre_download_url, c.ccre_assembly,
+                           m.file_size + c.ccre_size AS total_size,
+                           (m.file_size + c.ccre_size) / 1073741824 AS total_size_gb
+                    FROM stage_mcool m
+                    JOIN stage_ccre c USING (cell_line_code)
+                    WHERE (len($tissues) = 0 OR list_contains($tissues, lower(m.tissue)))
+                      AND ($min_gb IS NULL OR m.file_size / 1073741824 >= $min_gb)
+                      AND ($max_gb IS NULL OR m.file_size / 1073741824 <= $max_gb)
+                ),
+                best AS (
+                    SELECT *, MIN(_ord) OVER (PARTITION BY cell_line_code) AS _grp
+                    FROM paired
+                    QUALIFY NOT $one_per_cell
+                         OR ROW_NUMBER() OVER (PARTITION BY cell_line_code
+                                               ORDER BY mcool_size DESC, _ord) = 1
+                ),
+                counted AS (
+                    SELECT *, COUNT(*) OVER (PARTITION BY cell_line_code) AS _n
+                    FROM best
+                )
+                SELECT * EXCLUDE (_ord, _grp, _n, cell_line_code)
+                FROM counted
+                WHERE ($min_rep IS NULL OR _n >= $min_rep)
+                  AND ($max_rep IS NULL OR _n <= $max_rep)
+                ORDER BY CASE WHEN $one_per_cell THEN _grp ELSE _ord END
+            """, {
+                'tissues': [t.lower() for t in tissues or []],
+                'min_gb': min_size_gb,
+                'max_gb': max_size_gb,
+                'one_per_cell': bool(one_per_cell),
+                'min_rep': min_replicates,
+                'max_rep': max_replicates,
+            }
+        finally:
+            self.con.unregister('stage_mcool')
+            self.con.unregister('stage_ccre')
 
     # ------------------------------------------------------------------
     # Non-paired (mcool only, no cCRE match)
     # ------------------------------------------------------------------
     def find_non_paired_datasets(self, cell_line_filter=None):
         """Find mcool files that do NOT have a matching cCRE."""
-        mcool_files = self.fetch_4dn_mcool_files(cell_line_filter=cell_line_filter)
-        mcool_files = [f for f in mcool_files if f.get('cell_line', '').lower().strip() != 'unknown']
-
-        for mf in mcool_files:
-            mf['cell_line_raw'] = mf.get('cell_line', '')
-            mf['cell_line_normalized'] = mf.get('cell_line_normalized') or normalize_cell_line(mf['cell_line'])
-
-        unique_norm_cells = sorted(set(f['cell_line_normalized'] for f in mcool_files))
-        ccre_map = self.fetch_all_ccre(unique_norm_cells)
-
-        non_paired = []
-        for mf in mcool_files:
-            norm_cell = mf['cell_line_normalized']
-            if ccre_map.get(norm_cell) is None:
-                non_paired.append({
-                    'cell_line': norm_cell,
-                    'cell_line_raw': mf['cell_line_raw'],
-                    'tissue': get_tissue(norm_cell),
-                    'accession': mf.get('accession', ''),
-                    'file_size': mf.get('file_size', 0),
-                    'file_size_gb': mf.get('file_size', 0) / (1024**3),
-                    'download_url': mf.get('download_url', ''),
-                    'source': mf.get('source', '4DN'),
-                })
-        return non_paired
+        mcool = self._get_mcool_df(cell_line_filter)
+        if mcool.empty:
+            return []
+
+        cells = mcool['cell_line_normalized'].cat.categories
+        ccre_map = self.fetch_all_ccre(list(cells[np.unique(mcool['cell_line_code'])]))
+        m = mcool[~cells.isin(list(ccre_map))[mcool['cell_line_code']]]
+        non_paired = pd.DataFrame({
+            'cell_line': m['cell_line_normalized'],
+            'cell_line_raw': m['cell_line_raw'],
+            'tissue': m['tissue'],
+            'accession': m['accession'],
+            'file_size': m['file_size'],
+            'file_size_gb': m['file_size'] / (1024**3),
+            'download_url': m['download_url'],
+            'source': m['source'],
+        })
+        return non_paired.to_dict(orient='records')
 
     # ------------------------------------------------------------------
     # Download with parallel support
     # ------------------------------------------------------------------
-    def download_file(self, url, out_path, accession='', resume=True, progress_callback=None):
-        """Download a file with resume support. Returns output path on success, None on failure."""
+    def download_file(self, url, out_path, accession='', resume=True, progress_callback=None, size=None):
+        """Download a file with resume support. Returns output path on success, None on failure.
+
+        Bytes are streamed into out_path + '.part' and renamed over out_path
+        only once the length matches what the server announced, so a file at
+        out_path is always complete. The response's ETag (or Last-Modified)
+        is kept in a '.part.validator' sidecar; with resume, an existing
+        .part is continued with an If-Range request, which the server
+        answers with the full body instead if the remote file has changed.
+
+        Transient HTTP errors are retried by the session adapter; a
+        connection lost mid-body is retried here, continuing the .part.
+
+        An existing out_path is returned as is without resume; with resume it
+        is only reused if it has the expected size. size is that size when
+        the caller knows it (otherwise a one-byte ranged probe asks the
+        server), and files known to be smaller than _SEGMENT_MIN_SIZE skip
+        the byte-range probe.
+        """
         out_path = Path(out_path)
         out_path.parent.mkdir(parents=True, exist_ok=True)
 
-        if out_path.exists() and not resume:
-            return str(out_path)
-
-        headers = {}
-        existing_size = 0
-        if resume and out_path.exists():
-            existing_size = out_path.stat().st_size
-            headers['Range'] = f'bytes={existing_size}-'
+        # A file of another size at out_path is left by an interrupted
+        # background job, which writes there directly; fetch it again
+        if out_path.exists():
+            if not resume:
+                return str(out_path)
+            expected = size
+            if not expected:
+                session, slots = self._download_session(url)
+                try:
+                    with slots:
+                        probe = self._probe_ranges(session, url)
+                except requests.RequestException:
+                    probe = None
+                expected = probe and probe[1]
+            if expected and out_path.stat().st_size == expected:
+                return str(out_path)
+            self._log(f"{out_path.name} is {out_path.stat().st_size} of "
+                      f"{expected or 'an unknown number of'} bytes; downloading again")
 
-        # Pick session based on URL
-        session = self.session_4dn if FOURDN_API in url else self.session_encode
+        for attempt in range(_DOWNLOAD_ATTEMPTS):
+            try:
+                return self._download_stream(url, out_path, accession, resume or attempt > 0,
+                                             progress_callback, size)
+            except _DOWNLOAD_RETRY_ERRORS as e:
+                if attempt == _DOWNLOAD_ATTEMPTS - 1:
+                    self._log(f"Download failed for {accession}: {e}")
+                    return None
+                delay = min(2 ** attempt, _DOWNLOAD_BACKOFF_MAX)
+                self._log(f"Download of {accession} interrupted ({e}); retrying in {delay}s")
+                time.sleep(delay)
+            except Exception as e:
+                self._log(f"Download failed for {accession}: {e}")
+                return None
 
-        try:
-            r = session.get(url, stream=True, headers=headers, timeout=300, allow_redirects=True)
+    def _download_stream(self, url, out_path, accession, resume, progress_callback, size):
+        """One download_file attempt; raises on failure, leaving any .part to resume."""
+        part_path = out_path.with_name(out_path.name + '.part')
+        validator_path = out_path.with_name(out_path.name + '.part.validator')
 
-            if r.status_code == 200 and existing_size > 0:
-                existing_size = 0
-            elif r.status_code == 416:
+        # mcool (HDF5) and .bed.gz are stored exactly as served; a gzip
+        # Content-Encoding would only cost zlib work on both ends
+        headers = {'Accept-Encoding': 'identity'}
+        existing_size = 0
+        if resume and part_path.exists() and validator_path.exists():
+            existing_size = part_path.stat().st_size
+            if existing_size > 0:
+                headers['Range'] = f'bytes={existing_size}-'
+                headers['If-Range'] = validator_path.read_text().strip()
+
+        session, slots = self._download_session(url)
+
+        if existing_size == 0 and MAX_PARALLEL > 1 and not (size and size < _SEGMENT_MIN_SIZE):
+            with slots:
+                probe = self._probe_ranges(session, url)
+            if probe and probe[1] >= _SEGMENT_MIN_SIZE:
+                validator_path.unlink(missing_ok=True)
+                return self._download_segmented(session, slots, probe[0], probe[1], out_path,
+                                                accession, progress_callback)
+
+        with slots, session.get(url, stream=True, headers=headers, timeout=300,
+                                allow_redirects=True) as r:
+            if r.status_code == 416 and existing_size > 0:
+                # Validator matched and nothing is left to fetch
+                if r.headers.get('content-range', '').rsplit('/', 1)[-1] != str(existing_size):
+                    part_path.unlink(missing_ok=True)
+                    validator_path.unlink(missing_ok=True)
+                    raise IOError(f"stale partial download ({existing_size} bytes)")
+                os.replace(part_path, out_path)
+                validator_path.unlink(missing_ok=True)
                 return str(out_path)
 
             r.raise_for_status()
 
-            total_expected = int(r.headers.get('content-length', 0)) + existing_size
-            total_written = existing_size
-            start_time = time.time()
+            if r.status_code == 206:
+                total = r.headers.get('content-range', '').rsplit('/', 1)[-1]
+                if existing_size == 0 or not r.headers.get('content-range', '').startswith(
+                        f'bytes {existing_size}-'):
+                    raise IOError(f"unexpected Content-Range {r.headers.get('content-range')!r}")
+            else:
+                # Full body: either a fresh download or the file changed remotely
+                existing_size = 0
+                identity = r.headers.get('content-encoding', 'identity') == 'identity'
+                total = r.headers.get('content-length', '') if identity else ''
+            total_expected = int(total) if total.isdigit() else None
+
+            validator = r.headers.get('etag', '')
+            if not validator or validator.startswith('W/'):
+                # If-Range needs a strong validator
+                validator = r.headers.get('last-modified', '')
+            if validator:
+                validator_path.write_text(validator)
+            else:
+                validator_path.unlink(missing_ok=True)
+
+            report = progress_callback and _progress_reporter(
+                progress_callback, accession, total_expected or 0, existing_size)
 
-            mode = 'ab' if existing_size > 0 and r.status_code == 206 else 'wb'
-            with open(out_path, mode) as f:
-                for chunk in r.iter_content(chunk_size=4 * 1024 * 1024):
+            mode = 'ab' if existing_size > 0 else 'wb'
+            with open(part_path, mode) as f:
+                # Multi-GB mcools would otherwise evict everything else
+                # from the page cache; drop them behind a trailing window
+                pos = dropped = existing_size
+                for chunk in _iter_body(r):
                     f.write(chunk)
-                    total_written += len(chunk)
-
-                    if progress_callback:
-                        elapsed = time.time() - start_time
-                        speed = (total_written - existing_size) / elapsed / (1024 * 1024) if elapsed > 0 else 0
-                        pct = (total_written / total_expected * 100) if total_expected > 0 else 0
-                        progress_callback({
-                            'accession': accession,
-                            'bytes_written': total_written,
-                            'bytes_total': total_expected,
-                            'percent': round(pct, 1),
-                            'speed_mbps': round(speed, 1),
-                        })
+                    pos += len(chunk)
+                    if pos - dropped >= 2 * _CACHE_DROP_WINDOW:
+                        _drop_written_pages(f.fileno(), dropped, pos - _CACHE_DROP_WINDOW)
+                        dropped = pos - _CACHE_DROP_WINDOW
+                    if report:
+                        report(len(chunk))
+
+            if total_expected is not None and pos < total_expected:
+                raise requests.ConnectionError(f"connection closed after {pos} of {total_expected} bytes")
+            if total_expected is not None and pos > total_expected:
+                part_path.unlink(missing_ok=True)
+                validator_path.unlink(missing_ok=True)
+                raise IOError(f"expected {total_expected} bytes, got {pos}")
+            os.replace(part_path, out_path)
+            validator_path.unlink(missing_ok=True)
+            if report:
+                report(0, final=True)
+
+        return str(out_path)
+
+    def _download_session(self, url):
+        """Return the session for url and the semaphore bounding its host's connections."""
+        if FOURDN_API in url:
+            return self.session_4dn, self._slots_4dn
+        return self.session_encode, self._slots_encode
+
+    def _probe_ranges(self, session, url):
+        """Return (final_url, size) if the server honours byte ranges for url, else None.
+
+        Probes with a one-byte ranged GET rather than HEAD: 4DN redirects to
+        presigned S3 URLs that are only signed for GET.
+        """
+        r = session.get(url, stream=True, timeout=60, allow_redirects=True,
+                        headers={'Range': 'bytes=0-0', 'Accept-Encoding': 'identity'})
+        r.close()
+        content_range = r.headers.get('content-range', '')
+        if r.status_code != 206 or '/' not in content_range:
+            return None
+        total = content_range.rsplit('/', 1)[1]
+        return (r.url, int(total)) if total.isdigit() else None
 
-            return str(out_path)
+    def _download_segmented(self, session, slots, url, size, out_path, accession='', progress_callback=None):
+        """Download url as MAX_PARALLEL concurrent byte ranges written in place.
+
+        Each range is written with os.pwrite at its own offset in a
+        preallocated .part file, sharing one descriptor without seeking. The
+        file is renamed over out_path once every range is complete, so an
+        interrupted run never leaves a full-size file that resume would
+        mistake for a finished one.
+        """
+        part_path = out_path.with_name(out_path.name + '.part')
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        step = -(-size // MAX_PARALLEL)
+        segments = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+        report = progress_callback and _progress_reporter(progress_callback, accession, size)
 
+        def _fetch(start, end):
+            headers = {'Range': f'bytes={start}-{end}', 'Accept-Encoding': 'identity'}
+            with slots, session.get(url, stream=True, headers=headers, timeout=300) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise IOError(f"server ignored Range bytes={start}-{end}")
+                got = dropped = 0
+                for chunk in _iter_body(r):
+                    os.pwrite(fd, chunk, start + got)
+                    got += len(chunk)
+                    if got - dropped >= 2 * _CACHE_DROP_WINDOW:
+                        _drop_written_pages(fd, start + dropped, start + got - _CACHE_DROP_WINDOW)
+                        dropped = got - _CACHE_DROP_WINDOW
+                    if report:
+                        report(len(chunk))
+            if got != end - start + 1:
+                raise IOError(f"short read for bytes={start}-{end}: {got} bytes")
+
+        try:
+            try:
+                # Reserve the blocks up front so segments don't fragment the file
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(fd, 0, size)
+                else:
+                    os.ftruncate(fd, size)
+                with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                    for future in [executor.submit(_fetch, a, b) for a, b in segments]:
+                        future.result()
+            finally:
+                os.close(fd)
+            os.replace(part_path, out_path)
+            if report:
+                report(0, final=True)
+            return str(out_path)
         except Exception as e:
             self._log(f"Download failed for {accession}: {e}")
+            part_path.unlink(missing_ok=True)
             return None
 
     def download_paired_parallel(self, paired_list, resume=True, max_workers=None, progress_callback=None):
-        """Download multiple paired datasets in parallel."""
-        if max_workers is None:
-            max_workers = MAX_PARALLEL
+        """Download multiple paired datasets in parallel.
 
+        mcool files run on max_workers threads (MAX_PARALLEL by default) and
+        cCRE BEDs on a separate MAX_PARALLEL_CCRE pool, so the many small BEDs
+        are not queued behind multi-GB mcools.
+        """
         download_tasks = []
         for p in paired_list:
-            cell_safe = p['cell_line'].replace(' ', '_').replace(',', '').replace('/', '_')
+            cell_safe = p['cell_line'].translate(_SLUG_TABLE)
 
             # mcool task
             mcool_path = MCOOL_DIR / f"{cell_safe}_{p['mcool_accession']}.mcool"
-            download_tasks.append({
-                'type': 'mcool',
-                'cell_line': p['cell_line'],
-                'accession': p['mcool_accession'],
-                'url': p['mcool_download_url'],
-                'path': str(mcool_path),
-                'size': p['mcool_size'],
-            })
+            download_tasks.append(DownloadTask(
+                'mcool', p['cell_line'], p['mcool_accession'], p['mcool_download_url'],
+                str(mcool_path), p['mcool_size']))
 
             # ccre task
             ccre_path = CCRE_DIR / f"{cell_safe}_{p['ccre_accession']}.bed.gz"
-            download_tasks.append({
-                'type': 'ccre',
-                'cell_line': p['cell_line'],
-                'accession': p['ccre_accession'],
-                'url': p['ccre_download_url'],
-                'path': str(ccre_path),
-                'size': p['ccre_size'],
-            })
+            download_tasks.append(DownloadTask(
+                'ccre', p['cell_line'], p['ccre_accession'], p['ccre_download_url'],
+                str(ccre_path), p['ccre_size']))
+
+        return self.download_tasks_parallel(download_tasks, resume=resume, max_workers=max_workers,
+                                            progress_callback=progress_callback)
+
+    def download_tasks_parallel(self, download_tasks, resume=True, max_workers=None, progress_callback=None):
+        """Download a list of DownloadTasks in parallel and record them in DuckDB.
+
+        Returns one result dict per task, in completion order.
+        """
+        if max_workers is None:
+            max_workers = MAX_PARALLEL
 
         results = []
 
         def _do_download(task):
-            result_path = self.download_file(
-                task['url'], task['path'],
-                accession=task['accession'],
+            return self.download_file(
+                task.url, task.path,
+                accession=task.accession,
                 resume=resume,
                 progress_callback=progress_callback,
+                size=task.size,
             )
-            success = result_path is not None
-            if success:
-                from . import db
-                file_type = 'chromatin' if task['type'] == 'mcool' else 'regulatory'
-                db.mark_downloaded(self.con, task['accession'], result_path, file_type)
-            return {**task, 'success': success, 'local_path': result_path}
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(_do_download, t): t for t in download_tasks}
+
+        # Completed downloads are recorded in DuckDB from this thread only,
+        # batched every _MARK_BATCH_SIZE results or _MARK_BATCH_SECONDS
+        pending_marks = []
+        last_flush = time.monotonic()
+
+        def _flush_marks():
+            if pending_marks:
+                db.mark_downloaded_many(self.con, pending_marks)
+                pending_marks.clear()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as mcool_pool, \
+                ThreadPoolExecutor(max_workers=MAX_PARALLEL_CCRE) as ccre_pool:
+            futures = {
+                (mcool_pool if t.type == 'mcool' else ccre_pool).submit(_do_download, t): t
+                for t in download_tasks
+            }
             for future in as_completed(futures):
+                task = futures[future]
+                result = task._asdict()
                 try:
-                    result = future.result()
-                    results.append(result)
+                    result_path = future.result()
+                    result['success'] = result_path is not None
+                    result['local_path'] = result_path
+                    if result_path is not None:
+                        file_type = 'chromatin' if task.type == 'mcool' else 'regulatory'
+                        pending_marks.append((task.accession, result_path, file_type))
                 except Exception as e:
-                    task = futures[future]
-                    results.append({**task, 'success': False, 'error': str(e)})
+                    result['success'] = False
+                    result['error'] = str(e)
+                results.append(result)
+                if (len(pending_marks) >= _MARK_BATCH_SIZE
+                        or time.monotonic() - last_flush >= _MARK_BATCH_SECONDS):
+                    _flush_marks()
+                    last_flush = time.monotonic()
+        _flush_marks()
 
         return results
 
@@ -836,27 +1469,41 @@ class DataManager:
     def validate_bed_gz(self, filepath):
         """Quick validation of a .bed.gz file."""
         try:
-            with gzip.open(filepath, 'rt') as f:
-                first_line = f.readline().strip()
-                if first_line:
-                    cols = first_line.split('\t')
-                    if len(cols) >= 3:
-                        return {'valid': True, 'columns': len(cols), 'first_line': first_line}
-            return {'valid': False, 'error': 'Empty or invalid'}
+            return self._check_bed_gz(filepath)
         except Exception as e:
             return {'valid': False, 'error': str(e)}
 
+    def _check_bed_gz(self, filepath):
+        """validate_bed_gz without the error handling; a failed read raises."""
+        first_line = _gzip_first_line(filepath).decode('utf-8').strip()
+        if first_line:
+            cols = first_line.split('\t')
+            if len(cols) >= 3:
+                return {'valid': True, 'columns': len(cols), 'first_line': first_line}
+        return {'valid': False, 'error': 'Empty or invalid'}
+
     def validate_mcool(self, filepath):
         """Quick validation of a .mcool file (check HDF5 magic bytes)."""
         try:
-            with open(filepath, 'rb') as f:
-                magic = f.read(8)
-                if magic[:4] == b'\x89HDF':
-                    return {'valid': True, 'format': 'HDF5/mcool'}
-                return {'valid': False, 'error': 'Not a valid HDF5 file'}
+            return self._check_mcool(filepath)
         except Exception as e:
             return {'valid': False, 'error': str(e)}
 
+    def _check_mcool(self, filepath):
+        """validate_mcool without the error handling; a failed read raises.
+
+        Reads the magic with a single pread on a raw descriptor; a buffered
+        file object would allocate and fill a whole read buffer for 8 bytes.
+        """
+        fd = os.open(filepath, os.O_RDONLY)
+        try:
+            magic = os.pread(fd, 8, 0)
+        finally:
+            os.close(fd)
+        if magic[:4] == b'\x89HDF':
+            return {'valid': True, 'format': 'HDF5/mcool'}
+        return {'valid': False, 'error': 'Not a valid HDF5 file'}
+
     # ------------------------------------------------------------------
     # Comprehensive dataset validation for ML training
     # ------------------------------------------------------------------
@@ -877,126 +1524,152 @@ class DataManager:
             }
         }
 
-        # Get all cell lines with their experiments
-        query = """
-            SELECT cl.cell_line_normalized as cell_line, cl.species, cl.genome_assembly,
-                   cl.has_ccre, cl.has_mcool,
-                   ce.accession as mcool_accession, ce.download_status as mcool_dl_status,
-                   ce.local_path as mcool_path, ce.genome_assembly as exp_assembly,
-                   ce.treatment, ce.modification, ce.condition,
-                   ra.accession as ccre_accession, ra.download_status as ccre_dl_status,
-                   ra.local_path as ccre_path, ra.assembly as ccre_assembly
-            FROM cell_lines cl
-            LEFT JOIN chromatin_experiments ce ON cl.cell_line_id = ce.cell_line_id
-            LEFT JOIN regulatory_annotations ra ON cl.cell_line_id = ra.cell_line_id
-            WHERE cl.has_mcool = TRUE
-        """
-        params = []
-        if species_filter:
-            query += " AND cl.species = ?"
-            params.append(species_filter)
-        query += " ORDER BY cl.cell_line_normalized"
-
         try:
-            rows = self.con.execute(query, params).fetchdf()
+            rows = self.con.execute(_VALIDATE_QUERY, {'species': species_filter or None}).fetchdf()
         except Exception as e:
             results['issues'].append({'type': 'query_error', 'message': str(e)})
             return results
 
-        for _, row in rows.iterrows():
-            results['summary']['total_checked'] += 1
+        summary = results['summary']
+        summary['total_checked'] = len(rows)
+        if rows.empty:
+            return results
+
+        # Column-wise checks. NULLs arrive as None or NaN depending on the
+        # pandas version; text columns treat both as ''.
+        text = {c: rows[c].fillna('').astype(str) for c in (
+            'genome_assembly', 'exp_assembly', 'ccre_assembly', 'mcool_path', 'ccre_path', 'treatment')}
+        asm_mismatch = ((text['ccre_assembly'] != '') & (text['exp_assembly'] != '')
+                        & (text['ccre_assembly'] != text['genome_assembly']))
+        has_ccre = rows['has_ccre'].fillna(False).astype(bool)
+        mcool_downloaded = rows['mcool_dl_status'].eq('downloaded')
+
+        # File checks: each distinct path is stat'ed and validated once, on a
+        # thread pool so slow (network) filesystems are checked concurrently.
+        # Results are cached in DuckDB and reused while size and mtime match;
+        # a read that fails (permissions, I/O errors, a file still being
+        # written) may succeed next time, so its result is not cached.
+        validators = {'mcool': self._check_mcool, 'ccre': self._check_bed_gz}
+        jobs = [('mcool', p) for p in set(text['mcool_path']) if p]
+        jobs += [('ccre', p) for p in set(text['ccre_path']) if p]
+        cached = db.load_validation_cache(self.con, {path for _, path in jobs})
+        fresh = []
+
+        def _check(job):
+            kind, path = job
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            hit = cached.get(path)
+            if hit and hit[:3] == (st.st_size, st.st_mtime_ns, kind):
+                return orjson.loads(hit[3])
+            try:
+                result = validators[kind](path)
+            except Exception as e:
+                return {'valid': False, 'error': str(e)}
+            fresh.append((path, st.st_size, st.st_mtime_ns, kind, bool(result.get('valid')),
+                          json.dumps(result)))
+            return result
+
+        with ThreadPoolExecutor(max_workers=_FILE_CHECK_WORKERS) as executor:
+            found = dict(zip(jobs, executor.map(_check, jobs)))
+        if fresh:
+            db.save_validation_cache(self.con, fresh)
+        mcool_checks = [found.get(('mcool', p)) for p in text['mcool_path']]
+        ccre_checks = [found.get(('ccre', p)) for p in text['ccre_path']]
+        mcool_invalid = np.array([v is not None and not v.get('valid') for v in mcool_checks])
+        ccre_invalid = np.array([v is not None and not v.get('valid') for v in ccre_checks])
+        valid = has_ccre.to_numpy() & ~mcool_invalid & ~ccre_invalid
+
+        summary['assembly_mismatches'] = int(asm_mismatch.sum())
+        summary['missing_ccre'] = int((~has_ccre).sum())
+        summary['valid'] = int(valid.sum())
+        summary['invalid'] = len(rows) - summary['valid']
+
+        def _values(col):
+            values = rows[col].astype(object)
+            return values.where(values.notna(), None).tolist()
+
+        for (cell_line, species, genome_assembly, mcool_accession, ccre_accession, cl_asm, ccre_asm,
+             mismatch, ccre_ok, mcool_check, dl_done, ccre_check, treatment, ok) in zip(
+                _values('cell_line'), _values('species'), _values('genome_assembly'),
+                _values('mcool_accession'), _values('ccre_accession'),
+                text['genome_assembly'], text['ccre_assembly'], asm_mismatch, has_ccre,
+                mcool_checks, mcool_downloaded, ccre_checks, text['treatment'], valid):
+            checks = []
             entry = {
-                'cell_line': row.get('cell_line', ''),
-                'species': row.get('species', ''),
-                'genome_assembly': row.get('genome_assembly', ''),
-                'mcool_accession': row.get('mcool_accession', ''),
-                'ccre_accession': row.get('ccre_accession', ''),
-                'checks': [],
-                'valid': True,
+                'cell_line': cell_line,
+                'species': species,
+                'genome_assembly': genome_assembly,
+                'mcool_accession': mcool_accession,
+                'ccre_accession': ccre_accession,
+                'checks': checks,
+                'valid': bool(ok),
             }
 
             # Check 1: Assembly consistency
-            exp_asm = row.get('exp_assembly', '') or ''
-            ccre_asm = row.get('ccre_assembly', '') or ''
-            cl_asm = row.get('genome_assembly', '') or ''
-
-            if ccre_asm and exp_asm and ccre_asm != cl_asm:
-                entry['checks'].append({
+            if mismatch:
+                checks.append({
                     'check': 'assembly_match',
                     'status': 'warning',
                     'message': f'cCRE assembly ({ccre_asm}) differs from expected ({cl_asm})',
                 })
-                results['summary']['assembly_mismatches'] += 1
             else:
-                entry['checks'].append({'check': 'assembly_match', 'status': 'ok', 'message': f'Assembly: {cl_asm}'})
+                checks.append({'check': 'assembly_match', 'status': 'ok', 'message': f'Assembly: {cl_asm}'})
 
             # Check 2: cCRE availability
-            has_ccre = bool(row.get('has_ccre'))
-            if not has_ccre:
-                entry['checks'].append({
+            if not ccre_ok:
+                checks.append({
                     'check': 'ccre_available',
                     'status': 'missing',
                     'message': 'No cCRE annotation found for this cell line',
                 })
-                entry['valid'] = False
-                results['summary']['missing_ccre'] += 1
             else:
-                entry['checks'].append({'check': 'ccre_available', 'status': 'ok', 'message': f'cCRE: {row.get("ccre_accession", "")}'})
+                checks.append({'check': 'ccre_available', 'status': 'ok', 'message': f'cCRE: {ccre_accession}'})
 
             # Check 3: mcool file integrity (if downloaded)
-            mcool_path = row.get('mcool_path', '') or ''
-            if mcool_path and Path(mcool_path).exists():
-                validation = self.validate_mcool(mcool_path)
-                if validation.get('valid'):
-                    entry['checks'].append({'check': 'mcool_integrity', 'status': 'ok', 'message': 'HDF5 valid'})
+            if mcool_check is not None:
+                if mcool_check.get('valid'):
+                    checks.append({'check': 'mcool_integrity', 'status': 'ok', 'message': 'HDF5 valid'})
                 else:
-                    entry['checks'].append({
+                    checks.append({
                         'check': 'mcool_integrity',
                         'status': 'error',
-                        'message': f'Invalid mcool: {validation.get("error", "unknown")}',
+                        'message': f'Invalid mcool: {mcool_check.get("error", "unknown")}',
                     })
-                    entry['valid'] = False
-            elif row.get('mcool_dl_status') == 'downloaded':
-                entry['checks'].append({
+            elif dl_done:
+                checks.append({
                     'check': 'mcool_integrity',
                     'status': 'warning',
                     'message': 'Marked downloaded but file not found',
                 })
             else:
-                entry['checks'].append({'check': 'mcool_integrity', 'status': 'pending', 'message': 'Not yet downloaded'})
+                checks.append({'check': 'mcool_integrity', 'status': 'pending', 'message': 'Not yet downloaded'})
 
             # Check 4: cCRE file integrity (if downloaded)
-            ccre_path = row.get('ccre_path', '') or ''
-            if ccre_path and Path(ccre_path).exists():
-                validation = self.validate_bed_gz(ccre_path)
-                if validation.get('valid'):
-                    entry['checks'].append({'check': 'ccre_integrity', 'status': 'ok',
-                                            'message': f'BED valid ({validation.get("columns", 0)} cols)'})
+            if ccre_check is not None:
+                if ccre_check.get('valid'):
+                    checks.append({'check': 'ccre_integrity', 'status': 'ok',
+                                   'message': f'BED valid ({ccre_check.get("columns", 0)} cols)'})
                 else:
-                    entry['checks'].append({
+                    checks.append({
                         'check': 'ccre_integrity',
                         'status': 'error',
-                        'message': f'Invalid BED: {validation.get("error", "unknown")}',
+                        'message': f'Invalid BED: {ccre_check.get("error", "unknown")}',
                     })
-                    entry['valid'] = False
-            elif has_ccre:
-                entry['checks'].append({'check': 'ccre_integrity', 'status': 'pending', 'message': 'Not yet downloaded'})
+            elif ccre_ok:
+                checks.append({'check': 'ccre_integrity', 'status': 'pending', 'message': 'Not yet downloaded'})
 
             # Check 5: Treatment status (informational)
-            treatment = row.get('treatment', '') or ''
             if treatment:
-                entry['checks'].append({
+                checks.append({
                     'check': 'treatment',
                     'status': 'info',
                     'message': f'Treatment: {treatment[:60]}',
                 })
                 entry['treatment_warning'] = 'cCRE may not match treated chromatin state'
 
-            if entry['valid']:
-                results['summary']['valid'] += 1
-            else:
-                results['summary']['invalid'] += 1
-
             results['validated'].append(entry)
 
         return results
@@ -1004,21 +1677,23 @@ class DataManager:
     # ------------------------------------------------------------------
     # Statistics (for the Ink UI)
     # ------------------------------------------------------------------
+    def _records(self, query, params=None):
+        """Run a read-only query on ro_con and return its rows as dicts, without pandas."""
+        cur = self.ro_con.execute(query, params or [])
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
     def get_stats(self):
         """Get comprehensive statistics from DuckDB."""
         stats = {}
 
         # Summary
-        row = self.con.execute("SELECT * FROM stats_summary").fetchone()
-        if row:
-            cols = [d[0] for d in self.con.description]
-            stats['summary'] = dict(zip(cols, row))
-        else:
-            stats['summary'] = {}
+        summary = self._records("SELECT * FROM stats_summary")
+        stats['summary'] = summary[0] if summary else {}
 
         # Per cell line (with species + assembly)
         try:
-            cell_stats = self.con.execute("""
+            stats['cell_lines'] = self._records("""
                 SELECT cl.cell_line_normalized as cell_line, cl.tissue_type as tissue,
                        cl.species, cl.genome_assembly,
                        COUNT(DISTINCT ce.experiment_id) as replicates,
@@ -1029,90 +1704,75 @@ class DataManager:
                 GROUP BY cl.cell_line_normalized, cl.tissue_type, cl.species,
                          cl.genome_assembly, cl.has_ccre, cl.has_mcool, cl.biosample_type
                 ORDER BY replicates DESC
-            """).fetchdf()
-            stats['cell_lines'] = cell_stats.to_dict(orient='records')
+            """)
         except Exception:
             stats['cell_lines'] = []
 
         # Species breakdown
         try:
-            species_stats = self.con.execute("""
+            stats['species'] = self._records("""
                 SELECT cl.species, COUNT(*) as cell_line_count,
                        SUM(cl.total_experiments) as experiment_count,
                        SUM(CASE WHEN cl.has_ccre THEN 1 ELSE 0 END) as with_ccre
                 FROM cell_lines cl
                 GROUP BY cl.species
                 ORDER BY experiment_count DESC
-            """).fetchdf()
-            stats['species'] = species_stats.to_dict(orient='records')
+            """)
         except Exception:
             stats['species'] = []
 
-        # Treatment summary
+        # Treatments, size distribution and download status share one scan of
+        # chromatin_experiments: GROUPING SETS computes all three, and
+        # GROUPING() tells the sets apart (bitmask of the ungrouped columns)
         try:
-            treatment_stats = self.con.execute("""
-                SELECT
-                    CASE WHEN treatment = '' OR treatment IS NULL THEN 'untreated'
-                         ELSE treatment END as treatment,
-                    COUNT(*) as count,
-                    COUNT(DISTINCT cell_line_name) as cell_lines
-                FROM chromatin_experiments
-                GROUP BY treatment
-                ORDER BY count DESC
-                LIMIT 20
-            """).fetchdf()
-            stats['treatments'] = treatment_stats.to_dict(orient='records')
+            rows = self.ro_con.execute("""
+                SELECT GROUPING(treatment, size_range, download_status) as grouping_id,
+                       treatment, size_range, download_status,
+                       COUNT(*) as count,
+                       COUNT(DISTINCT cell_line_name) as cell_lines,
+                       MIN(file_size_gb) as min_gb
+                FROM (
+                    SELECT treatment, download_status, cell_line_name, file_size_gb,
+                        CASE
+                            WHEN file_size_gb < 1 THEN '< 1 GB'
+                            WHEN file_size_gb < 10 THEN '1-10 GB'
+                            WHEN file_size_gb < 30 THEN '10-30 GB'
+                            WHEN file_size_gb < 50 THEN '30-50 GB'
+                            ELSE '> 50 GB'
+                        END as size_range
+                    FROM chromatin_experiments
+                )
+                GROUP BY GROUPING SETS ((treatment), (size_range), (download_status))
+            """).fetchall()
         except Exception:
-            stats['treatments'] = []
+            rows = []
+
+        by_treatment = sorted((r for r in rows if r[0] == 0b011), key=lambda r: -r[4])[:20]
+        stats['treatments'] = [
+            {'treatment': r[1] or 'untreated', 'count': r[4], 'cell_lines': r[5]}
+            for r in by_treatment
+        ]
 
         # Tissue distribution
         try:
-            tissue_stats = self.con.execute("""
+            stats['tissues'] = self._records("""
                 SELECT tissue_type as tissue, COUNT(*) as count
                 FROM cell_lines
                 WHERE tissue_type != 'Unknown'
                 GROUP BY tissue_type
                 ORDER BY count DESC
-            """).fetchdf()
-            stats['tissues'] = tissue_stats.to_dict(orient='records')
+            """)
         except Exception:
             stats['tissues'] = []
 
-        # Size distribution
-        try:
-            size_dist = self.con.execute("""
-                SELECT
-                    CASE
-                        WHEN file_size_gb < 1 THEN '< 1 GB'
-                        WHEN file_size_gb < 10 THEN '1-10 GB'
-                        WHEN file_size_gb < 30 THEN '10-30 GB'
-                        WHEN file_size_gb < 50 THEN '30-50 GB'
-                        ELSE '> 50 GB'
-                    END as size_range,
-                    COUNT(*) as count
-                FROM chromatin_experiments
-                GROUP BY size_range
-                ORDER BY MIN(file_size_gb)
-            """).fetchdf()
-            stats['size_distribution'] = size_dist.to_dict(orient='records')
-        except Exception:
-            stats['size_distribution'] = []
-
-        # Download status
-        try:
-            dl_stats = self.con.execute("""
-                SELECT download_status as status, COUNT(*) as count
-                FROM chromatin_experiments
-                GROUP BY download_status
-            """).fetchdf()
-            stats['download_status'] = dl_stats.to_dict(orient='records')
-        except Exception:
-            stats['download_status'] = []
+        # Size distribution and download status (from the grouping sets above)
+        by_size = sorted((r for r in rows if r[0] == 0b101), key=lambda r: (r[6] is None, r[6]))
+        stats['size_distribution'] = [{'size_range': r[2], 'count': r[4]} for r in by_size]
+        stats['download_status'] = [{'status': r[3], 'count': r[4]} for r in rows if r[0] == 0b110]
 
         # Paired datasets
         try:
-            paired = self.con.execute("SELECT * FROM paired_datasets ORDER BY total_size_gb DESC").fetchdf()
-            stats['paired'] = paired.to_dict(orient='records')
+            stats['paired'] = self._records("SELECT * FROM paired_datasets ORDER BY total_size_gb DESC")
         except Exception:
             stats['paired'] = []
 
@@ -1122,62 +1782,77 @@ class DataManager:
     # Duplicate check
     # ------------------------------------------------------------------
     def check_duplicates(self):
-        """Identify duplicate vs unique experiments."""
+        """Identify duplicate vs unique experiments, one record per cell line."""
         try:
-            df = self.con.execute("""
+            return self._records("""
                 SELECT cell_line_name as cell_line,
                        COUNT(*) as replicate_count,
-                       SUM(file_size_gb) as total_size_gb
+                       SUM(file_size_gb) as total_size_gb,
+                       COUNT(*) = 1 as is_unique,
+                       COUNT(*) > 1 as is_duplicate
                 FROM chromatin_experiments
                 GROUP BY cell_line_name
                 ORDER BY replicate_count DESC
-            """).fetchdf()
-            df['is_unique'] = df['replicate_count'] == 1
-            df['is_duplicate'] = df['replicate_count'] > 1
-            return df
+            """)
         except Exception:
-            return pd.DataFrame()
+            return []
 
     # ------------------------------------------------------------------
     # Report generation
     # ------------------------------------------------------------------
     def generate_report(self, one_per_cell=False, output_csv=None):
         """Generate a full paired dataset report."""
-        paired = self.find_paired_datasets(one_per_cell=one_per_cell)
-        if not paired:
-            return None
-
-        df = pd.DataFrame(paired)
-        csv_path = output_csv or str(REPORT_DIR / "paired_dataset_report.csv")
-        df.to_csv(csv_path, index=False)
+        # The report and per-cell summary are written by DuckDB COPY from a
+        # temp table, so the catalog never round-trips through pandas
+        with self._paired_query(one_per_cell=one_per_cell) as query:
+            if query is None:
+                return None
+            sql, params = query
+            self.con.execute(f"CREATE OR REPLACE TEMP TABLE report_paired AS {sql}", params)
 
-        # Summary
-        summary = df.groupby('cell_line').agg({
-            'mcool_accession': 'count',
-            'mcool_size_gb': 'sum',
-            'ccre_size_mb': 'first',
-            'total_size_gb': 'sum'
-        }).reset_index()
-        summary.columns = ['cell_line', 'samples', 'mcool_gb', 'ccre_mb', 'total_gb']
-        summary = summary.sort_values('total_gb', ascending=False)
-
-        summary_path = str(REPORT_DIR / "paired_summary_by_cell.csv")
-        summary.to_csv(summary_path, index=False)
+        try:
+            totals = self.con.execute("""
+                SELECT COUNT(DISTINCT cell_line), COUNT(*), SUM(mcool_size_gb),
+                       SUM(ccre_size_mb), SUM(total_size_gb)
+                FROM report_paired
+            """).fetchone()
+            if not totals[1]:
+                return None
+
+            csv_path = output_csv or str(REPORT_DIR / "paired_dataset_report.csv")
+            self.con.execute(f"COPY report_paired TO '{_sql_quote(csv_path)}' (HEADER, DELIMITER ',')")
+
+            # Summary
+            summary_path = str(REPORT_DIR / "paired_summary_by_cell.csv")
+            self.con.execute(f"""
+                COPY (
+                    SELECT cell_line,
+                           COUNT(mcool_accession) as samples,
+                           SUM(mcool_size_gb) as mcool_gb,
+                           FIRST(ccre_size_mb) as ccre_mb,
+                           SUM(total_size_gb) as total_gb
+                    FROM report_paired
+                    GROUP BY cell_line
+                    ORDER BY total_gb DESC, cell_line
+                ) TO '{_sql_quote(summary_path)}' (HEADER, DELIMITER ',')
+            """)
+        finally:
+            self.con.execute("DROP TABLE IF EXISTS report_paired")
 
         # Export Parquet
-        from . import db
         try:
             db.export_parquet(self.con, 'chromatin_experiments', str(RAW_DIR / '4dn_experiments.parquet'))
             db.export_parquet(self.con, 'regulatory_annotations', str(RAW_DIR / 'encode_annotations.parquet'))
         except Exception:
             pass
 
+        total_cell_lines, total_samples, mcool_gb, ccre_mb, total_gb = totals
         return {
             'report_path': csv_path,
             'summary_path': summary_path,
-            'total_cell_lines': df['cell_line'].nunique(),
-            'total_samples': len(df),
-            'total_mcool_gb': round(df['mcool_size_gb'].sum(), 2),
-            'total_ccre_mb': round(df['ccre_size_mb'].sum(), 1),
-            'total_gb': round(df['total_size_gb'].sum(), 2),
+            'total_cell_lines': total_cell_lines,
+            'total_samples': total_samples,
+            'total_mcool_gb': round(mcool_gb, 2),
+            'total_ccre_mb': round(ccre_mb, 1),
+            'total_gb': round(total_gb, 2),
         }
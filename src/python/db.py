@@ -6,6 +6,7 @@ Manages all persistent storage using DuckDB + Parquet.
 
 import duckdb
 import os
+from contextlib import contextmanager
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -13,32 +14,94 @@ load_dotenv()
 
 DATA_DIR = Path(os.getenv("DATA_DIR", "./data"))
 DB_PATH = DATA_DIR / "processed" / "chromatin_data.duckdb"
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", str(os.cpu_count() or 1)))
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "4GB")
 
 
 def get_connection():
-    """Get a DuckDB connection, creating schema if needed."""
+    """Get a DuckDB connection, creating schema if needed.
+
+    Results that need an order ask for it with ORDER BY, so insertion order
+    is not preserved; that lets scans and COPY run fully in parallel.
+    """
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    con = duckdb.connect(str(DB_PATH))
+    con = duckdb.connect(str(DB_PATH), config={
+        'threads': DUCKDB_THREADS,
+        'memory_limit': DUCKDB_MEMORY_LIMIT,
+        'preserve_insertion_order': False,
+    })
     _init_schema(con)
     return con
 
 
-def _migrate_columns(con):
-    """Add new columns to existing tables if they don't exist (safe migration)."""
-    def _add_col(table, col, col_type, default):
-        try:
-            con.execute(f"SELECT {col} FROM {table} LIMIT 0")
-        except Exception:
-            con.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_type} DEFAULT {default}")
+@contextmanager
+def transaction(con):
+    """Run a block of statements in one transaction, rolling back on error."""
+    con.execute("BEGIN TRANSACTION")
+    try:
+        yield con
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+
+
+@contextmanager
+def read_only(con):
+    """Yield a cursor of con inside a READ ONLY transaction (DuckDB 1.1+).
+
+    DuckDB rejects any write made through it, and as a separate cursor it
+    does not share the caller's transaction. Closing it rolls back.
+    """
+    cur = con.cursor()
+    try:
+        cur.execute("BEGIN TRANSACTION READ ONLY")
+        yield cur
+    finally:
+        cur.close()
+
+
+# Primary key sequences: (sequence, table, key column)
+_ID_SEQUENCES = [
+    ('cell_line_seq', 'cell_lines', 'cell_line_id'),
+    ('experiment_seq', 'chromatin_experiments', 'experiment_id'),
+    ('annotation_seq', 'regulatory_annotations', 'annotation_id'),
+]
+
+
+def _init_sequences(con):
+    """Create the primary key sequences, starting past any ids already stored."""
+    existing = {r[0] for r in con.execute(
+        "SELECT sequence_name FROM duckdb_sequences() WHERE database_name = current_database()"
+    ).fetchall()}
+    for seq, table, col in _ID_SEQUENCES:
+        if seq not in existing:
+            start = con.execute(f"SELECT COALESCE(MAX({col}), 0) + 1 FROM {table}").fetchone()[0]
+            con.execute(f"CREATE SEQUENCE {seq} START {start}")
 
-    # cell_lines migrations
-    _add_col('cell_lines', 'species', 'VARCHAR', "'Homo sapiens'")
-    _add_col('cell_lines', 'genome_assembly', 'VARCHAR', "'GRCh38'")
 
-    # chromatin_experiments migrations
-    for col in ['species', 'genome_assembly', 'treatment', 'treatment_duration',
-                'modification', 'condition', 'biosample_type', 'study', 'dataset_label']:
-        _add_col('chromatin_experiments', col, 'VARCHAR', "''")
+def _migrate_columns(con):
+    """Add new columns to existing tables if they don't exist (safe migration)."""
+    wanted = [
+        # cell_lines migrations
+        ('cell_lines', 'species', 'VARCHAR', "'Homo sapiens'"),
+        ('cell_lines', 'genome_assembly', 'VARCHAR', "'GRCh38'"),
+    ] + [
+        # chromatin_experiments migrations
+        ('chromatin_experiments', col, 'VARCHAR', "''")
+        for col in ['species', 'genome_assembly', 'treatment', 'treatment_duration',
+                    'modification', 'condition', 'biosample_type', 'study', 'dataset_label']
+    ]
+    # One catalog read instead of a probe query per column; DuckDB allows a
+    # single ADD COLUMN per ALTER, so only the missing ones are altered.
+    existing = set(con.execute("""
+        SELECT table_name, column_name FROM duckdb_columns()
+        WHERE database_name = current_database() AND schema_name = 'main'
+          AND table_name IN ('cell_lines', 'chromatin_experiments')
+    """).fetchall())
+    for table, col, col_type, default in wanted:
+        if (table, col) not in existing:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col} {col_type} DEFAULT {default}")
 
 
 def _init_schema(con):
@@ -129,51 +192,193 @@ def _init_schema(con):
         );
     """)
 
+    # File validation results, valid while a file's size and mtime are unchanged
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS validation_cache (
+            path VARCHAR PRIMARY KEY,
+            size BIGINT,
+            mtime_ns BIGINT,
+            kind VARCHAR,
+            valid BOOLEAN,
+            payload VARCHAR
+        );
+    """)
+
     # Migrate: add new columns if they don't exist yet
     _migrate_columns(con)
-
+    _init_sequences(con)
+
+    # Index the cell line upsert lookup. accession and cell_line_id are
+    # already indexed through their UNIQUE and FOREIGN KEY constraints.
+    try:
+        con.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cl_normalized ON cell_lines(cell_line_normalized)")
+    except duckdb.ConstraintException:
+        # Databases written before upserts were keyed strictly may hold duplicates
+        con.execute("CREATE INDEX IF NOT EXISTS idx_cl_normalized ON cell_lines(cell_line_normalized)")
+
+    # Aggregate each child table per cell line before joining, so chromatin
+    # rows are not multiplied by cCRE rows
     con.execute("""
         CREATE OR REPLACE VIEW paired_datasets AS
+        WITH ce_agg AS (
+            SELECT cell_line_id,
+                   COUNT(*) as chromatin_count,
+                   SUM(file_size_gb) as total_chromatin_gb
+            FROM chromatin_experiments
+            GROUP BY cell_line_id
+        ),
+        ra_agg AS (
+            SELECT cell_line_id,
+                   COUNT(*) as ccre_count,
+                   MAX(file_size_mb) as total_ccre_mb
+            FROM regulatory_annotations
+            GROUP BY cell_line_id
+        )
         SELECT
             cl.cell_line_name,
             cl.cell_line_normalized,
             cl.tissue_type,
             cl.species,
             cl.genome_assembly,
-            COUNT(DISTINCT ce.experiment_id) as chromatin_count,
-            COUNT(DISTINCT ra.annotation_id) as ccre_count,
-            COALESCE(SUM(DISTINCT ce.file_size_gb), 0) as total_chromatin_gb,
-            COALESCE(MAX(ra.file_size_mb), 0) as total_ccre_mb,
-            COALESCE(SUM(DISTINCT ce.file_size_gb), 0) + COALESCE(MAX(ra.file_size_mb), 0) / 1024 as total_size_gb
+            COALESCE(ce_agg.chromatin_count, 0) as chromatin_count,
+            COALESCE(ra_agg.ccre_count, 0) as ccre_count,
+            COALESCE(ce_agg.total_chromatin_gb, 0) as total_chromatin_gb,
+            COALESCE(ra_agg.total_ccre_mb, 0) as total_ccre_mb,
+            COALESCE(ce_agg.total_chromatin_gb, 0) + COALESCE(ra_agg.total_ccre_mb, 0) / 1024 as total_size_gb
+        FROM cell_lines cl
+        LEFT JOIN ce_agg ON cl.cell_line_id = ce_agg.cell_line_id
+        LEFT JOIN ra_agg ON cl.cell_line_id = ra_agg.cell_line_id
+        WHERE cl.has_ccre = TRUE AND cl.has_hic = TRUE;
+    """)
+
+    # One scan per table, each computing all of its counters at once.
+    # Readers use stats_summary, a view over the cached copy of this one.
+    con.execute("""
+        CREATE OR REPLACE VIEW stats_summary_live AS
+        WITH cl AS (
+            SELECT COUNT(*) as total_cell_lines,
+                   COUNT(*) FILTER (WHERE has_ccre AND has_hic) as paired_cell_lines,
+                   COUNT(DISTINCT species) as species_count,
+                   COUNT(*) FILTER (WHERE species = 'Homo sapiens') as human_cell_lines,
+                   COUNT(*) FILTER (WHERE species = 'Mus musculus') as mouse_cell_lines
+            FROM cell_lines
+        ),
+        ce AS (
+            SELECT COUNT(*) as total_chromatin,
+                   COALESCE(SUM(file_size_gb), 0) as total_chromatin_gb,
+                   COUNT(*) FILTER (WHERE download_status = 'downloaded') as downloaded_chromatin,
+                   COUNT(*) FILTER (WHERE COALESCE(treatment, '') != '') as treated_experiments,
+                   COUNT(*) FILTER (WHERE COALESCE(treatment, '') = '') as untreated_experiments
+            FROM chromatin_experiments
+        ),
+        ra AS (
+            SELECT COUNT(*) as total_ccre,
+                   COALESCE(SUM(file_size_mb), 0) as total_ccre_mb,
+                   COUNT(*) FILTER (WHERE download_status = 'downloaded') as downloaded_ccre
+            FROM regulatory_annotations
+        )
+        SELECT
+            cl.total_cell_lines,
+            cl.paired_cell_lines,
+            ce.total_chromatin,
+            ra.total_ccre,
+            ce.total_chromatin_gb,
+            ra.total_ccre_mb,
+            ce.downloaded_chromatin,
+            ra.downloaded_ccre,
+            cl.species_count,
+            cl.human_cell_lines,
+            cl.mouse_cell_lines,
+            ce.treated_experiments,
+            ce.untreated_experiments
+        FROM cl, ce, ra;
+    """)
+
+    # Per cell line totals for the list_cell_lines action
+    con.execute("""
+        CREATE OR REPLACE VIEW cell_line_summary_live AS
+        SELECT cl.cell_line_normalized as cell_line, cl.tissue_type as tissue,
+               cl.species, cl.genome_assembly, cl.biosample_type,
+               cl.has_ccre, cl.has_mcool, cl.total_experiments as replicates,
+               COALESCE(SUM(ce.file_size_gb), 0) as total_gb,
+               COUNT(DISTINCT CASE WHEN ce.treatment != '' AND ce.treatment IS NOT NULL
+                     THEN ce.experiment_id END) as treated_count,
+               COUNT(DISTINCT CASE WHEN ce.treatment = '' OR ce.treatment IS NULL
+                     THEN ce.experiment_id END) as untreated_count
         FROM cell_lines cl
         LEFT JOIN chromatin_experiments ce ON cl.cell_line_id = ce.cell_line_id
-        LEFT JOIN regulatory_annotations ra ON cl.cell_line_id = ra.cell_line_id
-        WHERE cl.has_ccre = TRUE AND cl.has_hic = TRUE
-        GROUP BY cl.cell_line_name, cl.cell_line_normalized, cl.tissue_type, cl.species, cl.genome_assembly;
+        GROUP BY cl.cell_line_normalized, cl.tissue_type, cl.species,
+                 cl.genome_assembly, cl.biosample_type, cl.has_ccre, cl.has_mcool,
+                 cl.total_experiments
     """)
 
+    # Every mcool x cCRE pairing of a paired cell line, for list_ml_ready
     con.execute("""
-        CREATE OR REPLACE VIEW stats_summary AS
+        CREATE OR REPLACE VIEW ml_ready_live AS
         SELECT
-            (SELECT COUNT(*) FROM cell_lines) as total_cell_lines,
-            (SELECT COUNT(*) FROM cell_lines WHERE has_ccre AND has_hic) as paired_cell_lines,
-            (SELECT COUNT(*) FROM chromatin_experiments) as total_chromatin,
-            (SELECT COUNT(*) FROM regulatory_annotations) as total_ccre,
-            (SELECT COALESCE(SUM(file_size_gb), 0) FROM chromatin_experiments) as total_chromatin_gb,
-            (SELECT COALESCE(SUM(file_size_mb), 0) FROM regulatory_annotations) as total_ccre_mb,
-            (SELECT COUNT(*) FROM chromatin_experiments WHERE download_status = 'downloaded') as downloaded_chromatin,
-            (SELECT COUNT(*) FROM regulatory_annotations WHERE download_status = 'downloaded') as downloaded_ccre,
-            (SELECT COUNT(DISTINCT species) FROM cell_lines) as species_count,
-            (SELECT COUNT(*) FROM cell_lines WHERE species = 'Homo sapiens') as human_cell_lines,
-            (SELECT COUNT(*) FROM cell_lines WHERE species = 'Mus musculus') as mouse_cell_lines,
-            (SELECT COUNT(*) FROM chromatin_experiments WHERE treatment != '' AND treatment IS NOT NULL) as treated_experiments,
-            (SELECT COUNT(*) FROM chromatin_experiments WHERE (treatment = '' OR treatment IS NULL)) as untreated_experiments;
+            cl.cell_line_normalized as cell_line,
+            cl.tissue_type as tissue,
+            cl.species,
+            cl.genome_assembly,
+            cl.biosample_type,
+            ce.accession as mcool_accession,
+            ce.file_size_gb as mcool_size_gb,
+            ce.download_url as mcool_url,
+            ce.treatment,
+            ce.modification,
+            ce.condition,
+            ce.download_status as mcool_status,
+            ra.accession as ccre_accession,
+            ra.file_size_mb as ccre_size_mb,
+            ra.download_url as ccre_url,
+            ra.assembly as ccre_assembly,
+            ra.download_status as ccre_status,
+            CASE
+                WHEN ce.download_status = 'downloaded' AND ra.download_status = 'downloaded'
+                THEN 'ready'
+                WHEN ce.download_status = 'downloaded' OR ra.download_status = 'downloaded'
+                THEN 'partial'
+                ELSE 'pending'
+            END as ml_status
+        FROM cell_lines cl
+        JOIN chromatin_experiments ce ON cl.cell_line_id = ce.cell_line_id
+        JOIN regulatory_annotations ra ON cl.cell_line_id = ra.cell_line_id
+        WHERE cl.has_ccre = TRUE AND cl.has_mcool = TRUE
     """)
 
+    # The stored summaries are built here only when missing; the writes that
+    # change their inputs refresh them through refresh_materialized_views
+    for table, view in _MATERIALIZED_VIEWS:
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM {view}")
+    con.execute("CREATE OR REPLACE VIEW stats_summary AS SELECT * FROM stats_summary_cache")
+
+
+# Tables holding a stored copy of a live view: (table, view)
+_MATERIALIZED_VIEWS = [
+    ('stats_summary_cache', 'stats_summary_live'),
+    ('mv_cell_line_summary', 'cell_line_summary_live'),
+    ('mv_ml_ready', 'ml_ready_live'),
+]
+
+
+def refresh_materialized_views(con):
+    """Recompute the stored copies of the summary views.
+
+    Called after every write that changes the tables they read, so the UI's
+    dashboard reads don't re-aggregate on each request. The upsert_* and
+    bulk_upsert_* writers leave this to update_cell_line_flags, which every
+    load ends with.
+    """
+    for table, view in _MATERIALIZED_VIEWS:
+        con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM {view}")
+
 
 def upsert_cell_line(con, name, normalized, tissue='Unknown', organism='human',
                      species='Homo sapiens', genome_assembly='', biosample_type=''):
-    """Insert or update a cell line, return its ID."""
+    """Insert or update a cell line, return its ID.
+
+    Doesn't refresh the summary tables; finish with update_cell_line_flags.
+    """
     existing = con.execute(
         "SELECT cell_line_id FROM cell_lines WHERE cell_line_normalized = ?",
         [normalized]
@@ -193,19 +398,20 @@ def upsert_cell_line(con, name, normalized, tissue='Unknown', organism='human',
                         [biosample_type, cl_id])
         return cl_id
 
-    max_id = con.execute("SELECT COALESCE(MAX(cell_line_id), 0) FROM cell_lines").fetchone()[0]
-    new_id = max_id + 1
-    con.execute(
+    return con.execute(
         """INSERT INTO cell_lines (cell_line_id, cell_line_name, cell_line_normalized,
            tissue_type, organism, species, genome_assembly, biosample_type)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-        [new_id, name, normalized, tissue, organism, species, genome_assembly, biosample_type]
-    )
-    return new_id
+           VALUES (nextval('cell_line_seq'), ?, ?, ?, ?, ?, ?, ?)
+           RETURNING cell_line_id""",
+        [name, normalized, tissue, organism, species, genome_assembly, biosample_type]
+    ).fetchone()[0]
 
 
 def upsert_chromatin_experiment(con, data):
-    """Insert or update a chromatin experiment record."""
+    """Insert or update a chromatin experiment record.
+
+    Doesn't refresh the summary tables; finish with update_cell_line_flags.
+    """
     existing = con.execute(
         "SELECT experiment_id FROM chromatin_experiments WHERE accession = ?",
         [data['accession']]
@@ -227,18 +433,16 @@ def upsert_chromatin_experiment(con, data):
             con.execute(f"UPDATE chromatin_experiments SET {', '.join(updates)} WHERE experiment_id = ?", vals)
         return exp_id
 
-    max_id = con.execute("SELECT COALESCE(MAX(experiment_id), 0) FROM chromatin_experiments").fetchone()[0]
-    new_id = max_id + 1
-
-    con.execute("""
+    return con.execute("""
         INSERT INTO chromatin_experiments
         (experiment_id, accession, cell_line_id, cell_line_name, cell_line_raw, source,
          file_format, file_size_bytes, file_size_gb, experiment_set, href, download_url,
          species, genome_assembly, treatment, treatment_duration, modification,
          condition, biosample_type, study, dataset_label)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        VALUES (nextval('experiment_seq'), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING experiment_id
     """, [
-        new_id, data['accession'], data.get('cell_line_id'),
+        data['accession'], data.get('cell_line_id'),
         data.get('cell_line_name', ''), data.get('cell_line_raw', ''),
         data.get('source', '4DN'), data.get('file_format', 'mcool'),
         data.get('file_size_bytes', 0), data.get('file_size_bytes', 0) / (1024**3),
@@ -247,65 +451,274 @@ def upsert_chromatin_experiment(con, data):
         data.get('treatment', ''), data.get('treatment_duration', ''),
         data.get('modification', ''), data.get('condition', ''),
         data.get('biosample_type', ''), data.get('study', ''), data.get('dataset_label', ''),
-    ])
-    return new_id
+    ]).fetchone()[0]
 
 
 def upsert_regulatory_annotation(con, data):
-    """Insert or update a regulatory annotation record."""
-    existing = con.execute(
-        "SELECT annotation_id FROM regulatory_annotations WHERE accession = ?",
-        [data['accession']]
-    ).fetchone()
+    """Insert a regulatory annotation record if new, return its ID.
 
-    if existing:
-        return existing[0]
-
-    max_id = con.execute("SELECT COALESCE(MAX(annotation_id), 0) FROM regulatory_annotations").fetchone()[0]
-    new_id = max_id + 1
-
-    con.execute("""
+    Existing accessions are left unchanged; only for those is a second
+    query needed to look up the ID. Doesn't refresh the summary tables;
+    finish with update_cell_line_flags.
+    """
+    inserted = con.execute("""
         INSERT INTO regulatory_annotations
         (annotation_id, accession, cell_line_id, cell_line_name, file_format,
          file_size_bytes, file_size_mb, assembly, href, download_url, output_type)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        VALUES (nextval('annotation_seq'), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (accession) DO NOTHING
+        RETURNING annotation_id
     """, [
-        new_id, data['accession'], data.get('cell_line_id'),
+        data['accession'], data.get('cell_line_id'),
         data.get('cell_line_name', ''), data.get('file_format', 'bed.gz'),
         data.get('file_size_bytes', 0), data.get('file_size_bytes', 0) / (1024**2),
         data.get('assembly', 'GRCh38'), data.get('href', ''),
         data.get('download_url', ''), data.get('output_type', '')
-    ])
-    return new_id
+    ]).fetchone()
+    if inserted:
+        return inserted[0]
+    return con.execute(
+        "SELECT annotation_id FROM regulatory_annotations WHERE accession = ?",
+        [data['accession']]
+    ).fetchone()[0]
+
+
+def bulk_upsert_cell_lines(con, df):
+    """Insert or update many cell lines in one pass from a DataFrame.
+
+    Expects columns: name, normalized, tissue, organism, species,
+    genome_assembly, biosample_type. Row order matters the same way it does
+    for repeated ``upsert_cell_line`` calls: the first row for a normalized
+    name creates it, later non-empty values update it.
+    """
+    con.register('stage_cl', df.assign(_ord=range(len(df))))
+    try:
+        con.execute("""
+            INSERT INTO cell_lines (cell_line_id, cell_line_name, cell_line_normalized,
+               tissue_type, organism, species, genome_assembly, biosample_type)
+            SELECT nextval('cell_line_seq'),
+                   s.name, s.normalized, s.tissue, s.organism, s.species,
+                   s.genome_assembly, s.biosample_type
+            FROM (
+                SELECT normalized, MIN(_ord) as first_ord,
+                       arg_min(name, _ord) as name,
+                       arg_min(tissue, _ord) as tissue,
+                       arg_min(organism, _ord) as organism,
+                       arg_min(species, _ord) as species,
+                       arg_min(genome_assembly, _ord) as genome_assembly,
+                       arg_min(biosample_type, _ord) as biosample_type
+                FROM stage_cl
+                GROUP BY normalized
+                ORDER BY first_ord
+            ) s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM cell_lines cl WHERE cl.cell_line_normalized = s.normalized
+            )
+        """)
+        # Update species/assembly/biosample if we have better info
+        con.execute("""
+            UPDATE cell_lines SET
+                species = COALESCE(s.species, cell_lines.species),
+                organism = COALESCE(s.organism, cell_lines.organism),
+                genome_assembly = COALESCE(s.genome_assembly, cell_lines.genome_assembly),
+                biosample_type = COALESCE(s.biosample_type, cell_lines.biosample_type)
+            FROM (
+                SELECT normalized,
+                       arg_max(species, _ord) FILTER (WHERE species != '' AND species != 'Homo sapiens') as species,
+                       arg_max(organism, _ord) FILTER (WHERE species != '' AND species != 'Homo sapiens') as organism,
+                       arg_max(genome_assembly, _ord) FILTER (WHERE genome_assembly != '') as genome_assembly,
+                       arg_max(biosample_type, _ord) FILTER (WHERE biosample_type != '') as biosample_type
+                FROM stage_cl
+                GROUP BY normalized
+            ) s
+            WHERE cell_lines.cell_line_normalized = s.normalized
+        """)
+    finally:
+        con.unregister('stage_cl')
+
+
+def bulk_upsert_chromatin_experiments(con, df):
+    """Insert or update many chromatin experiments in one pass from a DataFrame.
+
+    Expects the ``upsert_chromatin_experiment`` keys as columns, with
+    ``cell_line_name`` holding the normalized cell line used to resolve
+    ``cell_line_id``. New accessions are inserted from their first row;
+    existing ones get their non-empty metadata updated.
+    """
+    con.register('stage_exp', df.assign(_ord=range(len(df))))
+    try:
+        con.execute("""
+            INSERT INTO chromatin_experiments
+            (experiment_id, accession, cell_line_id, cell_line_name, cell_line_raw, source,
+             file_format, file_size_bytes, file_size_gb, experiment_set, href, download_url,
+             species, genome_assembly, treatment, treatment_duration, modification,
+             condition, biosample_type, study, dataset_label)
+            SELECT nextval('experiment_seq'),
+                   s.accession,
+                   (SELECT MIN(cl.cell_line_id) FROM cell_lines cl
+                    WHERE cl.cell_line_normalized = s.cell_line_name),
+                   s.cell_line_name, s.cell_line_raw, s.source, s.file_format,
+                   s.file_size_bytes, s.file_size_bytes / (1024 * 1024 * 1024),
+                   s.experiment_set, s.href, s.download_url,
+                   s.species, s.genome_assembly, s.treatment, s.treatment_duration,
+                   s.modification, s.condition, s.biosample_type, s.study, s.dataset_label
+            FROM (
+                SELECT * FROM stage_exp
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY accession ORDER BY _ord) = 1
+                ORDER BY _ord
+            ) s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM chromatin_experiments ce WHERE ce.accession = s.accession
+            )
+        """)
+        # Update metadata if we have new info
+        cols = ['species', 'genome_assembly', 'treatment', 'treatment_duration',
+                'modification', 'condition', 'biosample_type', 'study', 'dataset_label']
+        latest = ', '.join(
+            f"arg_max({c}, _ord) FILTER (WHERE {c} != '') as {c}" for c in cols
+        )
+        sets = ', '.join(f"{c} = COALESCE(s.{c}, chromatin_experiments.{c})" for c in cols)
+        con.execute(f"""
+            UPDATE chromatin_experiments SET {sets}
+            FROM (SELECT accession, {latest} FROM stage_exp GROUP BY accession) s
+            WHERE chromatin_experiments.accession = s.accession
+        """)
+    finally:
+        con.unregister('stage_exp')
+
+
+def bulk_upsert_regulatory_annotations(con, df):
+    """Insert many regulatory annotations in one pass from a DataFrame.
+
+    Expects the ``upsert_regulatory_annotation`` keys as columns, with
+    ``cell_line_name`` holding the normalized cell line used to resolve
+    ``cell_line_id``. As with ``upsert_regulatory_annotation``, accessions
+    already stored are left unchanged.
+    """
+    con.register('stage_ra', df.assign(_ord=range(len(df))))
+    try:
+        con.execute("""
+            INSERT INTO regulatory_annotations
+            (annotation_id, accession, cell_line_id, cell_line_name, file_format,
+             file_size_bytes, file_size_mb, assembly, href, download_url, output_type)
+            SELECT nextval('annotation_seq'),
+                   s.accession,
+                   (SELECT MIN(cl.cell_line_id) FROM cell_lines cl
+                    WHERE cl.cell_line_normalized = s.cell_line_name),
+                   s.cell_line_name, s.file_format,
+                   s.file_size_bytes, s.file_size_bytes / (1024 * 1024),
+                   s.assembly, s.href, s.download_url, s.output_type
+            FROM (
+                SELECT * FROM stage_ra
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY accession ORDER BY _ord) = 1
+                ORDER BY _ord
+            ) s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM regulatory_annotations ra WHERE ra.accession = s.accession
+            )
+        """)
+    finally:
+        con.unregister('stage_ra')
 
 
 def update_cell_line_flags(con):
-    """Update has_hic, has_ccre, total_experiments flags on cell_lines."""
+    """Update has_hic, has_ccre, total_experiments flags on cell_lines.
+
+    Each child table is aggregated once, and only rows whose flags change
+    are rewritten.
+    """
     con.execute("""
         UPDATE cell_lines SET
-            has_hic = (cell_line_id IN (SELECT DISTINCT cell_line_id FROM chromatin_experiments WHERE cell_line_id IS NOT NULL)),
-            has_ccre = (cell_line_id IN (SELECT DISTINCT cell_line_id FROM regulatory_annotations WHERE cell_line_id IS NOT NULL)),
-            has_mcool = (cell_line_id IN (SELECT DISTINCT cell_line_id FROM chromatin_experiments WHERE file_format = 'mcool' AND cell_line_id IS NOT NULL)),
-            total_experiments = (SELECT COUNT(*) FROM chromatin_experiments ce WHERE ce.cell_line_id = cell_lines.cell_line_id)
+            has_hic = f.has_hic,
+            has_ccre = f.has_ccre,
+            has_mcool = f.has_mcool,
+            total_experiments = f.total_experiments
+        FROM (
+            SELECT cl.cell_line_id,
+                   ce.n IS NOT NULL as has_hic,
+                   ra.cell_line_id IS NOT NULL as has_ccre,
+                   COALESCE(ce.has_mcool, FALSE) as has_mcool,
+                   COALESCE(ce.n, 0) as total_experiments
+            FROM cell_lines cl
+            LEFT JOIN (
+                SELECT cell_line_id, COUNT(*) as n, bool_or(file_format = 'mcool') as has_mcool
+                FROM chromatin_experiments
+                WHERE cell_line_id IS NOT NULL
+                GROUP BY cell_line_id
+            ) ce ON ce.cell_line_id = cl.cell_line_id
+            LEFT JOIN (
+                SELECT DISTINCT cell_line_id FROM regulatory_annotations
+                WHERE cell_line_id IS NOT NULL
+            ) ra ON ra.cell_line_id = cl.cell_line_id
+        ) f
+        WHERE cell_lines.cell_line_id = f.cell_line_id
+          AND (cell_lines.has_hic IS DISTINCT FROM f.has_hic
+               OR cell_lines.has_ccre IS DISTINCT FROM f.has_ccre
+               OR cell_lines.has_mcool IS DISTINCT FROM f.has_mcool
+               OR cell_lines.total_experiments IS DISTINCT FROM f.total_experiments)
     """)
+    refresh_materialized_views(con)
 
 
 def mark_downloaded(con, accession, local_path, file_type='chromatin'):
     """Mark a file as downloaded."""
-    if file_type == 'chromatin':
-        con.execute(
-            "UPDATE chromatin_experiments SET download_status = 'downloaded', local_path = ?, date_downloaded = CURRENT_TIMESTAMP WHERE accession = ?",
-            [str(local_path), accession]
-        )
-    else:
-        con.execute(
-            "UPDATE regulatory_annotations SET download_status = 'downloaded', local_path = ? WHERE accession = ?",
-            [str(local_path), accession]
-        )
-
-
-def export_parquet(con, table_name, output_path):
-    """Export a table to Parquet format."""
+    mark_downloaded_many(con, [(accession, local_path, file_type)])
+
+
+def mark_downloaded_many(con, rows):
+    """Mark many files as downloaded in one statement per table.
+
+    rows are (accession, local_path, file_type) tuples as for mark_downloaded;
+    the last row wins if an accession repeats.
+    """
+    by_table = {'chromatin': {}, 'regulatory': {}}
+    for accession, local_path, file_type in rows:
+        by_table['chromatin' if file_type == 'chromatin' else 'regulatory'][accession] = str(local_path)
+
+    with transaction(con):
+        for file_type, paths in by_table.items():
+            if not paths:
+                continue
+            if file_type == 'chromatin':
+                table, extra = 'chromatin_experiments', ', date_downloaded = CURRENT_TIMESTAMP'
+            else:
+                table, extra = 'regulatory_annotations', ''
+            con.execute(f"""
+                UPDATE {table} SET download_status = 'downloaded', local_path = s.local_path{extra}
+                FROM (SELECT unnest(?::VARCHAR[]) AS accession, unnest(?::VARCHAR[]) AS local_path) s
+                WHERE {table}.accession = s.accession
+            """, [list(paths), list(paths.values())])
+        refresh_materialized_views(con)
+
+
+def load_validation_cache(con, paths):
+    """Return {path: (size, mtime_ns, kind, payload)} for cached validations of paths."""
+    if not paths:
+        return {}
+    rows = con.execute("""
+        SELECT v.path, v.size, v.mtime_ns, v.kind, v.payload
+        FROM validation_cache v
+        JOIN (SELECT unnest(?::VARCHAR[]) AS path) p USING (path)
+    """, [list(paths)]).fetchall()
+    return {r[0]: r[1:] for r in rows}
+
+
+def save_validation_cache(con, rows):
+    """Store validation results as (path, size, mtime_ns, kind, valid, payload) tuples."""
+    con.executemany("INSERT OR REPLACE INTO validation_cache VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def export_parquet(con, table_name, output_path, codec='zstd', row_group_size=1_000_000,
+                   compression_level=3):
+    """Export a table to Parquet format.
+
+    ZSTD at a low level gives smaller files than DuckDB's default Snappy at
+    similar write speed; large row groups keep the footer metadata small.
+    compression_level only applies to ZSTD and is ignored for other codecs.
+    """
     output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    con.execute(f"COPY {table_name} TO '{output_path}' (FORMAT PARQUET)")
+    options = f"FORMAT PARQUET, CODEC '{codec}', ROW_GROUP_SIZE {int(row_group_size)}"
+    if codec.lower() == 'zstd':
+        options += f", COMPRESSION_LEVEL {int(compression_level)}"
+    con.execute(f"COPY {table_name} TO '{output_path}' ({options})")
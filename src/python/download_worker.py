@@ -6,19 +6,29 @@ Runs as a detached nohup process to download datasets in the background.
 Does NOT use DuckDB — all task info (URLs, paths) is pre-resolved by the
 IPC layer and passed as a JSON task list. This avoids DuckDB's single-writer lock.
 
-Writes progress to a JSON job file that the UI can poll.
+Writes progress to a JSON job file that the UI can poll. Per-file progress
+is appended to a sibling <job>.jsonl event log instead of rewriting the job
+file; load_job() folds the events back into the snapshot.
 
 Usage:
   python3 download_worker.py <job_id> <job_file> <tasks_json_file>
 """
 
 import sys
-import json
 import os
+import shutil
 import signal
+import threading
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import urlparse
+
 
 # Load .env from project root if available
 try:
@@ -29,39 +39,245 @@ except ImportError:
 
 FOURDN_ACCESS_ID = os.getenv('FOURDN_ACCESS_ID', '')
 FOURDN_SECRET_KEY = os.getenv('FOURDN_SECRET_KEY', '')
+MAX_PARALLEL = int(os.getenv('MAX_PARALLEL_DOWNLOADS', '3'))
+# Cap on connections open to any one host, whatever MAX_PARALLEL is; every
+# request, including each byte range of a segmented download, holds one
+HOST_CONNECTIONS = 8
+# Files at least this large are fetched as SEGMENTS concurrent byte ranges
+SEGMENT_MIN_SIZE = 256 * 1024 * 1024
+SEGMENTS = 4
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def _make_session():
+    """Session shared by all download threads, so connections are kept alive.
+
+    The pool holds a connection per worker thread; a smaller pool would
+    discard connections and pay a new TLS handshake for the next file.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=max(32, MAX_PARALLEL),
+                          max_retries=Retry(total=3, backoff_factor=0.5,
+                                            status_forcelist=[429, 500, 502, 503, 504],
+                                            allowed_methods=['GET', 'HEAD'],
+                                            raise_on_status=False))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+SESSION = _make_session()
 
 
-def update_job(job_file, updates):
+@contextmanager
+def host_slots(url):
+    """Hold one of the HOST_CONNECTIONS connection slots for url's host."""
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        slots = _host_slots.setdefault(host, threading.BoundedSemaphore(HOST_CONNECTIONS))
+    with slots:
+        yield
+
+
+# The job file's counters are refreshed once per this many finished files
+SNAPSHOT_EVERY = 50
+# Progress events are buffered and appended to the log at most this often
+FLUSH_INTERVAL = 0.25
+
+
+def events_path(job_file):
+    """Path of the JSONL progress event log that belongs to job_file."""
+    return str(Path(job_file).with_suffix('.jsonl'))
+
+
+def snapshot_job(job_file, updates):
     """Atomically update the job status file."""
     try:
         if Path(job_file).exists():
-            with open(job_file, 'r') as f:
-                job = json.load(f)
+            with open(job_file, 'rb') as f:
+                job = orjson.loads(f.read())
         else:
             job = {}
         job.update(updates)
         job['updated_at'] = datetime.now().isoformat()
         tmp = job_file + '.tmp'
-        with open(tmp, 'w') as f:
-            json.dump(job, f, default=str)
+        with open(tmp, 'wb') as f:
+            f.write(orjson.dumps(job, default=str))
         os.replace(tmp, job_file)
     except Exception:
         pass
 
 
-def download_file(url, out_path, file_type='mcool', resume=True):
+def load_job(job_file):
+    """Read a job snapshot and apply the progress events logged after it.
+
+    The snapshot's event_count says how many events it already includes
+    (only final snapshots carry results). Later events update the counters
+    and append their per-file result.
+    """
+    with open(job_file, 'rb') as f:
+        job = orjson.loads(f.read())
+    try:
+        with open(events_path(job_file), 'rb') as f:
+            lines = f.readlines()[job.get('event_count', 0):]
+    except FileNotFoundError:
+        return job
+    results = job.setdefault('results', [])
+    for line in lines:
+        try:
+            event = orjson.loads(line)
+        except ValueError:
+            continue  # a line still being written
+        result = event.pop('result', None)
+        if result is not None:
+            results.append(result)
+        job.update(event)
+    return job
+
+
+class JobWriter:
+    """Writes one job's snapshots and progress events for all download threads.
+
+    Events are buffered and appended to the log in a single write once
+    FLUSH_INTERVAL has passed since the first unwritten one, so parallel
+    downloads don't each open the log. snapshot() flushes pending events
+    before updating the job file.
+    """
+
+    def __init__(self, job_file):
+        self.job_file = job_file
+        self.events = 0  # events written to the log so far
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def event(self, event):
+        """Queue one progress event for the log."""
+        with self._lock:
+            self._pending.append(event)
+            if self._timer is None:
+                self._timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Append any queued events to the log now."""
+        with self._lock:
+            self._flush()
+
+    def snapshot(self, updates, final=False):
+        """Flush events, then rewrite the job file with updates applied.
+
+        A final snapshot records how many events it covers, so load_job
+        doesn't apply them twice; earlier ones leave event_count alone.
+        """
+        with self._lock:
+            self._flush()
+            if final:
+                updates = {**updates, 'event_count': self.events}
+            snapshot_job(self.job_file, updates)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        data = b''.join(orjson.dumps(event, default=str) + b'\n' for event in self._pending)
+        try:
+            with open(events_path(self.job_file), 'ab') as f:
+                f.write(data)
+        except Exception:
+            pass
+        self.events += len(self._pending)
+        self._pending = []
+
+
+def probe_ranges(url, auth=None):
+    """Return (final_url, size) if the server honours byte ranges for url, else None.
+
+    Probes with a one-byte ranged GET rather than HEAD: 4DN redirects to
+    presigned S3 URLs that are only signed for GET.
+    """
+    with host_slots(url), SESSION.get(url, headers={'Range': 'bytes=0-0', 'Accept-Encoding': 'identity'},
+                                      auth=auth, stream=True, timeout=60, allow_redirects=True) as resp:
+        content_range = resp.headers.get('content-range', '')
+        if resp.status_code != 206 or '/' not in content_range:
+            return None
+        total = content_range.rsplit('/', 1)[1]
+        return (resp.url, int(total)) if total.isdigit() else None
+
+
+def download_file_ranged(url, out_path, size, auth=None, parts=SEGMENTS):
+    """Download url as `parts` concurrent byte ranges into a preallocated file.
+
+    Ranges are written with os.pwrite into <out>.part, which is renamed over
+    out_path only once every range is complete, so an interrupted run never
+    leaves a full-size file that resume would take for a finished one.
+    Raises on failure.
+    """
+    out = Path(out_path)
+    part = out.with_name(out.name + '.part')
+    step = -(-size // parts)
+    ranges = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+    def fetch(start, end):
+        headers = {'Range': f'bytes={start}-{end}', 'Accept-Encoding': 'identity'}
+        with host_slots(url), SESSION.get(url, headers=headers, auth=auth, stream=True,
+                                          timeout=120) as resp:
+            resp.raise_for_status()
+            if resp.status_code != 206:
+                raise IOError(f"server ignored Range bytes={start}-{end}")
+            offset = start
+            for chunk in resp.iter_content(chunk_size=1024 * 1024):
+                offset += os.pwrite(fd, chunk, offset)
+        if offset != end + 1:
+            raise IOError(f"short read for bytes={start}-{end}: {offset - start} bytes")
+
+    fd = os.open(part, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            # Reserve the blocks up front so the ranges don't fragment the file
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+            with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                for future in [pool.submit(fetch, a, b) for a, b in ranges]:
+                    future.result()
+        finally:
+            os.close(fd)
+        os.replace(part, out)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    return str(out)
+
+
+def download_file(url, out_path, file_type='mcool', resume=True, size=0):
     """Download a file with resume support. Uses 4DN auth for mcool files.
+
+    size is the expected byte count from the task, if known. A file already
+    that size is taken as complete without a request. Files of
+    SEGMENT_MIN_SIZE or more (or of unknown size) on servers that honour
+    ranges go through download_file_ranged.
     Returns path on success, None on failure."""
     if not url:
         return None
     out = Path(out_path)
     out.parent.mkdir(parents=True, exist_ok=True)
 
-    headers = {}
+    # Files are stored exactly as served; never have them gzip-encoded in transit
+    headers = {'Accept-Encoding': 'identity'}
     mode = 'wb'
     existing = 0
     if resume and out.exists():
         existing = out.stat().st_size
+        if size and existing == size:
+            # Already complete; skip the request that would only return 416
+            return str(out)
         if existing > 0:
             headers['Range'] = f'bytes={existing}-'
             mode = 'ab'
@@ -72,17 +288,30 @@ def download_file(url, out_path, file_type='mcool', resume=True):
         auth = (FOURDN_ACCESS_ID, FOURDN_SECRET_KEY)
 
     try:
-        resp = requests.get(url, headers=headers, auth=auth, stream=True,
-                            timeout=120, allow_redirects=True)
-        if resp.status_code == 416:
-            # Already complete
-            return str(out)
-        resp.raise_for_status()
+        if existing == 0 and not (size and size < SEGMENT_MIN_SIZE):
+            probe = probe_ranges(url, auth)
+            if probe and probe[1] >= SEGMENT_MIN_SIZE:
+                # Ranges go straight to the post-redirect URL; presigned
+                # S3 URLs carry their own signature and take no auth
+                final_url, total = probe
+                same_host = urlparse(final_url).netloc == urlparse(url).netloc
+                return download_file_ranged(final_url, out, total, auth if same_host else None)
+
+        # Closing the response hands its connection back to the pool
+        with host_slots(url), SESSION.get(url, headers=headers, auth=auth, stream=True,
+                                          timeout=120, allow_redirects=True) as resp:
+            if resp.status_code == 416:
+                # Already complete
+                return str(out)
+            resp.raise_for_status()
 
-        with open(out, mode) as f:
-            for chunk in resp.iter_content(chunk_size=8 * 1024 * 1024):
-                if chunk:
-                    f.write(chunk)
+            if resp.status_code != 206:
+                mode = 'wb'  # Range ignored; the body is the whole file
+
+            # Copy the raw socket stream in C; bytes land on disk as served
+            resp.raw.decode_content = False
+            with open(out, mode) as f:
+                shutil.copyfileobj(resp.raw, f, length=1024 * 1024)
         return str(out)
     except Exception as e:
         print(f"Download error for {url}: {e}", file=sys.stderr)
@@ -100,10 +329,10 @@ def main():
 
     # Read pre-resolved tasks from file
     try:
-        with open(tasks_file, 'r') as f:
-            tasks = json.load(f)
+        with open(tasks_file, 'rb') as f:
+            tasks = orjson.loads(f.read())
     except Exception as e:
-        update_job(job_file, {'status': 'error', 'error': f'Failed to read tasks: {e}'})
+        snapshot_job(job_file, {'status': 'error', 'error': f'Failed to read tasks: {e}'})
         sys.exit(1)
 
     total_tasks = len(tasks)
@@ -116,8 +345,10 @@ def main():
     signal.signal(signal.SIGTERM, handle_signal)
     signal.signal(signal.SIGINT, handle_signal)
 
-    # Initialize job file
-    update_job(job_file, {
+    # Initialize job file and start a fresh event log
+    open(events_path(job_file), 'w').close()
+    writer = JobWriter(job_file)
+    writer.snapshot({
         'job_id': job_id,
         'status': 'running',
         'pid': os.getpid(),
@@ -128,76 +359,104 @@ def main():
         'failed': 0,
         'current': '',
         'results': [],
+        'event_count': 0,
         'cell_lines': list(set(t.get('cell_line', '') for t in tasks)),
     })
 
     results = []
     completed = 0
     failed = 0
+    progress = {}
 
-    for i, task in enumerate(tasks):
-        if cancelled[0]:
-            update_job(job_file, {
-                'status': 'cancelled',
-                'completed': completed,
-                'failed': failed,
-                'results': results,
-            })
-            sys.exit(0)
-
-        update_job(job_file, {
+    def run_task(i, task):
+        nonlocal progress
+        progress = {
             'current': f"[{i+1}/{total_tasks}] {task.get('type','')} {task.get('cell_line','')} ({task.get('accession','')})",
             'current_idx': i,
-            'completed': completed,
-            'failed': failed,
-        })
+        }
+        writer.event(progress)
+        return download_file(
+            task.get('url', ''),
+            task.get('path', ''),
+            file_type=task.get('type', 'mcool'),
+            resume=True,
+            size=task.get('size') or 0,
+        )
 
-        try:
-            result_path = download_file(
-                task.get('url', ''),
-                task.get('path', ''),
-                file_type=task.get('type', 'mcool'),
-                resume=True,
-            )
-            success = result_path is not None
-            if success:
-                completed += 1
-            else:
-                failed += 1
-            results.append({
-                'type': task.get('type', ''),
-                'cell_line': task.get('cell_line', ''),
-                'accession': task.get('accession', ''),
-                'success': success,
-                'path': result_path,
-                'size_gb': task.get('size_gb', 0),
-            })
-        except Exception as e:
-            failed += 1
-            results.append({
-                'type': task.get('type', ''),
-                'cell_line': task.get('cell_line', ''),
-                'accession': task.get('accession', ''),
-                'success': False,
-                'error': str(e),
-            })
-
-        # Update progress after each file
-        update_job(job_file, {
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as executor:
+        futures = {executor.submit(run_task, i, task): task for i, task in enumerate(tasks)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            if cancelled[0]:
+                # Drop queued files; the ones in flight still finish and are recorded
+                for future in pending:
+                    future.cancel()
+
+            for future in done:
+                if future.cancelled():
+                    continue
+                task = futures[future]
+                try:
+                    result_path = future.result()
+                    success = result_path is not None
+                    if success:
+                        completed += 1
+                    else:
+                        failed += 1
+                    results.append({
+                        'type': task.get('type', ''),
+                        'cell_line': task.get('cell_line', ''),
+                        'accession': task.get('accession', ''),
+                        'success': success,
+                        'path': result_path,
+                        'size_gb': task.get('size_gb', 0),
+                    })
+                except Exception as e:
+                    failed += 1
+                    results.append({
+                        'type': task.get('type', ''),
+                        'cell_line': task.get('cell_line', ''),
+                        'accession': task.get('accession', ''),
+                        'success': False,
+                        'error': str(e),
+                    })
+
+                # Log progress after each file. Periodic snapshots carry only the
+                # counters; the results list is written once, in the final snapshot,
+                # and until then load_job rebuilds it from the event log.
+                writer.event({
+                    'completed': completed,
+                    'failed': failed,
+                    'result': results[-1],
+                })
+                if len(results) % SNAPSHOT_EVERY == 0:
+                    writer.snapshot({
+                        **progress,
+                        'completed': completed,
+                        'failed': failed,
+                    })
+
+    if cancelled[0]:
+        writer.snapshot({
+            'status': 'cancelled',
+            **progress,
             'completed': completed,
             'failed': failed,
             'results': results,
-        })
+        }, final=True)
+        sys.exit(0)
 
     # Done
-    update_job(job_file, {
+    writer.snapshot({
+        **progress,
         'status': 'done',
         'completed': completed,
         'failed': failed,
         'finished_at': datetime.now().isoformat(),
         'current': '',
         'results': results,
-    })
+    }, final=True)
 
 
 if __name__ == '__main__':
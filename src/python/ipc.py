@@ -11,760 +11,1043 @@ Protocol:
 """
 
 import sys
+import atexit
+import gzip
 import json
 import os
+import re
+import signal
+import subprocess
+import threading
 import traceback
+import uuid
+from datetime import datetime
 from pathlib import Path
+import orjson
 from dotenv import load_dotenv
 
 # Ensure we can import sibling modules
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
-load_dotenv(Path(__file__).resolve().parent.parent.parent / '.env')
+_ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+_ENV_PATH = _ROOT_DIR / '.env'
+sys.path.insert(0, str(_ROOT_DIR))
+load_dotenv(_ENV_PATH)
 
 from src.python import db
-from src.python.data_manager import DataManager, _sizeof_fmt
+from src.python.data_manager import DataManager, DownloadTask, _sizeof_fmt, _sql_quote
+from src.python.download_worker import events_path, load_job, snapshot_job
+
+# Resolved once per process; update_config refreshes them if DATA_DIR changes.
+_DATA_DIR = Path(os.getenv("DATA_DIR", "./data"))
+_JOBS_DIR = _DATA_DIR / "jobs"
+_DOWNLOADS_DIR = _DATA_DIR / "downloads"
+
+
+def _dumps(obj, newline=False):
+    """Serialize obj to JSON bytes with orjson.
+
+    Datetimes and anything else orjson can't encode natively go through
+    str(), as with json.dumps(default=str); payloads orjson rejects outright
+    (e.g. integers beyond 64 bits) fall back to the stdlib encoder.
+    newline=True ends the output with a line break.
+    """
+    option = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+              | orjson.OPT_PASSTHROUGH_DATETIME)
+    if newline:
+        option |= orjson.OPT_APPEND_NEWLINE
+    try:
+        return orjson.dumps(obj, default=str, option=option)
+    except TypeError:
+        return (json.dumps(obj, default=str) + ('\n' if newline else '')).encode()
+
+
+def _write_json(path, obj):
+    """Write obj as JSON to path via a temp file, so readers never see it half-written."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(_dumps(obj))
+    os.replace(tmp, path)
+
+
+# Progress lines on stderr are flushed at most this often, unless
+# IPC_UNBUFFERED=1 asks for a flush after every line
+PROGRESS_FLUSH_INTERVAL = 0.1
+_UNBUFFERED = os.getenv('IPC_UNBUFFERED') == '1'
+_progress_lock = threading.Lock()
+_progress_timer = None
+# Latest unwritten download progress event per accession
+_pending_downloads = {}
+
+
+def _flush_progress():
+    """Write queued download progress and flush buffered progress lines to stderr."""
+    global _progress_timer
+    with _progress_lock:
+        if _progress_timer is not None:
+            _progress_timer.cancel()
+            _progress_timer = None
+        pending = list(_pending_downloads.values())
+        _pending_downloads.clear()
+        for info in pending:
+            sys.stderr.buffer.write(_dumps({'type': 'progress', **info}) + b'\n')
+        sys.stderr.flush()
+
+
+def _schedule_flush():
+    """Start the flush timer unless one is already pending. Call with _progress_lock held."""
+    global _progress_timer
+    if _progress_timer is None:
+        _progress_timer = threading.Timer(PROGRESS_FLUSH_INTERVAL, _flush_progress)
+        _progress_timer.daemon = True
+        _progress_timer.start()
+
+
+def _progress(obj):
+    """Queue one progress event on stderr as a JSON line.
+
+    Lines share the stderr buffer and reach the frontend together on the
+    next timed flush.
+    """
+    sys.stderr.buffer.write(_dumps(obj) + b'\n')
+    if _UNBUFFERED:
+        sys.stderr.flush()
+        return
+    with _progress_lock:
+        _schedule_flush()
 
 
-def handle_action(action, params, manager):
-    """Route an action to the appropriate handler."""
+def _download_progress(info):
+    """progress_callback for downloads: keep only the latest event per file.
 
-    if action == 'ping':
-        return {'ok': True, 'data': {'status': 'alive', 'version': '2.0.0'}}
-
-    elif action == 'get_stats':
-        stats = manager.get_stats()
-        return {'ok': True, 'data': stats}
-
-    elif action == 'fetch_mcool':
-        cell_line = params.get('cell_line')
-        force = params.get('force_refresh', False)
-        files = manager.fetch_4dn_mcool_files(cell_line_filter=cell_line, force_refresh=force)
-        # Make JSON-safe
-        return {'ok': True, 'data': {'files': files, 'count': len(files)}}
-
-    elif action == 'fetch_all_data':
-        # Step 1: Fetch mcool from 4DN
-        force = params.get('force_refresh', False)
-        progress_msg = lambda msg: print(json.dumps({'type': 'progress', 'message': msg}), file=sys.stderr, flush=True)
-
-        progress_msg('Fetching .mcool files from 4DN...')
-        files = manager.fetch_4dn_mcool_files(force_refresh=force)
-        mcool_count = len(files)
-        progress_msg(f'Found {mcool_count} .mcool files from 4DN')
-
-        # Step 2: Get unique normalized cell lines
-        from src.python.data_manager import normalize_cell_line
-        unique_cells = sorted(set(
-            normalize_cell_line(f.get('cell_line', 'Unknown'))
-            for f in files
-            if f.get('cell_line', '').lower().strip() != 'unknown'
-        ))
-
-        # Step 3: Fetch cCRE from ENCODE for each unique cell line
-        progress_msg(f'Fetching cCRE from ENCODE for {len(unique_cells)} cell lines...')
-        ccre_found = 0
-        ccre_total = len(unique_cells)
-        for i, cell in enumerate(unique_cells, 1):
-            progress_msg(f'[{i}/{ccre_total}] Querying ENCODE cCRE for: {cell}')
-            try:
-                result = manager.fetch_ccre_for_cell_line(cell)
-                if result and result.get('accession'):
-                    ccre_found += 1
-            except Exception as e:
-                progress_msg(f'Error fetching cCRE for {cell}: {e}')
-            import time
-            time.sleep(0.3)
-
-        progress_msg(f'Found cCRE data for {ccre_found}/{ccre_total} cell lines')
-
-        # Step 4: Get updated stats
-        stats = manager.get_stats()
-        return {'ok': True, 'data': {
-            'mcool_count': mcool_count,
-            'ccre_found': ccre_found,
-            'ccre_total': ccre_total,
-            'stats': stats,
-        }}
-
-    elif action == 'fetch_ccre':
-        cell_line = params.get('cell_line', '')
-        if not cell_line:
-            return {'ok': False, 'error': 'cell_line is required'}
-        result = manager.fetch_ccre_for_cell_line(cell_line)
-        return {'ok': True, 'data': result}
-
-    elif action == 'find_paired':
-        paired = manager.find_paired_datasets(
-            cell_line_filter=params.get('cell_line'),
-            one_per_cell=params.get('one_per_cell', False),
-            min_replicates=params.get('min_replicates'),
-            max_replicates=params.get('max_replicates'),
-            min_size_gb=params.get('min_size_gb'),
-            max_size_gb=params.get('max_size_gb'),
-            tissues=params.get('tissues'),
-        )
-        return {'ok': True, 'data': {'paired': paired, 'count': len(paired)}}
-
-    elif action == 'find_non_paired':
-        non_paired = manager.find_non_paired_datasets(
-            cell_line_filter=params.get('cell_line'),
-        )
-        return {'ok': True, 'data': {'non_paired': non_paired, 'count': len(non_paired)}}
-
-    elif action == 'check_duplicates':
-        df = manager.check_duplicates()
-        records = df.to_dict(orient='records') if not df.empty else []
-        return {'ok': True, 'data': {'duplicates': records}}
-
-    elif action == 'list_cell_lines':
-        species_filter = params.get('species')  # e.g. 'Homo sapiens', 'Mus musculus'
-        ccre_only = params.get('ccre_only', False)
-        try:
-            query = """
-                SELECT cl.cell_line_normalized as cell_line, cl.tissue_type as tissue,
-                       cl.species, cl.genome_assembly, cl.biosample_type,
-                       cl.has_ccre, cl.has_mcool, cl.total_experiments as replicates,
-                       COALESCE(SUM(ce.file_size_gb), 0) as total_gb,
-                       COUNT(DISTINCT CASE WHEN ce.treatment != '' AND ce.treatment IS NOT NULL
-                             THEN ce.experiment_id END) as treated_count,
-                       COUNT(DISTINCT CASE WHEN ce.treatment = '' OR ce.treatment IS NULL
-                             THEN ce.experiment_id END) as untreated_count
-                FROM cell_lines cl
-                LEFT JOIN chromatin_experiments ce ON cl.cell_line_id = ce.cell_line_id
-                WHERE 1=1
-            """
-            qparams = []
-            if species_filter:
-                query += " AND cl.species = ?"
-                qparams.append(species_filter)
-            if ccre_only:
-                query += " AND cl.has_ccre = TRUE"
-            query += """
-                GROUP BY cl.cell_line_normalized, cl.tissue_type, cl.species,
-                         cl.genome_assembly, cl.biosample_type, cl.has_ccre, cl.has_mcool,
-                         cl.total_experiments
-                ORDER BY cl.total_experiments DESC
-            """
-            rows = manager.con.execute(query, qparams).fetchdf()
-            return {'ok': True, 'data': {'cell_lines': rows.to_dict(orient='records')}}
-        except Exception as e:
-            return {'ok': True, 'data': {'cell_lines': []}}
-
-    elif action == 'get_cell_line_details':
-        """Get detailed info for a cell line: all replicates, treatments, cCRE data."""
-        cell_line = params.get('cell_line', '')
-        if not cell_line:
-            return {'ok': False, 'error': 'cell_line is required'}
-        try:
-            # Cell line summary
-            cl_row = manager.con.execute("""
-                SELECT cl.cell_line_id, cl.cell_line_normalized as cell_line,
-                       cl.tissue_type as tissue, cl.species, cl.genome_assembly,
-                       cl.biosample_type, cl.has_ccre, cl.has_mcool, cl.total_experiments
-                FROM cell_lines cl
-                WHERE cl.cell_line_normalized = ?
-            """, [cell_line]).fetchdf()
-            if cl_row.empty:
-                return {'ok': False, 'error': f'Cell line not found: {cell_line}'}
-            cl_info = cl_row.to_dict(orient='records')[0]
-            cl_id = cl_info['cell_line_id']
-
-            # All replicates (chromatin experiments)
-            reps = manager.con.execute("""
-                SELECT ce.experiment_id, ce.accession, ce.file_size_gb,
-                       ce.download_status, ce.local_path, ce.treatment,
-                       ce.treatment_duration, ce.modification, ce.condition,
-                       ce.biosample_type, ce.study, ce.dataset_label,
-                       ce.genome_assembly, ce.experiment_set, ce.date_added
-                FROM chromatin_experiments ce
-                WHERE ce.cell_line_id = ?
-                ORDER BY ce.file_size_gb DESC
-            """, [cl_id]).fetchdf()
-            replicates = reps.to_dict(orient='records')
-
-            # cCRE annotations
-            ccre = manager.con.execute("""
-                SELECT ra.annotation_id, ra.accession, ra.file_size_mb,
-                       ra.download_status, ra.local_path, ra.assembly,
-                       ra.output_type, ra.date_added
-                FROM regulatory_annotations ra
-                WHERE ra.cell_line_id = ?
-                ORDER BY ra.file_size_mb DESC
-            """, [cl_id]).fetchdf()
-            ccre_list = ccre.to_dict(orient='records')
-
-            # Treatment summary
-            treatments = {}
-            for r in replicates:
-                tx = r.get('treatment', '') or 'untreated'
-                if tx not in treatments:
-                    treatments[tx] = {'count': 0, 'total_gb': 0}
-                treatments[tx]['count'] += 1
-                treatments[tx]['total_gb'] += r.get('file_size_gb', 0) or 0
-            treatment_summary = [
-                {'treatment': k, 'count': v['count'], 'total_gb': round(v['total_gb'], 2)}
-                for k, v in sorted(treatments.items(), key=lambda x: -x[1]['count'])
-            ]
-
-            total_gb = sum(r.get('file_size_gb', 0) or 0 for r in replicates)
-            downloaded = sum(1 for r in replicates if r.get('download_status') == 'downloaded')
-
-            return {'ok': True, 'data': {
-                'cell_line': cl_info,
-                'replicates': replicates,
-                'ccre': ccre_list,
-                'treatment_summary': treatment_summary,
-                'summary': {
-                    'total_replicates': len(replicates),
-                    'total_gb': round(total_gb, 2),
-                    'downloaded': downloaded,
-                    'ccre_count': len(ccre_list),
-                    'unique_treatments': len(treatments),
-                },
-            }}
-        except Exception as e:
-            return {'ok': False, 'error': str(e)}
+    Download threads report many events a second; they are not serialized
+    here, and each file's newest event is written on the next flush.
+    """
+    if _UNBUFFERED:
+        _progress({'type': 'progress', **info})
+        return
+    with _progress_lock:
+        _pending_downloads[info.get('accession')] = info
+        _schedule_flush()
+
+
+def _emit(stream, obj):
+    """Write obj to a standard stream as one JSON line, skipping text encoding.
+
+    The line goes out in a single write as soon as it is ready.
+    """
+    _flush_progress()  # progress for an action arrives before its response
+    stream.flush()  # keep order with anything printed through the text layer
+    stream.buffer.write(_dumps(obj, newline=True))
+    stream.buffer.flush()
+
+
+def _stdin_commands(chunk=65536):
+    """Yield each non-blank line on stdin, read in large chunks."""
+    fd = sys.stdin.fileno()
+    partial = b''
+    while True:
+        data = os.read(fd, chunk)
+        if not data:
+            break
+        lines = (partial + data).split(b'\n')
+        partial = lines.pop()
+        yield from (line for line in lines if line.strip())
+    if partial.strip():
+        yield partial
+
+
+atexit.register(_flush_progress)
+
+
+def _handle_ping(params, manager):
+    """Liveness check for the frontend."""
+    return {'ok': True, 'data': {'status': 'alive', 'version': '2.0.0'}}
+
+
+def _handle_get_stats(params, manager):
+    """Return summary statistics from DuckDB."""
+    stats = manager.get_stats()
+    return {'ok': True, 'data': stats}
+
+
+def _handle_fetch_mcool(params, manager):
+    """Fetch .mcool file metadata from 4DN, optionally for one cell line."""
+    cell_line = params.get('cell_line')
+    force = params.get('force_refresh', False)
+    files = manager.fetch_4dn_mcool_files(cell_line_filter=cell_line, force_refresh=force)
+    # Make JSON-safe
+    return {'ok': True, 'data': {'files': files, 'count': len(files)}}
+
+
+def _handle_fetch_all_data(params, manager):
+    """Fetch .mcool files from 4DN, then cCRE info from ENCODE for each cell line."""
+    # Step 1: Fetch mcool from 4DN
+    force = params.get('force_refresh', False)
+    progress_msg = lambda msg: _progress({'type': 'progress', 'message': msg})
+
+    progress_msg('Fetching .mcool files from 4DN...')
+    files = manager.fetch_4dn_mcool_files(force_refresh=force)
+    mcool_count = len(files)
+    progress_msg(f'Found {mcool_count} .mcool files from 4DN')
+
+    # Step 2: Get unique normalized cell lines
+    unique_cells = manager.known_cell_lines()
+
+    # Step 3: Fetch cCRE from ENCODE for each unique cell line
+    progress_msg(f'Fetching cCRE from ENCODE for {len(unique_cells)} cell lines...')
+    results = manager.fetch_all_ccre(unique_cells, progress=progress_msg)
+    ccre_found = sum(1 for r in results.values() if r.get('accession'))
+    ccre_total = len(unique_cells)
+
+    progress_msg(f'Found cCRE data for {ccre_found}/{ccre_total} cell lines')
+
+    # Step 4: Get updated stats
+    stats = manager.get_stats()
+    return {'ok': True, 'data': {
+        'mcool_count': mcool_count,
+        'ccre_found': ccre_found,
+        'ccre_total': ccre_total,
+        'stats': stats,
+    }}
+
+
+def _handle_fetch_ccre(params, manager):
+    """Fetch cCRE info from ENCODE for one cell line."""
+    cell_line = params.get('cell_line', '')
+    if not cell_line:
+        return {'ok': False, 'error': 'cell_line is required'}
+    result = manager.fetch_ccre_for_cell_line(cell_line)
+    return {'ok': True, 'data': result}
+
+
+def _handle_find_paired(params, manager):
+    """Find cell lines with both .mcool and cCRE data."""
+    paired = manager.find_paired_datasets(
+        cell_line_filter=params.get('cell_line'),
+        one_per_cell=params.get('one_per_cell', False),
+        min_replicates=params.get('min_replicates'),
+        max_replicates=params.get('max_replicates'),
+        min_size_gb=params.get('min_size_gb'),
+        max_size_gb=params.get('max_size_gb'),
+        tissues=params.get('tissues'),
+    )
+    return {'ok': True, 'data': {'paired': paired, 'count': len(paired)}}
+
+
+def _handle_find_non_paired(params, manager):
+    """Find cell lines missing either .mcool or cCRE data."""
+    non_paired = manager.find_non_paired_datasets(
+        cell_line_filter=params.get('cell_line'),
+    )
+    return {'ok': True, 'data': {'non_paired': non_paired, 'count': len(non_paired)}}
+
+
+def _handle_check_duplicates(params, manager):
+    """Identify duplicate vs unique experiments per cell line."""
+    return {'ok': True, 'data': {'duplicates': manager.check_duplicates()}}
+
+
+def _handle_list_cell_lines(params, manager):
+    """List cell lines with replicate, treatment and size totals."""
+    species_filter = params.get('species')  # e.g. 'Homo sapiens', 'Mus musculus'
+    ccre_only = params.get('ccre_only', False)
+    try:
+        query = "SELECT * FROM mv_cell_line_summary WHERE 1=1"
+        qparams = []
+        if species_filter:
+            query += " AND species = ?"
+            qparams.append(species_filter)
+        if ccre_only:
+            query += " AND has_ccre = TRUE"
+        query += " ORDER BY replicates DESC"
+        return {'ok': True, 'data': {'cell_lines': manager._records(query, qparams)}}
+    except Exception as e:
+        return {'ok': True, 'data': {'cell_lines': []}}
+
+
+def _handle_get_cell_line_details(params, manager):
+    """Get detailed info for a cell line: all replicates, treatments, cCRE data."""
+    cell_line = params.get('cell_line', '')
+    if not cell_line:
+        return {'ok': False, 'error': 'cell_line is required'}
+    try:
+        # Cell line summary
+        cl_rows = manager._records("""
+            SELECT cl.cell_line_id, cl.cell_line_normalized as cell_line,
+                   cl.tissue_type as tissue, cl.species, cl.genome_assembly,
+                   cl.biosample_type, cl.has_ccre, cl.has_mcool, cl.total_experiments
+            FROM cell_lines cl
+            WHERE cl.cell_line_normalized = ?
+        """, [cell_line])
+        if not cl_rows:
+            return {'ok': False, 'error': f'Cell line not found: {cell_line}'}
+        cl_info = cl_rows[0]
+        cl_id = cl_info['cell_line_id']
+
+        # All replicates (chromatin experiments)
+        replicates = manager._records("""
+            SELECT ce.experiment_id, ce.accession, ce.file_size_gb,
+                   ce.download_status, ce.local_path, ce.treatment,
+                   ce.treatment_duration, ce.modification, ce.condition,
+                   ce.biosample_type, ce.study, ce.dataset_label,
+                   ce.genome_assembly, ce.experiment_set, ce.date_added
+            FROM chromatin_experiments ce
+            WHERE ce.cell_line_id = ?
+            ORDER BY ce.file_size_gb DESC
+        """, [cl_id])
+
+        # cCRE annotations
+        ccre_list = manager._records("""
+            SELECT ra.annotation_id, ra.accession, ra.file_size_mb,
+                   ra.download_status, ra.local_path, ra.assembly,
+                   ra.output_type, ra.date_added
+            FROM regulatory_annotations ra
+            WHERE ra.cell_line_id = ?
+            ORDER BY ra.file_size_mb DESC
+        """, [cl_id])
+
+        # Treatment summary; ties keep the order of their largest replicate
+        treatments = manager.ro_con.execute("""
+            SELECT COALESCE(NULLIF(treatment, ''), 'untreated') as treatment,
+                   COUNT(*) as count,
+                   COALESCE(SUM(file_size_gb), 0) as total_gb,
+                   COUNT(*) FILTER (WHERE download_status = 'downloaded') as downloaded
+            FROM chromatin_experiments
+            WHERE cell_line_id = ?
+            GROUP BY 1
+            ORDER BY count DESC, MAX(file_size_gb) DESC NULLS LAST
+        """, [cl_id]).fetchall()
+        treatment_summary = [
+            {'treatment': tx, 'count': count, 'total_gb': round(gb, 2)}
+            for tx, count, gb, _ in treatments
+        ]
+
+        total_gb = sum(t[2] for t in treatments)
+        downloaded = sum(t[3] for t in treatments)
 
-    elif action == 'list_ml_ready':
-        """Find datasets ready for ML training: paired (mcool + cCRE), with species/assembly info."""
-        species_filter = params.get('species', 'Homo sapiens')
-        one_per_cell = params.get('one_per_cell', False)
-        try:
-            query = """
-                SELECT
-                    cl.cell_line_normalized as cell_line,
-                    cl.tissue_type as tissue,
-                    cl.species,
-                    cl.genome_assembly,
-                    cl.biosample_type,
-                    ce.accession as mcool_accession,
-                    ce.file_size_gb as mcool_size_gb,
-                    ce.download_url as mcool_url,
-                    ce.treatment,
-                    ce.modification,
-                    ce.condition,
-                    ce.download_status as mcool_status,
-                    ra.accession as ccre_accession,
-                    ra.file_size_mb as ccre_size_mb,
-                    ra.download_url as ccre_url,
-                    ra.assembly as ccre_assembly,
-                    ra.download_status as ccre_status,
-                    CASE
-                        WHEN ce.download_status = 'downloaded' AND ra.download_status = 'downloaded'
-                        THEN 'ready'
-                        WHEN ce.download_status = 'downloaded' OR ra.download_status = 'downloaded'
-                        THEN 'partial'
-                        ELSE 'pending'
-                    END as ml_status
-                FROM cell_lines cl
-                JOIN chromatin_experiments ce ON cl.cell_line_id = ce.cell_line_id
-                JOIN regulatory_annotations ra ON cl.cell_line_id = ra.cell_line_id
-                WHERE cl.has_ccre = TRUE AND cl.has_mcool = TRUE
-            """
-            qparams = []
-            if species_filter:
-                query += " AND cl.species = ?"
-                qparams.append(species_filter)
-            query += " ORDER BY ce.file_size_gb DESC"
-
-            rows = manager.con.execute(query, qparams).fetchdf()
-            records = rows.to_dict(orient='records')
-
-            if one_per_cell:
-                best = {}
-                for r in records:
-                    cell = r['cell_line']
-                    if cell not in best or r['mcool_size_gb'] > best[cell]['mcool_size_gb']:
-                        best[cell] = r
-                records = list(best.values())
-
-            # Summary
-            unique_cells = set(r['cell_line'] for r in records)
-            total_gb = sum(r.get('mcool_size_gb', 0) for r in records)
-            treated = [r for r in records if r.get('treatment')]
-            untreated = [r for r in records if not r.get('treatment')]
-
-            return {'ok': True, 'data': {
-                'datasets': records,
-                'count': len(records),
-                'unique_cell_lines': len(unique_cells),
+        return {'ok': True, 'data': {
+            'cell_line': cl_info,
+            'replicates': replicates,
+            'ccre': ccre_list,
+            'treatment_summary': treatment_summary,
+            'summary': {
+                'total_replicates': len(replicates),
                 'total_gb': round(total_gb, 2),
-                'treated_count': len(treated),
-                'untreated_count': len(untreated),
-                'species': species_filter or 'all',
-            }}
-        except Exception as e:
-            return {'ok': False, 'error': str(e)}
-
-    elif action == 'download_paired':
-        cell_line = params.get('cell_line')
-        limit = params.get('limit')
-        one_per_cell = params.get('one_per_cell', True)
-        paired = manager.find_paired_datasets(
-            cell_line_filter=cell_line,
-            one_per_cell=one_per_cell,
-            min_size_gb=params.get('min_size_gb'),
-            max_size_gb=params.get('max_size_gb'),
-            tissues=params.get('tissues'),
-        )
-        if limit:
-            paired = paired[:int(limit)]
-
-        if not paired:
-            return {'ok': False, 'error': f'No paired datasets found for filter: {cell_line or "all"}'}
-
-        # Stream progress via stderr
-        def progress_cb(info):
-            msg = json.dumps({'type': 'progress', **info})
-            print(msg, file=sys.stderr, flush=True)
-
-        results = manager.download_paired_parallel(
-            paired, resume=params.get('resume', True),
-            max_workers=params.get('max_workers'),
-            progress_callback=progress_cb,
-        )
-        return {'ok': True, 'data': {'results': results, 'total': len(results),
-                                      'success': sum(1 for r in results if r.get('success'))}}
-
-    elif action == 'download_mcool_only':
-        files = manager.fetch_4dn_mcool_files(cell_line_filter=params.get('cell_line'))
-        files = [f for f in files if f.get('cell_line', '').lower().strip() != 'unknown']
-        limit = params.get('limit')
-        if limit:
-            files = files[:int(limit)]
-
-        download_tasks = []
-        for f in files:
-            cell_safe = f.get('cell_line_normalized', f.get('cell_line', 'unknown')).replace(' ', '_')
-            path = str(Path(os.getenv("DATA_DIR", "./data")) / "downloads" / "mcool" / f"{cell_safe}_{f['accession']}.mcool")
-            download_tasks.append({
-                'type': 'mcool',
-                'cell_line': f.get('cell_line', ''),
-                'accession': f.get('accession', ''),
-                'url': f.get('download_url', ''),
-                'path': path,
-                'size': f.get('file_size', 0),
-            })
-
-        results = []
-        for task in download_tasks:
-            result_path = manager.download_file(task['url'], task['path'], accession=task['accession'])
-            results.append({**task, 'success': result_path is not None})
-
-        return {'ok': True, 'data': {'results': results, 'total': len(results)}}
-
-    elif action == 'generate_report':
-        report = manager.generate_report(
-            one_per_cell=params.get('one_per_cell', False),
-            output_csv=params.get('output_csv'),
-        )
-        return {'ok': True, 'data': report}
-
-    elif action == 'query':
-        sql = params.get('sql', '')
-        if not sql:
-            return {'ok': False, 'error': 'sql is required'}
-        # Safety: only allow SELECT
-        if not sql.strip().upper().startswith('SELECT'):
-            return {'ok': False, 'error': 'Only SELECT queries are allowed'}
-        try:
-            df = manager.con.execute(sql).fetchdf()
-            return {'ok': True, 'data': {'rows': df.to_dict(orient='records'), 'count': len(df)}}
-        except Exception as e:
-            return {'ok': False, 'error': str(e)}
+                'downloaded': downloaded,
+                'ccre_count': len(ccre_list),
+                'unique_treatments': len(treatments),
+            },
+        }}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+
+def _handle_list_ml_ready(params, manager):
+    """Find datasets ready for ML training: paired (mcool + cCRE), with species/assembly info."""
+    species_filter = params.get('species', 'Homo sapiens')
+    one_per_cell = params.get('one_per_cell', False)
+    try:
+        query = "SELECT * FROM mv_ml_ready"
+        qparams = []
+        if species_filter:
+            query += " WHERE species = ?"
+            qparams.append(species_filter)
+        query += " ORDER BY mcool_size_gb DESC"
+
+        records = manager._records(query, qparams)
+
+        if one_per_cell:
+            best = {}
+            for r in records:
+                cell = r['cell_line']
+                if cell not in best or (r['mcool_size_gb'] or 0) > (best[cell]['mcool_size_gb'] or 0):
+                    best[cell] = r
+            records = list(best.values())
+
+        # Summary
+        unique_cells = set(r['cell_line'] for r in records)
+        total_gb = sum(r.get('mcool_size_gb') or 0 for r in records)
+        treated = [r for r in records if r.get('treatment')]
+        untreated = [r for r in records if not r.get('treatment')]
 
-    elif action == 'get_download_status':
-        """Get download status for all files."""
-        try:
-            chromatin_dl = manager.con.execute("""
-                SELECT ce.accession, ce.cell_line_name, ce.file_size_gb,
-                       ce.download_status, ce.local_path, ce.date_downloaded
-                FROM chromatin_experiments ce
-                WHERE ce.download_status = 'downloaded'
-                ORDER BY ce.date_downloaded DESC
-            """).fetchdf()
-            ccre_dl = manager.con.execute("""
-                SELECT ra.accession, ra.cell_line_name, ra.file_size_mb,
-                       ra.download_status, ra.local_path
-                FROM regulatory_annotations ra
-                WHERE ra.download_status = 'downloaded'
-            """).fetchdf()
-            pending_chr = manager.con.execute(
-                "SELECT COUNT(*) FROM chromatin_experiments WHERE download_status = 'pending'"
-            ).fetchone()[0]
-            pending_ccre = manager.con.execute(
-                "SELECT COUNT(*) FROM regulatory_annotations WHERE download_status = 'pending'"
-            ).fetchone()[0]
-
-            return {'ok': True, 'data': {
-                'downloaded_chromatin': chromatin_dl.to_dict(orient='records'),
-                'downloaded_ccre': ccre_dl.to_dict(orient='records'),
-                'counts': {
-                    'downloaded_chromatin': len(chromatin_dl),
-                    'downloaded_ccre': len(ccre_dl),
-                    'pending_chromatin': pending_chr,
-                    'pending_ccre': pending_ccre,
-                }
-            }}
-        except Exception as e:
-            return {'ok': False, 'error': str(e)}
-
-    elif action == 'start_download_job':
-        """Start a background download job (nohup process).
-        Pre-resolves all URLs/paths from DuckDB so the worker is DB-free.
-        """
-        import subprocess, uuid
-        items = params.get('items', [])  # [{cell_line, accessions?, include_ccre?}, ...]
-        if not items:
-            return {'ok': False, 'error': 'items is required (list of {cell_line, accessions?, include_ccre?})'}
-
-        job_id = params.get('job_id') or str(uuid.uuid4())[:8]
-        jobs_dir = Path(os.getenv("DATA_DIR", "./data")) / "jobs"
-        jobs_dir.mkdir(parents=True, exist_ok=True)
-        data_dir = Path(os.getenv("DATA_DIR", "./data"))
-
-        # Pre-resolve all download tasks from DuckDB
-        tasks = []
-        for item in items:
-            cell_line = item.get('cell_line', '')
-            accessions = item.get('accessions', [])
-            include_ccre = item.get('include_ccre', True)
-            cell_safe = cell_line.replace(' ', '_').replace('/', '_')
-
-            if accessions:
-                for acc in accessions:
-                    row = manager.con.execute("""
-                        SELECT ce.accession, ce.download_url, ce.file_size_bytes, ce.file_size_gb
-                        FROM chromatin_experiments ce WHERE ce.accession = ?
-                    """, [acc]).fetchone()
-                    if row:
-                        tasks.append({
-                            'type': 'mcool', 'cell_line': cell_line,
-                            'accession': row[0], 'url': row[1],
-                            'path': str(data_dir / "downloads" / "mcool" / f"{cell_safe}_{row[0]}.mcool"),
-                            'size': row[2] or 0, 'size_gb': row[3] or 0,
-                        })
-            else:
-                rows = manager.con.execute("""
-                    SELECT ce.accession, ce.download_url, ce.file_size_bytes, ce.file_size_gb
-                    FROM chromatin_experiments ce
-                    JOIN cell_lines cl ON ce.cell_line_id = cl.cell_line_id
-                    WHERE cl.cell_line_normalized = ?
-                    ORDER BY ce.file_size_gb DESC
-                """, [cell_line]).fetchall()
-                for row in rows:
-                    tasks.append({
-                        'type': 'mcool', 'cell_line': cell_line,
-                        'accession': row[0], 'url': row[1],
-                        'path': str(data_dir / "downloads" / "mcool" / f"{cell_safe}_{row[0]}.mcool"),
-                        'size': row[2] or 0, 'size_gb': row[3] or 0,
-                    })
-
-            if include_ccre:
-                ccre_rows = manager.con.execute("""
-                    SELECT ra.accession, ra.download_url, ra.file_size_mb
-                    FROM regulatory_annotations ra
-                    JOIN cell_lines cl ON ra.cell_line_id = cl.cell_line_id
-                    WHERE cl.cell_line_normalized = ?
-                """, [cell_line]).fetchall()
-                for row in ccre_rows:
-                    tasks.append({
-                        'type': 'ccre', 'cell_line': cell_line,
-                        'accession': row[0], 'url': row[1],
-                        'path': str(data_dir / "downloads" / "ccre" / f"{cell_safe}_{row[0]}.bed.gz"),
-                        'size': int((row[2] or 0) * 1024 * 1024),
-                        'size_gb': (row[2] or 0) / 1024,
-                    })
-
-        if not tasks:
-            return {'ok': False, 'error': 'No downloadable files found for the given items'}
-
-        # Write tasks to a file (worker reads this, not DuckDB)
-        tasks_file = str(jobs_dir / f"{job_id}_tasks.json")
-        with open(tasks_file, 'w') as f:
-            json.dump(tasks, f, default=str)
-
-        job_file = str(jobs_dir / f"{job_id}.json")
-        with open(job_file, 'w') as f:
-            json.dump({
-                'job_id': job_id,
-                'status': 'starting',
-                'created_at': __import__('datetime').datetime.now().isoformat(),
-                'total_tasks': len(tasks),
-                'total_gb': round(sum(t.get('size_gb', 0) for t in tasks), 2),
-                'cell_lines': list(set(t['cell_line'] for t in tasks)),
-            }, f, default=str)
-
-        # Launch detached background process
-        worker_script = str(Path(__file__).resolve().parent / 'download_worker.py')
-        log_file = str(jobs_dir / f"{job_id}.log")
-
-        proc = subprocess.Popen(
-            ['python3', worker_script, job_id, job_file, tasks_file],
-            cwd=str(Path(__file__).resolve().parent.parent.parent),
-            stdout=open(log_file, 'w'),
-            stderr=subprocess.STDOUT,
-            start_new_session=True,
-        )
-
-        # Update job file with PID
-        with open(job_file, 'r') as f:
-            job = json.load(f)
-        job['pid'] = proc.pid
-        job['log_file'] = log_file
-        with open(job_file, 'w') as f:
-            json.dump(job, f, default=str)
+        return {'ok': True, 'data': {
+            'datasets': records,
+            'count': len(records),
+            'unique_cell_lines': len(unique_cells),
+            'total_gb': round(total_gb, 2),
+            'treated_count': len(treated),
+            'untreated_count': len(untreated),
+            'species': species_filter or 'all',
+        }}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+
+def _handle_download_paired(params, manager):
+    """Download paired .mcool and cCRE files in the foreground."""
+    cell_line = params.get('cell_line')
+    limit = params.get('limit')
+    one_per_cell = params.get('one_per_cell', True)
+    paired = manager.find_paired_datasets(
+        cell_line_filter=cell_line,
+        one_per_cell=one_per_cell,
+        min_size_gb=params.get('min_size_gb'),
+        max_size_gb=params.get('max_size_gb'),
+        tissues=params.get('tissues'),
+    )
+    if limit:
+        paired = paired[:int(limit)]
+
+    if not paired:
+        return {'ok': False, 'error': f'No paired datasets found for filter: {cell_line or "all"}'}
+
+    # Stream progress via stderr
+    results = manager.download_paired_parallel(
+        paired, resume=params.get('resume', True),
+        max_workers=params.get('max_workers'),
+        progress_callback=_download_progress,
+    )
+    return {'ok': True, 'data': {'results': results, 'total': len(results),
+                                  'success': sum(1 for r in results if r.get('success'))}}
+
+
+def _handle_download_mcool_only(params, manager):
+    """Download .mcool files in the foreground."""
+    files = manager.fetch_4dn_mcool_files(cell_line_filter=params.get('cell_line'))
+    files = [f for f in files if f.get('cell_line', '').lower().strip() != 'unknown']
+    limit = params.get('limit')
+    if limit:
+        files = files[:int(limit)]
+
+    mcool_dir = _DOWNLOADS_DIR / "mcool"
+    download_tasks = []
+    for f in files:
+        cell_safe = f.get('cell_line_normalized', f.get('cell_line', 'unknown')).replace(' ', '_')
+        download_tasks.append(DownloadTask(
+            'mcool', f.get('cell_line', ''), f.get('accession', ''), f.get('download_url', ''),
+            str(mcool_dir / f"{cell_safe}_{f['accession']}.mcool"), f.get('file_size', 0)))
+
+    results = manager.download_tasks_parallel(
+        download_tasks, resume=params.get('resume', True),
+        max_workers=params.get('max_workers'),
+        progress_callback=_download_progress,
+    )
+    return {'ok': True, 'data': {'results': results, 'total': len(results)}}
+
+
+def _handle_generate_report(params, manager):
+    """Write the paired dataset CSV reports."""
+    report = manager.generate_report(
+        one_per_cell=params.get('one_per_cell', False),
+        output_csv=params.get('output_csv'),
+    )
+    return {'ok': True, 'data': report}
+
+
+def _handle_query(params, manager):
+    """Run a SELECT query against DuckDB."""
+    sql = params.get('sql', '')
+    if not sql:
+        return {'ok': False, 'error': 'sql is required'}
+    # Safety: only allow SELECT; the read-only transaction enforces it
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        return {'ok': False, 'error': 'Only SELECT queries are allowed'}
+    try:
+        with db.read_only(manager.con) as cur:
+            cur.execute(sql)
+            cols = [d[0] for d in cur.description]
+            rows = [dict(zip(cols, row)) for row in cur.fetchall()]
+        return {'ok': True, 'data': {'rows': rows, 'count': len(rows)}}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+
+def _handle_get_download_status(params, manager):
+    """Get download status for all files."""
+    try:
+        chromatin_dl = manager._records("""
+            SELECT ce.accession, ce.cell_line_name, ce.file_size_gb,
+                   ce.download_status, ce.local_path, ce.date_downloaded
+            FROM chromatin_experiments ce
+            WHERE ce.download_status = 'downloaded'
+            ORDER BY ce.date_downloaded DESC
+        """)
+        ccre_dl = manager._records("""
+            SELECT ra.accession, ra.cell_line_name, ra.file_size_mb,
+                   ra.download_status, ra.local_path
+            FROM regulatory_annotations ra
+            WHERE ra.download_status = 'downloaded'
+        """)
+        pending_chr, pending_ccre = manager.ro_con.execute("""
+            SELECT (SELECT COUNT(*) FROM chromatin_experiments WHERE download_status = 'pending'),
+                   (SELECT COUNT(*) FROM regulatory_annotations WHERE download_status = 'pending')
+        """).fetchone()
 
         return {'ok': True, 'data': {
-            'job_id': job_id,
-            'pid': proc.pid,
-            'total_tasks': len(tasks),
-            'total_gb': round(sum(t.get('size_gb', 0) for t in tasks), 2),
-            'cell_lines': list(set(t['cell_line'] for t in tasks)),
+            'downloaded_chromatin': chromatin_dl,
+            'downloaded_ccre': ccre_dl,
+            'counts': {
+                'downloaded_chromatin': len(chromatin_dl),
+                'downloaded_ccre': len(ccre_dl),
+                'pending_chromatin': pending_chr,
+                'pending_ccre': pending_ccre,
+            }
         }}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+
+def _handle_start_download_job(params, manager):
+    """Start a background download job (nohup process).
+    Pre-resolves all URLs/paths from DuckDB so the worker is DB-free.
+    """
+    items = params.get('items', [])  # [{cell_line, accessions?, include_ccre?}, ...]
+    if not items:
+        return {'ok': False, 'error': 'items is required (list of {cell_line, accessions?, include_ccre?})'}
+
+    job_id = params.get('job_id') or str(uuid.uuid4())[:8]
+    jobs_dir = _JOBS_DIR
+    jobs_dir.mkdir(parents=True, exist_ok=True)
+    mcool_dir = _DOWNLOADS_DIR / "mcool"
+    ccre_dir = _DOWNLOADS_DIR / "ccre"
+
+    # Pre-resolve all download tasks from DuckDB: one query per kind of
+    # lookup, then compose tasks per item in request order.
+    explicit = [acc for item in items for acc in item.get('accessions', [])]
+    whole_lines = [item.get('cell_line', '') for item in items if not item.get('accessions')]
+    ccre_lines = [item.get('cell_line', '') for item in items if item.get('include_ccre', True)]
+
+    by_accession = {}
+    if explicit:
+        for row in manager.ro_con.execute("""
+            SELECT ce.accession, ce.download_url, ce.file_size_bytes, ce.file_size_gb
+            FROM chromatin_experiments ce
+            WHERE ce.accession IN (SELECT unnest(?::VARCHAR[]))
+        """, [explicit]).fetchall():
+            by_accession[row[0]] = row
+
+    mcool_by_line = {}
+    if whole_lines:
+        for row in manager.ro_con.execute("""
+            SELECT cl.cell_line_normalized, ce.accession, ce.download_url,
+                   ce.file_size_bytes, ce.file_size_gb
+            FROM chromatin_experiments ce
+            JOIN cell_lines cl ON ce.cell_line_id = cl.cell_line_id
+            WHERE cl.cell_line_normalized IN (SELECT unnest(?::VARCHAR[]))
+            ORDER BY ce.file_size_gb DESC
+        """, [whole_lines]).fetchall():
+            mcool_by_line.setdefault(row[0], []).append(row[1:])
+
+    ccre_by_line = {}
+    if ccre_lines:
+        for row in manager.ro_con.execute("""
+            SELECT cl.cell_line_normalized, ra.accession, ra.download_url,
+                   ra.file_size_mb, ra.file_size_bytes
+            FROM regulatory_annotations ra
+            JOIN cell_lines cl ON ra.cell_line_id = cl.cell_line_id
+            WHERE cl.cell_line_normalized IN (SELECT unnest(?::VARCHAR[]))
+        """, [ccre_lines]).fetchall():
+            ccre_by_line.setdefault(row[0], []).append(row[1:])
+
+    tasks = []
+    for item in items:
+        cell_line = item.get('cell_line', '')
+        accessions = item.get('accessions', [])
+        include_ccre = item.get('include_ccre', True)
+        cell_safe = cell_line.replace(' ', '_').replace('/', '_')
+
+        if accessions:
+            rows = [by_accession[acc] for acc in accessions if acc in by_accession]
+        else:
+            rows = mcool_by_line.get(cell_line, [])
+        for row in rows:
+            tasks.append({
+                'type': 'mcool', 'cell_line': cell_line,
+                'accession': row[0], 'url': row[1],
+                'path': str(mcool_dir / f"{cell_safe}_{row[0]}.mcool"),
+                'size': row[2] or 0, 'size_gb': row[3] or 0,
+            })
 
-    elif action == 'list_download_jobs':
-        """List all download jobs (running, done, cancelled, error)."""
-        jobs_dir = Path(os.getenv("DATA_DIR", "./data")) / "jobs"
-        jobs = []
-        if jobs_dir.exists():
-            for jf in sorted(jobs_dir.glob("*.json")):
-                if '_tasks' in jf.name:
-                    continue
-                try:
-                    with open(jf, 'r') as f:
-                        job = json.load(f)
-                    # Check if process is still alive
-                    pid = job.get('pid')
-                    if pid and job.get('status') == 'running':
-                        try:
-                            os.kill(pid, 0)  # signal 0 = check if alive
-                        except OSError:
-                            job['status'] = 'crashed'
-                    jobs.append(job)
-                except Exception:
-                    pass
-        return {'ok': True, 'data': {'jobs': jobs}}
-
-    elif action == 'get_job_status':
-        """Get detailed status of a specific download job."""
-        job_id = params.get('job_id', '')
-        if not job_id:
-            return {'ok': False, 'error': 'job_id is required'}
-        job_file = Path(os.getenv("DATA_DIR", "./data")) / "jobs" / f"{job_id}.json"
-        if not job_file.exists():
-            return {'ok': False, 'error': f'Job not found: {job_id}'}
-        with open(job_file, 'r') as f:
-            job = json.load(f)
-        # Check alive
-        pid = job.get('pid')
-        if pid and job.get('status') == 'running':
-            try:
-                os.kill(pid, 0)
-            except OSError:
-                job['status'] = 'crashed'
-        # Read last N lines of log
-        log_file = job.get('log_file', '')
-        log_tail = ''
-        if log_file and Path(log_file).exists():
+        if include_ccre:
+            for row in ccre_by_line.get(cell_line, []):
+                tasks.append({
+                    'type': 'ccre', 'cell_line': cell_line,
+                    'accession': row[0], 'url': row[1],
+                    'path': str(ccre_dir / f"{cell_safe}_{row[0]}.bed.gz"),
+                    'size': row[3] or int((row[2] or 0) * 1024 * 1024),
+                    'size_gb': (row[2] or 0) / 1024,
+                })
+
+    if not tasks:
+        return {'ok': False, 'error': 'No downloadable files found for the given items'}
+    total_gb = round(sum(t['size_gb'] for t in tasks), 2)
+    cell_lines = list({t['cell_line'] for t in tasks})
+
+    # Write tasks to a file (worker reads this, not DuckDB)
+    tasks_file = str(jobs_dir / f"{job_id}_tasks.json")
+    _write_json(tasks_file, tasks)
+
+    job_file = str(jobs_dir / f"{job_id}.json")
+    _write_json(job_file, {
+        'job_id': job_id,
+        'status': 'starting',
+        'created_at': datetime.now().isoformat(),
+        'total_tasks': len(tasks),
+        'total_gb': total_gb,
+        'cell_lines': cell_lines,
+    })
+
+    # Launch detached background process
+    worker_script = str(Path(__file__).resolve().parent / 'download_worker.py')
+    log_file = str(jobs_dir / f"{job_id}.log")
+
+    proc = subprocess.Popen(
+        ['python3', worker_script, job_id, job_file, tasks_file],
+        cwd=str(_ROOT_DIR),
+        stdout=open(log_file, 'w'),
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+
+    # Update job file with PID; its start time tells a recycled PID apart
+    snapshot_job(job_file, {'pid': proc.pid, 'pid_start': _process_start_time(proc.pid),
+                            'log_file': log_file})
+
+    return {'ok': True, 'data': {
+        'job_id': job_id,
+        'pid': proc.pid,
+        'total_tasks': len(tasks),
+        'total_gb': total_gb,
+        'cell_lines': cell_lines,
+    }}
+
+
+def _process_start_time(pid):
+    """Start time of a live pid in clock ticks since boot, from /proc (Linux).
+
+    None if the process is gone, a zombie, or /proc is unavailable.
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Fields after the parenthesised command name, which may contain spaces:
+    # [0] is the state, [19] is starttime (field 22)
+    fields = stat.rpartition(b')')[2].split()
+    if fields[0] == b'Z':
+        return None
+    return int(fields[19])
+
+
+def _worker_alive(job):
+    """Whether the job's worker process is still running.
+
+    Jobs recorded with pid_start must match that start time, so a PID
+    recycled by an unrelated process does not read as alive.
+    """
+    pid = job['pid']
+    if job.get('pid_start') is not None:
+        return _process_start_time(pid) == job['pid_start']
+    try:
+        os.kill(pid, 0)  # signal 0 = check if alive
+    except OSError:
+        return False
+    return True
+
+
+def _handle_list_download_jobs(params, manager):
+    """List all download jobs (running, done, cancelled, error)."""
+    jobs_dir = _JOBS_DIR
+    jobs = []
+    if jobs_dir.exists():
+        for jf in sorted(jobs_dir.glob("*.json")):
+            if '_tasks' in jf.name:
+                continue
             try:
-                with open(log_file, 'r') as f:
-                    lines = f.readlines()
-                    log_tail = ''.join(lines[-20:])
+                job = load_job(jf)
+                # Check if process is still alive
+                if job.get('pid') and job.get('status') == 'running' and not _worker_alive(job):
+                    job['status'] = 'crashed'
+                jobs.append(job)
             except Exception:
                 pass
-        job['log_tail'] = log_tail
-        return {'ok': True, 'data': job}
-
-    elif action == 'stop_download_job':
-        """Stop a running download job."""
-        import signal as sig
-        job_id = params.get('job_id', '')
-        if not job_id:
-            return {'ok': False, 'error': 'job_id is required'}
-        job_file = Path(os.getenv("DATA_DIR", "./data")) / "jobs" / f"{job_id}.json"
-        if not job_file.exists():
-            return {'ok': False, 'error': f'Job not found: {job_id}'}
-        with open(job_file, 'r') as f:
-            job = json.load(f)
-        pid = job.get('pid')
-        if not pid:
-            return {'ok': False, 'error': 'No PID found for job'}
+    return {'ok': True, 'data': {'jobs': jobs}}
+
+
+def _tail_lines(path, n, chunk=4096):
+    """Return the last n lines of a file, reading backwards from the end."""
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        buf = b''
+        while pos > 0 and buf.count(b'\n') <= n:
+            step = min(chunk, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+    return b''.join(buf.splitlines(keepends=True)[-n:]).decode('utf-8', errors='replace')
+
+
+def _handle_get_job_status(params, manager):
+    """Get detailed status of a specific download job."""
+    job_id = params.get('job_id', '')
+    if not job_id:
+        return {'ok': False, 'error': 'job_id is required'}
+    job_file = _JOBS_DIR / f"{job_id}.json"
+    if not job_file.exists():
+        return {'ok': False, 'error': f'Job not found: {job_id}'}
+    job = load_job(job_file)
+    # Check alive
+    if job.get('pid') and job.get('status') == 'running' and not _worker_alive(job):
+        job['status'] = 'crashed'
+    # Read last N lines of log
+    log_file = job.get('log_file', '')
+    log_tail = ''
+    if log_file and Path(log_file).exists():
         try:
-            os.kill(pid, sig.SIGTERM)
-            job['status'] = 'stopping'
-            with open(str(job_file), 'w') as f:
-                json.dump(job, f, default=str)
-            return {'ok': True, 'data': {'message': f'Sent SIGTERM to PID {pid}'}}
-        except ProcessLookupError:
-            job['status'] = 'stopped'
-            with open(str(job_file), 'w') as f:
-                json.dump(job, f, default=str)
-            return {'ok': True, 'data': {'message': 'Process already stopped'}}
-        except Exception as e:
-            return {'ok': False, 'error': str(e)}
-
-    elif action == 'delete_download_job':
-        """Delete a completed/failed job record."""
-        job_id = params.get('job_id', '')
-        if not job_id:
-            return {'ok': False, 'error': 'job_id is required'}
-        jobs_dir = Path(os.getenv("DATA_DIR", "./data")) / "jobs"
-        job_file = jobs_dir / f"{job_id}.json"
-        log_file = jobs_dir / f"{job_id}.log"
-        tasks_file = jobs_dir / f"{job_id}_tasks.json"
-        if job_file.exists():
-            # Don't delete running jobs
-            with open(job_file, 'r') as f:
-                job = json.load(f)
-            if job.get('status') == 'running':
-                return {'ok': False, 'error': 'Cannot delete a running job. Stop it first.'}
-            job_file.unlink(missing_ok=True)
-        log_file.unlink(missing_ok=True)
-        tasks_file.unlink(missing_ok=True)
-        return {'ok': True, 'data': {'message': f'Job {job_id} deleted'}}
-
-    elif action == 'validate_datasets':
-        """Validate all datasets for ML training readiness."""
-        species = params.get('species')
-        results = manager.validate_datasets(species_filter=species)
-        return {'ok': True, 'data': results}
-
-    elif action == 'test_download':
-        """Test download: fetch one small cCRE file and verify it."""
-        test_cell = "K562"
-        ccre = manager.fetch_ccre_for_cell_line(test_cell)
-        if not ccre:
-            return {'ok': False, 'error': f'Could not find cCRE data for {test_cell}'}
-
-        cache_dir = Path(os.getenv("DATA_DIR", "./data")) / "cache"
-        test_path = cache_dir / f"test_{ccre['accession']}.bed.gz"
-        result = manager.download_file(
-            ccre['download_url'], test_path,
-            accession=ccre['accession'], resume=False
-        )
-        if result is None:
-            return {'ok': False, 'error': 'Download failed'}
-
-        validation = manager.validate_bed_gz(str(test_path))
-        actual_size = test_path.stat().st_size
-
-        # Clean up
-        test_path.unlink(missing_ok=True)
-
-        return {'ok': True, 'data': {
-            'cell_line': test_cell,
-            'accession': ccre['accession'],
-            'expected_size': ccre['file_size'],
-            'actual_size': actual_size,
-            'validation': validation,
-        }}
+            log_tail = _tail_lines(log_file, 20)
+        except Exception:
+            pass
+    job['log_tail'] = log_tail
+    return {'ok': True, 'data': job}
+
+
+def _handle_stop_download_job(params, manager):
+    """Stop a running download job."""
+    job_id = params.get('job_id', '')
+    if not job_id:
+        return {'ok': False, 'error': 'job_id is required'}
+    job_file = _JOBS_DIR / f"{job_id}.json"
+    if not job_file.exists():
+        return {'ok': False, 'error': f'Job not found: {job_id}'}
+    job = orjson.loads(job_file.read_bytes())
+    pid = job.get('pid')
+    if not pid:
+        return {'ok': False, 'error': 'No PID found for job'}
+    try:
+        os.kill(pid, signal.SIGTERM)
+        snapshot_job(str(job_file), {'status': 'stopping'})
+        return {'ok': True, 'data': {'message': f'Sent SIGTERM to PID {pid}'}}
+    except ProcessLookupError:
+        snapshot_job(str(job_file), {'status': 'stopped'})
+        return {'ok': True, 'data': {'message': 'Process already stopped'}}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+
+def _handle_delete_download_job(params, manager):
+    """Delete a completed/failed job record."""
+    job_id = params.get('job_id', '')
+    if not job_id:
+        return {'ok': False, 'error': 'job_id is required'}
+    jobs_dir = _JOBS_DIR
+    job_file = jobs_dir / f"{job_id}.json"
+    log_file = jobs_dir / f"{job_id}.log"
+    tasks_file = jobs_dir / f"{job_id}_tasks.json"
+    if job_file.exists():
+        # Don't delete running jobs
+        job = orjson.loads(job_file.read_bytes())
+        if job.get('status') == 'running':
+            return {'ok': False, 'error': 'Cannot delete a running job. Stop it first.'}
+        job_file.unlink(missing_ok=True)
+        Path(events_path(job_file)).unlink(missing_ok=True)
+    log_file.unlink(missing_ok=True)
+    tasks_file.unlink(missing_ok=True)
+    return {'ok': True, 'data': {'message': f'Job {job_id} deleted'}}
+
+
+def _handle_validate_datasets(params, manager):
+    """Validate all datasets for ML training readiness."""
+    species = params.get('species')
+    results = manager.validate_datasets(species_filter=species)
+    return {'ok': True, 'data': results}
+
+
+def _handle_test_download(params, manager):
+    """Test download: fetch one small cCRE file and verify it."""
+    test_cell = "K562"
+    ccre = manager.fetch_ccre_for_cell_line(test_cell)
+    if not ccre:
+        return {'ok': False, 'error': f'Could not find cCRE data for {test_cell}'}
+
+    cache_dir = _DATA_DIR / "cache"
+    test_path = cache_dir / f"test_{ccre['accession']}.bed.gz"
+    result = manager.download_file(
+        ccre['download_url'], test_path,
+        accession=ccre['accession'], resume=False
+    )
+    if result is None:
+        return {'ok': False, 'error': 'Download failed'}
+
+    validation = manager.validate_bed_gz(str(test_path))
+    actual_size = test_path.stat().st_size
+
+    # Clean up
+    test_path.unlink(missing_ok=True)
+
+    return {'ok': True, 'data': {
+        'cell_line': test_cell,
+        'accession': ccre['accession'],
+        'expected_size': ccre['file_size'],
+        'actual_size': actual_size,
+        'validation': validation,
+    }}
+
+
+# Parsed .env contents, reused while the file's (mtime_ns, size) is unchanged
+_env_cache = {'stamp': None, 'config': {}}
+
+
+def _parse_env_lines(lines):
+    """Parse KEY=VALUE lines into a dict, skipping blanks and comments."""
+    config = {}
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            k, sep, v = line.partition('=')
+            if sep:
+                config[k.strip()] = v.strip()
+    return config
+
+
+def _env_stamp():
+    try:
+        st = _ENV_PATH.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_env():
+    """Return the parsed .env config, re-reading the file only when it has changed."""
+    stamp = _env_stamp()
+    if stamp is None:
+        return {}
+    if stamp != _env_cache['stamp']:
+        with open(_ENV_PATH, 'r') as f:
+            _env_cache['config'] = _parse_env_lines(f)
+        _env_cache['stamp'] = stamp
+    return _env_cache['config']
+
+
+def _handle_get_config(params, manager):
+    """Read current .env config."""
+    return {'ok': True, 'data': {
+        'config': dict(_read_env()),
+        'path': str(_ENV_PATH),
+    }}
+
+
+def _handle_update_config(params, manager):
+    """Update a config key in .env file."""
+    key = params.get('key', '')
+    value = params.get('value', '')
+    if not key:
+        return {'ok': False, 'error': 'key is required'}
+    env_path = _ENV_PATH
+    config = _read_env()
+    if key not in config:
+        # New key: append its line, leaving the rest of the file untouched
+        with open(env_path, 'a') as f:
+            f.write(f'\n{key}={value}\n')
+        _env_cache['config'] = {**config, key: str(value).strip()}
+        _env_cache['stamp'] = _env_stamp()
+    elif config[key] != value:
+        with open(env_path, 'r') as f:
+            text = f.read()
+        # The last assignment is the one that takes effect; one regex pass finds it
+        last = None
+        for last in re.finditer(rf'^[^\S\n]*{re.escape(key)}[^\S\n]*=.*$', text, re.M):
+            pass
+        if last is not None:
+            text = f'{text[:last.start()]}{key}={value}{text[last.end():]}'
+        # Write beside the target and swap it in, so readers never see a partial file
+        tmp_path = env_path.with_name(env_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, env_path)
+        _env_cache['config'] = _parse_env_lines(text.splitlines())
+        _env_cache['stamp'] = _env_stamp()
+    # Reload env
+    os.environ[key] = value
+    if key == 'DATA_DIR':
+        global _DATA_DIR, _JOBS_DIR, _DOWNLOADS_DIR
+        _DATA_DIR = Path(value or "./data")
+        _JOBS_DIR = _DATA_DIR / "jobs"
+        _DOWNLOADS_DIR = _DATA_DIR / "downloads"
+    return {'ok': True, 'data': {'message': f'{key} updated', 'key': key, 'value': value}}
+
+
+# export_metadata sections: (key, query, ORDER BY over the query's columns)
+_EXPORT_SECTIONS = [
+    ('cell_lines', """
+        SELECT cl.cell_line_id, cl.cell_line_normalized as cell_line,
+               cl.tissue_type, cl.species, cl.genome_assembly,
+               cl.biosample_type, cl.has_ccre, cl.has_mcool
+        FROM cell_lines cl
+    """, 'r.cell_line'),
+    ('experiments', """
+        SELECT ce.accession, ce.cell_line_name, ce.download_url,
+               ce.file_size_gb, ce.file_size_bytes, ce.download_status,
+               ce.species, ce.genome_assembly, ce.treatment,
+               ce.treatment_duration, ce.modification, ce.condition,
+               ce.biosample_type, ce.study, ce.dataset_label,
+               cl.cell_line_normalized
+        FROM chromatin_experiments ce
+        JOIN cell_lines cl ON ce.cell_line_id = cl.cell_line_id
+    """, 'r.cell_line_normalized, r.accession'),
+    ('ccre_annotations', """
+        SELECT ra.accession, ra.download_url, ra.file_size_mb,
+               ra.assembly, ra.output_type, ra.download_status,
+               cl.cell_line_normalized as cell_line
+        FROM regulatory_annotations ra
+        JOIN cell_lines cl ON ra.cell_line_id = cl.cell_line_id
+    """, 'r.cell_line'),
+]
+
+# Sections export_metadata(parquet=true) writes as Parquet files, by row count
+# the bulk of the document
+_EXPORT_PARQUET_SECTIONS = ('experiments', 'ccre_annotations')
+
+# Content fingerprint of the exported tables: one plain scan of each, so any
+# inserted, deleted or edited row changes it. The parameter names the Parquet
+# sections, since those change the document's shape.
+_EXPORT_FINGERPRINT_SQL = """
+    SELECT hash((SELECT COALESCE(sum(hash(t)), 0) FROM cell_lines t),
+                (SELECT COALESCE(sum(hash(t)), 0) FROM chromatin_experiments t),
+                (SELECT COALESCE(sum(hash(t)), 0) FROM regulatory_annotations t),
+                ?)::VARCHAR
+"""
+_EXPORT_HEAD_RE = re.compile(rb'"(\w+)":("[^"]*"|\d+)')
+
+
+def _export_head(path, size=1024):
+    """Scalar fields ahead of the sections in an existing export, or {} if there is none."""
+    try:
+        with (gzip.open if path.suffix == '.gz' else open)(path, 'rb') as f:
+            head = f.read(size)
+    except OSError:
+        return {}
+    head = head.split(b'"cell_lines":', 1)[0]
+    return {k.decode(): orjson.loads(v) for k, v in _EXPORT_HEAD_RE.findall(head)}
+
+
+def _handle_export_metadata(params, manager):
+    """Export all metadata to a JSON file for training pipeline consumption.
+    Includes cell lines, replicates, treatments, assemblies, cCRE info, species.
+    With gzip=true the document is written gzip-compressed, as training_metadata.json.gz.
+    With parquet=true the experiments and cCRE sections go to Parquet files beside
+    it, and the document names those files instead of listing their rows."""
+    try:
+        compress = bool(params.get('gzip', False))
+        sidecars = _EXPORT_PARQUET_SECTIONS if params.get('parquet', False) else ()
+        out_path = _DATA_DIR / "metadata" / ("training_metadata.json.gz" if compress
+                                             else "training_metadata.json")
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        # Every file is written beside its target and renamed into place,
+        # the Parquet files before the document that points at them
+        outputs = [out_path.with_name(f'{key}.parquet') for key in sidecars] + [out_path]
+        tmp_paths = [path.with_name(path.name + '.tmp') for path in outputs]
+
+        # The whole document is built once, as a single row of list columns,
+        # in a temp table of a read-only cursor; DuckDB writes it as one JSON
+        # object, rendering timestamps itself, and the totals are the lengths
+        # of its lists
+        with db.read_only(manager.con) as cur:
+            # An export of the same data in the same shape is reused as it is
+            fingerprint = cur.execute(_EXPORT_FINGERPRINT_SQL, [','.join(sidecars)]).fetchone()[0]
+            head = _export_head(out_path)
+            if (head.get('fingerprint') == fingerprint
+                    and all(path.exists() for path in outputs[:-1])):
+                return {'ok': True, 'data': {
+                    'path': str(out_path),
+                    'size_bytes': out_path.stat().st_size,
+                    'parquet': [str(path) for path in outputs[:-1]],
+                    'cell_lines': head.get('total_cell_lines'),
+                    'experiments': head.get('total_experiments'),
+                    'ccre': head.get('total_ccre'),
+                    'cached': True,
+                }}
+
+            sections = ',\n'.join(
+                f"COALESCE((SELECT list(r ORDER BY {order}) FROM ({sql}) r), []) AS {key}"
+                for key, sql, order in _EXPORT_SECTIONS
+            )
+            cur.execute(f"CREATE TEMP TABLE export_doc AS SELECT {sections}")
+            for key, tmp_path in zip(sidecars, tmp_paths):
+                cur.execute(f"""
+                    COPY (SELECT unnest({key}, recursive := true) FROM export_doc)
+                    TO '{_sql_quote(tmp_path)}' (FORMAT PARQUET, COMPRESSION zstd)
+                """)
+            columns = ', '.join(
+                f"'{key}.parquet' AS {key}_parquet" if key in sidecars else key
+                for key, _, _ in _EXPORT_SECTIONS
+            )
+            cur.execute(f"""
+                COPY (
+                    SELECT strftime(current_localtimestamp(), '%Y-%m-%dT%H:%M:%S.%f') AS exported_at,
+                           '{fingerprint}' AS fingerprint,
+                           len(cell_lines) AS total_cell_lines,
+                           len(experiments) AS total_experiments,
+                           len(ccre_annotations) AS total_ccre,
+                           {columns}
+                    FROM export_doc
+                ) TO '{_sql_quote(tmp_paths[-1])}' (FORMAT JSON, COMPRESSION {'gzip' if compress else 'none'})
+            """)
+            n_cells, n_experiments, n_ccre = cur.execute("""
+                SELECT len(cell_lines), len(experiments), len(ccre_annotations) FROM export_doc
+            """).fetchone()
+        for tmp_path, path in zip(tmp_paths, outputs):
+            os.replace(tmp_path, path)
 
-    elif action == 'get_config':
-        """Read current .env config."""
-        env_path = Path(__file__).resolve().parent.parent.parent / '.env'
-        config = {}
-        if env_path.exists():
-            with open(env_path, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        k, v = line.split('=', 1)
-                        config[k.strip()] = v.strip()
         return {'ok': True, 'data': {
-            'config': config,
-            'path': str(env_path),
+            'path': str(out_path),
+            'size_bytes': out_path.stat().st_size,
+            'parquet': [str(path) for path in outputs[:-1]],
+            'cell_lines': n_cells,
+            'experiments': n_experiments,
+            'ccre': n_ccre,
+            'cached': False,
         }}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+# Action name -> handler(params, manager)
+_ACTIONS = {
+    'ping': _handle_ping,
+    'get_stats': _handle_get_stats,
+    'fetch_mcool': _handle_fetch_mcool,
+    'fetch_all_data': _handle_fetch_all_data,
+    'fetch_ccre': _handle_fetch_ccre,
+    'find_paired': _handle_find_paired,
+    'find_non_paired': _handle_find_non_paired,
+    'check_duplicates': _handle_check_duplicates,
+    'list_cell_lines': _handle_list_cell_lines,
+    'get_cell_line_details': _handle_get_cell_line_details,
+    'list_ml_ready': _handle_list_ml_ready,
+    'download_paired': _handle_download_paired,
+    'download_mcool_only': _handle_download_mcool_only,
+    'generate_report': _handle_generate_report,
+    'query': _handle_query,
+    'get_download_status': _handle_get_download_status,
+    'start_download_job': _handle_start_download_job,
+    'list_download_jobs': _handle_list_download_jobs,
+    'get_job_status': _handle_get_job_status,
+    'stop_download_job': _handle_stop_download_job,
+    'delete_download_job': _handle_delete_download_job,
+    'validate_datasets': _handle_validate_datasets,
+    'test_download': _handle_test_download,
+    'get_config': _handle_get_config,
+    'update_config': _handle_update_config,
+    'export_metadata': _handle_export_metadata,
+}
 
-    elif action == 'update_config':
-        """Update a config key in .env file."""
-        key = params.get('key', '')
-        value = params.get('value', '')
-        if not key:
-            return {'ok': False, 'error': 'key is required'}
-        env_path = Path(__file__).resolve().parent.parent.parent / '.env'
-        lines = []
-        found = False
-        if env_path.exists():
-            with open(env_path, 'r') as f:
-                lines = f.readlines()
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if stripped and not stripped.startswith('#') and '=' in stripped:
-                k = stripped.split('=', 1)[0].strip()
-                if k == key:
-                    lines[i] = f'{key}={value}\n'
-                    found = True
-                    break
-        if not found:
-            lines.append(f'\n{key}={value}\n')
-        with open(env_path, 'w') as f:
-            f.writelines(lines)
-        # Reload env
-        os.environ[key] = value
-        return {'ok': True, 'data': {'message': f'{key} updated', 'key': key, 'value': value}}
-
-    elif action == 'export_metadata':
-        """Export all metadata to a JSON file for training pipeline consumption.
-        Includes cell lines, replicates, treatments, assemblies, cCRE info, species."""
-        try:
-            data_dir = Path(os.getenv("DATA_DIR", "./data"))
-            out_path = data_dir / "metadata" / "training_metadata.json"
-            out_path.parent.mkdir(parents=True, exist_ok=True)
-
-            # Gather all metadata
-            cell_lines = manager.con.execute("""
-                SELECT cl.cell_line_id, cl.cell_line_normalized as cell_line,
-                       cl.tissue_type, cl.species, cl.genome_assembly,
-                       cl.biosample_type, cl.has_ccre, cl.has_mcool
-                FROM cell_lines cl ORDER BY cl.cell_line_normalized
-            """).fetchdf().to_dict(orient='records')
-
-            experiments = manager.con.execute("""
-                SELECT ce.accession, ce.cell_line_name, ce.download_url,
-                       ce.file_size_gb, ce.file_size_bytes, ce.download_status,
-                       ce.species, ce.genome_assembly, ce.treatment,
-                       ce.treatment_duration, ce.modification, ce.condition,
-                       ce.biosample_type, ce.study, ce.dataset_label,
-                       cl.cell_line_normalized
-                FROM chromatin_experiments ce
-                JOIN cell_lines cl ON ce.cell_line_id = cl.cell_line_id
-                ORDER BY cl.cell_line_normalized, ce.accession
-            """).fetchdf().to_dict(orient='records')
-
-            ccre = manager.con.execute("""
-                SELECT ra.accession, ra.download_url, ra.file_size_mb,
-                       ra.assembly, ra.output_type, ra.download_status,
-                       cl.cell_line_normalized as cell_line
-                FROM regulatory_annotations ra
-                JOIN cell_lines cl ON ra.cell_line_id = cl.cell_line_id
-                ORDER BY cl.cell_line_normalized
-            """).fetchdf().to_dict(orient='records')
-
-            metadata = {
-                'exported_at': __import__('datetime').datetime.now().isoformat(),
-                'total_cell_lines': len(cell_lines),
-                'total_experiments': len(experiments),
-                'total_ccre': len(ccre),
-                'cell_lines': cell_lines,
-                'experiments': experiments,
-                'ccre_annotations': ccre,
-            }
-
-            with open(out_path, 'w') as f:
-                json.dump(metadata, f, indent=2, default=str)
-
-            return {'ok': True, 'data': {
-                'path': str(out_path),
-                'cell_lines': len(cell_lines),
-                'experiments': len(experiments),
-                'ccre': len(ccre),
-            }}
-        except Exception as e:
-            return {'ok': False, 'error': str(e)}
 
-    else:
+def handle_action(action, params, manager):
+    """Route an action to the appropriate handler."""
+    handler = _ACTIONS.get(action)
+    if handler is None:
         return {'ok': False, 'error': f'Unknown action: {action}'}
+    return handler(params, manager)
 
 
 def main():
@@ -778,7 +1061,7 @@ def main():
         params = {}
         if len(sys.argv) > 2:
             try:
-                params = json.loads(sys.argv[2])
+                params = orjson.loads(sys.argv[2])
             except json.JSONDecodeError:
                 # Try key=value pairs
                 for arg in sys.argv[2:]:
@@ -788,27 +1071,24 @@ def main():
 
         try:
             result = handle_action(action, params, manager)
-            print(json.dumps(result, default=str))
+            _emit(sys.stdout, result)
         except Exception as e:
-            print(json.dumps({'ok': False, 'error': str(e), 'traceback': traceback.format_exc()}))
+            _emit(sys.stdout, {'ok': False, 'error': str(e), 'traceback': traceback.format_exc()})
         return
 
-    # Interactive IPC mode: read lines from stdin
-    for line in sys.stdin:
-        line = line.strip()
-        if not line:
-            continue
-
+    # Interactive IPC mode: read lines from stdin, answering each command
+    # as soon as its handler returns
+    for line in _stdin_commands():
         try:
-            cmd = json.loads(line)
+            cmd = orjson.loads(line)
             action = cmd.get('action', '')
             params = cmd.get('params', {})
             result = handle_action(action, params, manager)
-            print(json.dumps(result, default=str), flush=True)
         except json.JSONDecodeError as e:
-            print(json.dumps({'ok': False, 'error': f'Invalid JSON: {e}'}), flush=True)
+            result = {'ok': False, 'error': f'Invalid JSON: {e}'}
         except Exception as e:
-            print(json.dumps({'ok': False, 'error': str(e), 'traceback': traceback.format_exc()}), flush=True)
+            result = {'ok': False, 'error': str(e), 'traceback': traceback.format_exc()}
+        _emit(sys.stdout, result)
 
 
 if __name__ == '__main__':